@@ -13,6 +13,68 @@ from ..errors import CLEOperationError, CLEError
 l = logging.getLogger('cle.backends')
 
 
+class _SymbolList(sortedcontainers.SortedKeyList):
+    """
+    The sorted list of symbols of a backend.
+
+    Symbols and their owner reference each other, so while unpickling, the symbols in this list may not have been
+    restored yet. Instead of re-sorting the symbols (which would look at their addresses) the sorted state is pickled
+    as-is.
+
+    Every change counts up the version of the list, which is how the loader's :class:`cle.symbol_index.SymbolIndex`
+    notices which objects it is out of date for.
+    """
+
+    def __init__(self, iterable=None, key=None):
+        super(_SymbolList, self).__init__(iterable, key)
+        self.version = 0
+
+    def __reduce__(self):
+        return (type(self), (None, self.key), self.__dict__)
+
+    def _changed(self):
+        self.version += 1
+
+    def add(self, value):
+        super(_SymbolList, self).add(value)
+        self._changed()
+
+    def update(self, iterable):
+        super(_SymbolList, self).update(iterable)
+        self._changed()
+
+    def clear(self):
+        super(_SymbolList, self).clear()
+        self._changed()
+
+    def discard(self, value):
+        super(_SymbolList, self).discard(value)
+        self._changed()
+
+    def remove(self, value):
+        super(_SymbolList, self).remove(value)
+        self._changed()
+
+    def pop(self, index=-1):
+        value = super(_SymbolList, self).pop(index)
+        self._changed()
+        return value
+
+    def __delitem__(self, index):
+        super(_SymbolList, self).__delitem__(index)
+        self._changed()
+
+    def __iadd__(self, other):
+        super(_SymbolList, self).__iadd__(other)
+        self._changed()
+        return self
+
+    def __imul__(self, num):
+        super(_SymbolList, self).__imul__(num)
+        self._changed()
+        return self
+
+
 class Backend:
     """
     Main base class for CLE binary objects.
@@ -93,7 +155,7 @@ class Backend:
         self._segments = Regions() # List of segments
         self._sections = Regions() # List of sections
         self.sections_map = {}  # Mapping from section name to section
-        self.symbols = sortedcontainers.SortedKeyList(key=self._get_symbol_relative_addr)
+        self.symbols = _SymbolList(key=self._get_symbol_relative_addr)
         self.imports = {}
         self.resolved_imports = []
         self.relocs = []
@@ -345,7 +407,7 @@ from .pe import PE
 from .blob import Blob
 from .cgc import CGC, BackedCGC
 from .ihex import Hex
-from .macho import MachO
+from .macho import MachO, DyldSharedCache
 from .named_region import NamedRegion
 from .java.jar import Jar
 from .java.apk import Apk
@@ -6,16 +6,17 @@ import elftools
 from elftools.elf import elffile, sections
 from collections import OrderedDict, defaultdict
 
-from .symbol import ELFSymbol, Symbol, SymbolType
+from .symbol import ELFSymbol, Symbol, SymbolType, ST_BIND_NAMES, ST_TYPE_NAMES, ST_SHNDX_NAMES, ST_VISIBILITY_NAMES
 from .regions import ELFSection, ELFSegment
 from .hashtable import ELFHashTable, GNUHashTable
 from .metaelf import MetaELF, maybedecode
 from .. import register_backend
 from .relocation import get_relocation
-from .relocation.generic import MipsGlobalReloc, MipsLocalReloc
+from .relocation.generic import GenericRelativeReloc, MipsGlobalReloc, MipsLocalReloc
+from ..relocation import RelocationTable, is_batchable
 from ...patched_stream import PatchedStream
 from ...errors import CLEError, CLEInvalidBinaryError, CLECompatibilityError
-from ...utils import ALIGN_DOWN, ALIGN_UP, get_mmaped_data, stream_or_path
+from ...utils import ALIGN_DOWN, ALIGN_UP, get_mmaped_data, get_mmaped_backers, stream_or_path
 from ...address_translator import AT
 
 l = logging.getLogger('cle.elf')
@@ -28,6 +29,7 @@ class ELF(MetaELF):
     The main loader class for statically loading ELF executables. Uses the pyreadelf library where useful.
     """
     is_default = True  # Tell CLE to automatically consider using the ELF backend
+    _PARSED_ATTRS = ('reader', 'strtab', 'dynsym', 'hashtable')  # not pickled, see __getattr__
 
     def __init__(self, binary, addend=None, **kwargs):
         super(ELF, self).__init__(binary, **kwargs)
@@ -91,7 +93,7 @@ class ELF(MetaELF):
         self.imports = {}
         self.resolved_imports = []
 
-        self.relocs = []
+        self.relocs = RelocationTable(self)
         self.jmprel = OrderedDict()
 
         self._entry = self.reader.header.e_entry
@@ -371,22 +373,33 @@ class ELF(MetaELF):
         mapoff = ALIGN_DOWN(ph.p_offset, self.loader.page_size)
 
         # see https://code.woboq.org/userspace/glibc/elf/dl-map-segments.h.html#88
-        data = get_mmaped_data(seg.stream, mapoff, mapend - mapstart, self.loader.page_size)
-        if not data:
-            l.warning("Segment %s is empty at %#08x!", seg.header.p_type, mapstart)
-            return
         if allocend > dataend:
-            zero = dataend
-            zeropage = (zero + self.loader.page_size - 1) & ~(self.loader.page_size - 1)
+            maplen = dataend - mapstart
+            totallen = ALIGN_UP(allocend, self.loader.page_size) - mapstart # mmap maps to the next page boundary
+        else:
+            maplen = totallen = mapend - mapstart
 
-            if zeropage > zero:
-                data = data[:zero - mapstart].ljust(zeropage - mapstart, b'\0')
+        # map the file copy-on-write if we can, so that only the pages which are actually touched get read
+        backers = get_mmaped_backers(seg.stream, mapoff, maplen, totallen)
+        if backers is None:
+            data = get_mmaped_data(seg.stream, mapoff, mapend - mapstart, self.loader.page_size)
+            if allocend > dataend:
+                zero = dataend
+                zeropage = (zero + self.loader.page_size - 1) & ~(self.loader.page_size - 1)
 
-            zeroend = ALIGN_UP(allocend, self.loader.page_size) # mmap maps to the next page boundary
-            if zeroend > zeropage:
-                data = data.ljust(zeroend - mapstart, b'\0')
+                if zeropage > zero:
+                    data = data[:zero - mapstart].ljust(zeropage - mapstart, b'\0')
 
-        self.memory.add_backer(AT.from_lva(mapstart, self).to_rva(), data)
+                zeroend = ALIGN_UP(allocend, self.loader.page_size)
+                if zeroend > zeropage:
+                    data = data.ljust(zeroend - mapstart, b'\0')
+            backers = [(0, data)] if data else []
+
+        if not backers:
+            l.warning("Segment %s is empty at %#08x!", seg.header.p_type, mapstart)
+            return
+        for offset, data in backers:
+            self.memory.add_backer(AT.from_lva(mapstart, self).to_rva() + offset, data)
 
     def _make_reloc(self, readelf_reloc, symbol, dest_section=None):
         addend = readelf_reloc.entry.r_addend if readelf_reloc.is_RELA() else None
@@ -400,6 +413,28 @@ class ELF(MetaELF):
 
         return RelocClass(self, symbol, address, addend)
 
+    def _add_reloc_row(self, readelf_reloc, symbol, dest_section=None):
+        """
+        Add a relative relocation against the nameless null symbol as a row of the relocation table, instead of making
+        a Relocation of it. See :class:`cle.backends.relocation.RelocationTable`.
+
+        :return: Whether it was added.
+        """
+        RelocClass = get_relocation(self.arch.name, readelf_reloc.entry.r_info_type)
+        if (RelocClass is None or symbol.name or symbol.is_import or symbol.type != SymbolType.TYPE_NONE or
+                not issubclass(RelocClass, GenericRelativeReloc) or not is_batchable(RelocClass)):
+            return False
+
+        address = AT.from_lva(readelf_reloc.entry.r_offset, self).to_rva()
+        if dest_section is not None:
+            address += dest_section.remap_offset
+
+        if readelf_reloc.is_RELA():
+            self.relocs.append_row(RelocClass, symbol, address, readelf_reloc.entry.r_addend, True)
+        else:
+            self.relocs.append_row(RelocClass, symbol, address, self.memory.unpack_word(address), False)
+        return True
+
     #
     # Private Methods... really. Calling these out of context
     # will probably break things. Caveat emptor.
@@ -417,10 +452,8 @@ class ELF(MetaELF):
         else:
             state['binary_stream'] = None
 
-        state['reader'] = None
-        state['strtab'] = None
-        state['dynsym'] = None
-        state['hashtable'] = None
+        for name in self._PARSED_ATTRS:
+            state.pop(name, None)
 
         return state
 
@@ -432,7 +465,18 @@ class ELF(MetaELF):
         else:
             self.binary_stream.stream = open(self.binary, 'rb')
 
+    def __getattr__(self, name):
+        # an unpickled object only parses its file with pyelftools once something needs it
+        if name not in self._PARSED_ATTRS or 'binary_stream' not in self.__dict__:
+            raise AttributeError(name)
+        self._parse_reader()
+        return self.__dict__[name]
+
+    def _parse_reader(self):
         self.reader = elffile.ELFFile(self.binary_stream)
+        self.strtab = None
+        self.dynsym = None
+        self.hashtable = None
         if self._dynamic and 'DT_STRTAB' in self._dynamic:
             self.strtab = next(x for x in self.reader.iter_segments() if x.header.p_type == 'PT_DYNAMIC')._get_stringtable()
             if 'DT_SYMTAB' in self._dynamic and 'DT_SYMENT' in self._dynamic:
@@ -687,6 +731,8 @@ class ELF(MetaELF):
                 symbol = self.get_symbol(readelf_reloc.entry.r_info_sym, symtab)
                 if symbol is None:
                     continue
+                if self._add_reloc_row(readelf_reloc, symbol, dest_sec):
+                    continue
                 reloc = self._make_reloc(readelf_reloc, symbol, dest_sec)
                 if reloc is not None:
                     relocs.append(reloc)
@@ -741,8 +787,57 @@ class ELF(MetaELF):
                         self.memory.add_backer(AT.from_lva(section.vaddr, self).to_rva(), sec_readelf.data())
 
     def __register_section_symbols(self, sec_re):
-        for sym_re in sec_re.iter_symbols():
-            self.symbols.add(self.get_symbol(sym_re))
+        symbols = self.__decode_section_symbols(sec_re)
+        if symbols is None:
+            symbols = [self.get_symbol(sym_re) for sym_re in sec_re.iter_symbols()]
+        self.symbols.update(symbols)
+
+    def __decode_section_symbols(self, sec_re):
+        """
+        Decodes all the entries of a symbol table section at once, instead of having pyelftools parse them one by one.
+        The symbols are the same get_symbol would return for them.
+
+        :return: The list of symbols, or None if the table does not have the standard layout.
+        """
+        if self.reader.elfclass == 32:
+            fmt, fields = 'IIIBBH', (0, 1, 2, 3, 4, 5)
+        else:
+            # Elf64_Sym has the value and size last
+            fmt, fields = 'IBBHQQ', (0, 4, 5, 1, 2, 3)
+        sym_struct = struct.Struct(('<' if self.reader.little_endian else '>') + fmt)
+        if sec_re['sh_entsize'] != sym_struct.size:
+            return None
+
+        size = sec_re.num_symbols() * sym_struct.size
+        sec_re.stream.seek(sec_re['sh_offset'])
+        data = sec_re.stream.read(size)
+        if len(data) != size:
+            return None
+        stringtable = sec_re.stringtable
+        strtab = stringtable.data()
+
+        symbols = []
+        for entry in sym_struct.iter_unpack(data):
+            st_name, st_value, st_size, st_info, st_other, st_shndx = [entry[i] for i in fields]
+            binding = ST_BIND_NAMES.get(st_info >> 4, st_info >> 4)
+            subtype_num = st_info & 0xf
+            sec_ndx = ST_SHNDX_NAMES.get(st_shndx, st_shndx)
+
+            cache_key = (st_name, st_value, st_size, binding, ST_TYPE_NAMES.get(subtype_num, subtype_num), sec_ndx)
+            symbol = self._symbol_cache.get(cache_key, None)
+            if symbol is None:
+                end = strtab.find(b'\0', st_name)
+                if end == -1:
+                    # the name runs past the end of the string table, let pyelftools deal with it
+                    name = stringtable.get_string(st_name)
+                else:
+                    name = strtab[st_name:end].decode('utf-8', errors='replace')
+                symbol = ELFSymbol.from_fields(self, name, st_value, st_size, binding, subtype_num,
+                                               ST_VISIBILITY_NAMES.get(st_other & 0x7, st_other & 0x7), sec_ndx)
+                self._symbol_cache[cache_key] = symbol
+                self._cache_symbol_name(symbol)
+            symbols.append(symbol)
+        return symbols
 
     def __relocate_mips(self):
         if 'DT_MIPS_BASE_ADDRESS' not in self._dynamic:
@@ -1,6 +1,89 @@
 import struct
+import sys
+from array import array
+from functools import lru_cache
 
-class ELFHashTable(object):
+from ...errors import CLEInvalidBinaryError
+
+
+def _read_words(stream, count, typecode, fmt):
+    """
+    Reads an array of count words from stream, in the byte order given by the struct format prefix fmt.
+    """
+    words = array(typecode)
+    data = stream.read(count * words.itemsize)
+    words.frombytes(data[:len(data) - len(data) % words.itemsize])
+    if (fmt == '<') != (sys.byteorder == 'little'):
+        words.byteswap()
+    return words
+
+
+class _HashTableBase(object):
+    """
+    What both kinds of hash tables share: looking up the names of the symbols in the symbol table.
+
+    The string table offsets of the names of the first nsyms symbols are read once, and each name is read at most once.
+    """
+    def __init__(self, symtab, fmt):
+        self.symtab = symtab
+        self._fmt = fmt
+        self._st_names = None
+        self._names = {}
+
+    def _load_st_names(self, nsyms):
+        # st_name is the first word of an Elf32_Sym as well as of an Elf64_Sym
+        entsize = self.symtab['sh_entsize']
+        if entsize % 4 != 0:
+            self._st_names = array('I')
+            return
+        self.symtab.stream.seek(self.symtab['sh_offset'])
+        self._st_names = _read_words(self.symtab.stream, nsyms * entsize // 4, 'I', self._fmt)[::entsize // 4]
+
+    def _name(self, n):
+        try:
+            return self._names[n]
+        except KeyError:
+            pass
+        if n < len(self._st_names):
+            name = self.symtab.stringtable.get_string(self._st_names[n])
+        else:
+            name = self.symtab.get_symbol(n).name
+        self._names[n] = name
+        return name
+
+    def _find(self, k):
+        """
+        :return: The index of the symbol named k in the symbol table, or None if there is none.
+        """
+        raise NotImplementedError()
+
+    def get(self, k):
+        """
+        Perform a lookup. Returns a pyelftools Symbol object, or None if there is no match.
+
+        :param k:   The string to look up.
+        """
+        n = self._find(k)
+        return None if n is None else self.symtab.get_symbol(n)
+
+    def get_many(self, names):
+        """
+        Perform a lookup of several names at once.
+
+        :param names:   The strings to look up.
+        :return:        A dict mapping each name which matched to its pyelftools Symbol object.
+        """
+        result = {}
+        for k in names:
+            if k in result:
+                continue
+            n = self._find(k)
+            if n is not None:
+                result[k] = self.symtab.get_symbol(n)
+        return result
+
+
+class ELFHashTable(_HashTableBase):
     """
     Functions to do lookup from a HASH section of an ELF file.
 
@@ -13,32 +96,28 @@ class ELFHashTable(object):
         :param offset:  The offset in the object where the table starts.
         :param arch:    The ArchInfo object for the ELF file.
         """
-        self.symtab = symtab
         fmt = '<' if arch.memory_endness == 'Iend_LE' else '>'
+        super(ELFHashTable, self).__init__(symtab, fmt)
         stream.seek(offset)
         self.nbuckets, self.nchains = struct.unpack(fmt + 'II', stream.read(8))
-        self.buckets = struct.unpack(fmt + 'I'*self.nbuckets, stream.read(4*self.nbuckets))
-        self.chains = struct.unpack(fmt + 'I'*self.nchains, stream.read(4*self.nchains))
-
-    def get(self, k):
-        """
-        Perform a lookup. Returns a pyelftools Symbol object, or None if there is no match.
+        self.buckets = _read_words(stream, self.nbuckets, 'I', fmt)
+        self.chains = _read_words(stream, self.nchains, 'I', fmt)
+        # there is a chain entry for every symbol
+        self._load_st_names(self.nchains)
 
-        :param k:   The string to look up.
-        """
+    def _find(self, k):
         if self.nbuckets == 0:
             return None
-        hval = self.elf_hash(k) % self.nbuckets
-        symndx = self.buckets[hval]
+        symndx = self.buckets[self.elf_hash(k) % self.nbuckets]
         while symndx != 0:
-            sym = self.symtab.get_symbol(symndx)
-            if sym.name == k:
-                return sym
+            if self._name(symndx) == k:
+                return symndx
             symndx = self.chains[symndx]
         return None
 
     # from http://www.partow.net/programming/hashfunctions/
     @staticmethod
+    @lru_cache(maxsize=0x10000)
     def elf_hash(key):
         h = 0
         x = 0
@@ -50,7 +129,8 @@ class ELFHashTable(object):
             h &= ~x
         return h
 
-class GNUHashTable(object):
+
+class GNUHashTable(_HashTableBase):
     """
     Functions to do lookup from a GNU_HASH section of an ELF file.
 
@@ -63,21 +143,44 @@ class GNUHashTable(object):
         :param offset:       The offset in the object where the table starts.
         :param arch:         The ArchInfo object for the ELF file.
         """
-        self.symtab = symtab
         fmt = '<' if arch.memory_endness == 'Iend_LE' else '>'
+        super(GNUHashTable, self).__init__(symtab, fmt)
         self.c = arch.bits
-        fmtsz = 'I' if self.c == 32 else 'Q'
 
         stream.seek(offset)
         data = stream.read(16)
         if len(data) != 16:
-            import ipdb; ipdb.set_trace()
+            raise CLEInvalidBinaryError("Truncated GNU hash table")
         self.nbuckets, self.symndx, self.maskwords, self.shift2 = struct.unpack(fmt + 'IIII', data)
 
-        self.bloom = struct.unpack(fmt + fmtsz*self.maskwords, stream.read(self.c*self.maskwords//8))
-        self.buckets = struct.unpack(fmt + 'I'*self.nbuckets, stream.read(4*self.nbuckets))
+        self.bloom = _read_words(stream, self.maskwords, 'I' if self.c == 32 else 'Q', fmt)
+        self.buckets = _read_words(stream, self.nbuckets, 'I', fmt)
         self.hash_ptr = stream.tell()
         self.stream = stream
+        self.chains = self._load_chains()
+        self._load_st_names(self.symndx + len(self.chains))
+
+    def _load_chains(self):
+        """
+        Reads the hash values of the symbols from symndx on. Their number is not stored anywhere, they end with the end of
+        the chain of the highest symbol a bucket starts at.
+        """
+        last = max(self.buckets) if self.buckets else 0
+        if last < self.symndx:
+            return array('I')
+
+        self.stream.seek(self.hash_ptr)
+        chains = _read_words(self.stream, last - self.symndx + 1, 'I', self._fmt)
+        while chains and chains[-1] & 1 == 0:
+            more = _read_words(self.stream, 0x40, 'I', self._fmt)
+            if not more:
+                break
+            for i, word in enumerate(more):
+                if word & 1 == 1:
+                    del more[i + 1:]
+                    break
+            chains.extend(more)
+        return chains
 
     def _matches_bloom(self, H1):
         C = self.c
@@ -86,29 +189,26 @@ class GNUHashTable(object):
         BITMASK = (1 << (H1 % C)) | (1 << (H2 % C))
         return (self.bloom[N] & BITMASK) == BITMASK
 
-    def get(self, k):
-        """
-        Perform a lookup. Returns a pyelftools Symbol object, or None if there is no match.
-
-        :param k:        The string to look up
-        """
+    def _find(self, k):
         h = self.gnu_hash(k)
         if not self._matches_bloom(h):
             return None
         n = self.buckets[h % self.nbuckets]
         if n == 0:
             return None
-        while True:
-            sym = self.symtab.get_symbol(n)
-            if sym.name == k:
-                return sym
-            self.stream.seek(self.hash_ptr + 4*(n-self.symndx))
-            if struct.unpack('I', self.stream.read(4))[0] & 1 == 1:
+        chains = self.chains
+        while n - self.symndx < len(chains):
+            chain_hash = chains[n - self.symndx]
+            # the lowest bit of a hash value marks the end of a chain
+            if (chain_hash | 1) == (h | 1) and self._name(n) == k:
+                return n
+            if chain_hash & 1 == 1:
                 break
             n += 1
         return None
 
     @staticmethod
+    @lru_cache(maxsize=0x10000)
     def gnu_hash(key):
         h = 5381
         for c in key:
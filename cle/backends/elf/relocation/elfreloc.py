@@ -15,6 +15,12 @@ class ELFReloc(Relocation):
             self.is_rela = False
             self._addend = self.owner.memory.unpack_word(self.relative_addr)
 
+    @classmethod
+    def from_row(cls, owner, symbol, relative_addr, addend, is_rela):
+        reloc = cls(owner, symbol, relative_addr, addend)
+        reloc.is_rela = is_rela
+        return reloc
+
     @property
     def addend(self):
         if self._addend is None:
@@ -5,6 +5,7 @@ from ....address_translator import AT
 from ....errors import CLEOperationError
 from ... import SymbolType
 from .elfreloc import ELFReloc
+from ...relocation import is_batchable
 
 l = logging.getLogger('cle.backends.elf.relocation.generic')
 
@@ -63,18 +64,24 @@ class GenericIRelativeReloc(ELFReloc):
 
 
 class GenericAbsoluteAddendReloc(ELFReloc):
+    batchable = True
+
     @property
     def value(self):
         return self.resolvedby.rebased_addr + self.addend
 
 
 class GenericPCRelativeAddendReloc(ELFReloc):
+    batchable = True
+
     @property
     def value(self):
         return self.resolvedby.rebased_addr + self.addend - self.rebased_addr
 
 
 class GenericJumpslotReloc(ELFReloc):
+    batchable = True
+
     @property
     def value(self):
         if self.is_rela:
@@ -84,6 +91,8 @@ class GenericJumpslotReloc(ELFReloc):
 
 
 class GenericRelativeReloc(ELFReloc):
+    batchable = True
+
     @property
     def value(self):
         if self.resolvedby is not None:
@@ -100,8 +109,40 @@ class GenericRelativeReloc(ELFReloc):
             thumb=thumb
         )
 
+    @classmethod
+    def relocate_rows(cls, table, indices, solist):
+        if not is_batchable(cls):
+            return super(GenericRelativeReloc, cls).relocate_rows(table, indices, solist)
+
+        # rows are only made of relocations whose symbol has no type, see ELF._make_reloc, which resolve to nothing
+        # and whose value is the addend rebased
+        owner = table.owner
+        addrs = []
+        values = []
+        resolved = []  # [symbol, number of consecutive rows]
+        for i in indices:
+            symbol, relative_addr, addend = table.row(i)
+            addrs.append(relative_addr)
+            values.append(owner.mapped_base + addend)
+            table.set_resolved(i)
+            if resolved and resolved[-1][0] is symbol:
+                resolved[-1][1] += 1
+            else:
+                resolved.append([symbol, 1])
+
+        owner.memory.pack_words(addrs, values)
+        # what resolving each relocation would do to its symbol
+        for symbol, count in resolved:
+            if symbol is None:
+                continue
+            symbol.resolved = True
+            symbol.resolvedby = None
+            symbol.owner.resolved_imports.extend([symbol] * count)
+
 
 class GenericAbsoluteReloc(ELFReloc):
+    batchable = True
+
     @property
     def value(self):
         return self.resolvedby.rebased_addr
@@ -109,10 +150,8 @@ class GenericAbsoluteReloc(ELFReloc):
 
 class GenericCopyReloc(ELFReloc):
     def relocate(self, solist, bypass_compatibility=False):
-        try:
-            solist.remove(self.owner)
-        except ValueError:
-            pass
+        # the scope may be shared with other relocations, so it is not changed
+        solist = [so for so in solist if so is not self.owner]
 
         if not self.resolve_symbol(solist, bypass_compatibility):
             return False
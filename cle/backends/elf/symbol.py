@@ -1,4 +1,4 @@
-from elftools.elf.enums import ENUM_ST_INFO_TYPE
+from elftools.elf.enums import ENUM_ST_INFO_BIND, ENUM_ST_INFO_TYPE, ENUM_ST_SHNDX, ENUM_ST_VISIBILITY
 
 from ..symbol import Symbol, SymbolType
 from ...address_translator import AT
@@ -9,6 +9,49 @@ def maybedecode(string):
     return string if type(string) is str else string.decode()
 
 
+def _enum_names(enum):
+    return dict((value, name) for name, value in enum.items() if name != '_default_')
+
+
+# value => name of the fields of a raw Elf_Sym, as pyelftools decodes them. Unknown values stay numbers.
+ST_BIND_NAMES = _enum_names(ENUM_ST_INFO_BIND)
+ST_TYPE_NAMES = _enum_names(ENUM_ST_INFO_TYPE)
+ST_SHNDX_NAMES = _enum_names(ENUM_ST_SHNDX)
+ST_VISIBILITY_NAMES = _enum_names(ENUM_ST_VISIBILITY)
+
+# (st_info type, arch name, whether the os is a UNIX) => (ELFSymbolType or None, SymbolType), see _classify
+_type_table = {}
+
+
+def _classify(subtype_num, arch_name, is_unix):
+    """
+    Finds the ELFSymbolType of a symbol type number, preferring the arch specific one over the GNU one over the generic
+    one. As this has to try them in turn, the results are kept in a table.
+    """
+    key = (subtype_num, arch_name, is_unix)
+    try:
+        return _type_table[key]
+    except KeyError:
+        pass
+
+    arch_list = [arch_name, None]
+    if is_unix:
+        arch_list.insert(1, 'gnu')
+    for arch in arch_list:
+        try:
+            subtype = ELFSymbolType((subtype_num, arch))
+        except ValueError:
+            pass
+        else:
+            result = (subtype, subtype.to_base_type())
+            break
+    else:
+        result = (None, SymbolType.TYPE_OTHER)
+
+    _type_table[key] = result
+    return result
+
+
 class ELFSymbol(Symbol):
     """
     Represents a symbol for the ELF format.
@@ -18,36 +61,41 @@ class ELFSymbol(Symbol):
     :ivar _subtype:         The ELFSymbolType of this symbol
     """
     def __init__(self, owner, symb):
-        subtype_num = ENUM_ST_INFO_TYPE.get(symb.entry.st_info.type, symb.entry.st_info.type)
-        arch_list = [owner.arch.name, None]
-        if 'UNIX' in owner.os:
-            arch_list.insert(1, 'gnu')
-        for arch in arch_list:
-            try:
-                self._subtype = ELFSymbolType((subtype_num, arch))
-            except ValueError:
-                pass
-            else:
-                self._type = self._subtype.to_base_type()
-                break
-        else:
-            self._subtype = None
-            self._type = SymbolType.TYPE_OTHER
+        entry = symb.entry
+        self._init_fields(owner, maybedecode(symb.name), entry.st_value, entry.st_size, entry.st_info.bind,
+                          ENUM_ST_INFO_TYPE.get(entry.st_info.type, entry.st_info.type),
+                          entry['st_other']['visibility'], entry.st_shndx)
+
+    @classmethod
+    def from_fields(cls, owner, name, value, size, binding, subtype_num, visibility, sec_ndx):
+        """
+        Creates a symbol from the fields of a symbol table entry, decoded like pyelftools does but without needing a
+        pyelftools Symbol.
+
+        :param binding:     The binding, as an ELF enum string
+        :param subtype_num: The number of the symbol type
+        :param visibility:  The visibility, as an ELF enum string
+        :param sec_ndx:     The section index, or an ELF enum string for the special ones
+        """
+        symbol = cls.__new__(cls)
+        symbol._init_fields(owner, name, value, size, binding, subtype_num, visibility, sec_ndx)
+        return symbol
 
-        sec_ndx, value = symb.entry.st_shndx, symb.entry.st_value
+    def _init_fields(self, owner, name, value, size, binding, subtype_num, visibility, sec_ndx):
+        self._subtype, self._type = _classify(subtype_num, owner.arch.name, 'UNIX' in owner.os)
 
         # A relocatable object's symbol's value is relative to its section's addr.
         if owner.is_relocatable and isinstance(sec_ndx, int):
             value += owner.sections[sec_ndx].remap_offset
 
         super(ELFSymbol, self).__init__(owner,
-                                        maybedecode(symb.name),
+                                        name,
                                         AT.from_lva(value, owner).to_rva(),
-                                        symb.entry.st_size,
+                                        size,
                                         self.type)
 
-        self.binding = symb.entry.st_info.bind
-        self.is_hidden = symb.entry['st_other']['visibility'] == 'STV_HIDDEN'
+        self.binding = binding
+        self.is_hidden = visibility == 'STV_HIDDEN'
         self.section = sec_ndx if type(sec_ndx) is not str else None
         self.is_static = self._type == SymbolType.TYPE_SECTION or sec_ndx == 'SHN_ABS'
         self.is_common = sec_ndx == 'SHN_COMMON'
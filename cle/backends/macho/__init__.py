@@ -1 +1,2 @@
 from .macho import MachO
+from .dyld_cache import DyldSharedCache, DyldCacheImage
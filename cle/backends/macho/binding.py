@@ -2,13 +2,15 @@
 # This file is part of Mach-O Loader for CLE.
 # Contributed December 2016 by Fraunhofer SIT (https://www.sit.fraunhofer.de/en/) and updated in September 2019.
 
-import struct
+import re
+from array import array
 
 from .symbol import BindingSymbol
+from .chained_fixups import apply_chained_fixups, NO_IMPORT, BIND_SPECIAL_DYLIB_WEAK_LOOKUP
 
 from ...errors import CLEInvalidBinaryError
-from ...address_translator import AT
 from macholib import mach_o
+from archinfo import Endness
 
 import logging
 l = logging.getLogger('cle.backends.macho.binding')
@@ -20,6 +22,9 @@ else:
 
 def read_uleb(blob, offset):
     """Reads a number encoded as uleb128"""
+    if offset < len(blob) and blob[offset] < 0x80:
+        return blob[offset], 1  # fast path for the common single byte case
+
     result = 0
     shift = 0
     index = offset
@@ -53,37 +58,178 @@ def read_sleb(blob, offset):
 
     return result, index - offset
 
-class BindingState(object):
-    """State object"""
-
-    def __init__(self, is_64):
-        self.index = 0
-        self.done = False
-        self.lib_ord = 0
-        self.sym_name = ""
-        self.sym_flags = 0
-        self.binding_type = 0
-        self.addend = 0
-        self.segment_index = 0
-        self.address = 0
-        self.seg_end_address = 0  # TODO: no rebasing support
-        self.wraparound = 2 ** 64  # address is expected to properly overflow and address is uintptr_t (unsigned long according to _uintptr_t.h)
-        self.sizeof_intptr_t = 8 if is_64 else 4  # experimentally determined
-        self.bind_handler = None  # function(state,binary) => None
-
-    def add_address_ov(self, address, addend):
-        """ this is a very ugly klugde. It is needed because dyld relies on overflow
-            semantics and represents several negative offsets through BIG ulebs"""
-        tmp = address + addend
-        if tmp > self.wraparound:
-            tmp -= self.wraparound
-        self.address = tmp
-
-    def check_address_bounds(self):
-        if self.address >= self.seg_end_address:
-            l.error("index %d: address >= seg_end_address (%#x >= %#x)", self.index, self.address, self.seg_end_address)
+# a leb128 number is any number of bytes with the high bit set followed by one without
+_leb128_re = re.compile(b'[\x80-\xff]*[\x00-\x7f]')
+
+def _leb128_value(encoded):
+    result = 0
+    for i, b in enumerate(encoded):
+        result |= (b & 0x7f) << (7 * i)
+    return result
+
+def read_uleb_array(blob, offset=0, end=None):
+    """
+    Reads all numbers encoded as uleb128 from blob[offset:end]. A truncated number at the end is ignored.
+    :return: array('Q') of the numbers
+    """
+    if end is None:
+        end = len(blob)
+    return array('Q', [encoded[0] if len(encoded) == 1 else _leb128_value(encoded)
+                       for encoded in _leb128_re.findall(blob, offset, end)])
+
+def read_sleb_array(blob, offset=0, end=None):
+    """
+    Reads all numbers encoded as sleb128 from blob[offset:end]. A truncated number at the end is ignored.
+    :return: array('q') of the numbers
+    """
+    if end is None:
+        end = len(blob)
+    result = array('q')
+    for encoded in _leb128_re.findall(blob, offset, end):
+        value = _leb128_value(encoded)
+        if encoded[-1] & 0x40:
+            # two's complement
+            value -= 1 << (7 * len(encoded))
+        result.append(value)
+    return result
+
+class BindTable(object):
+    """
+    The bind records of a binding blob as produced by decode_bind_blob. Record i binds the pointer at addresses[i]
+    to the symbol names[name_indices[i]] from library ordinals[i], using binding type types[i] and addends[i].
+    """
+
+    def __init__(self):
+        self.addresses = array('Q')
+        self.ordinals = array('q')
+        self.name_indices = array('L')
+        self.types = array('B')
+        self.addends = array('q')
+        self.names = []  # each distinct symbol name, in order of appearance
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def __iter__(self):
+        """Yields (address, library ordinal, symbol name, binding type, addend) for each record"""
+        names = self.names
+        for address, lib_ord, name_index, binding_type, addend in zip(
+                self.addresses, self.ordinals, self.name_indices, self.types, self.addends):
+            yield address, lib_ord, names[name_index], binding_type, addend
+
+def decode_bind_blob(blob, segments, is_64, lazy=False):
+    """
+    Decodes the binding opcodes in blob into a BindTable in a single pass, without binding anything.
+
+    Normal and weak binding blobs are one stream of opcodes ending with BIND_OPCODE_DONE. A lazy binding blob is a
+    sequence of such streams, each binding one pointer and starting out with a fresh state.
+
+    :param blob: blob of binding opcodes
+    :param segments: the segments of the binary, indexed by the segment numbers in the blob
+    :param is_64: whether pointers are 64 bits wide
+    :param lazy: whether blob is a lazy binding blob
+    :return: BindTable
+    """
+    table = BindTable()
+    name_indices = {}
+    ptr_size = 8 if is_64 else 4
+    mask = 2 ** 64 - 1  # dyld relies on addresses to overflow and represents negative offsets through big ulebs
+
+    def uleb():
+        nonlocal index
+        result = 0
+        shift = 0
+        while True:
+            b = blob[index]
+            index += 1
+            result |= (b & 0x7f) << shift
+            shift += 7
+            if b & 0x80 == 0:
+                return result
+
+    def check_bounds(address, opcode_index):
+        if address >= seg_end_address:
+            l.error("index %d: address >= seg_end_address (%#x >= %#x)", opcode_index, address, seg_end_address)
             raise CLEInvalidBinaryError()
 
+    # lazy bindings do not set a type, they are always pointers
+    initial_type = mach_o.BIND_TYPE_POINTER if lazy else 0
+    lib_ord, binding_type, addend, address, name_index = 0, initial_type, 0, 0, -1
+    seg_end_address = segments[0].vaddr + segments[0].memsize
+    index = 0
+    end = len(blob)
+    while index < end:
+        opcode_index = index
+        opcode = blob[index] & mach_o.BIND_OPCODE_MASK
+        immediate = blob[index] & mach_o.BIND_IMMEDIATE_MASK
+        index += 1
+
+        if opcode == mach_o.BIND_OPCODE_DONE:
+            if not lazy:
+                break
+            # the next lazy binding starts out fresh
+            lib_ord, binding_type, addend, address, name_index = 0, initial_type, 0, 0, -1
+        elif opcode == mach_o.BIND_OPCODE_SET_DYLIB_ORDINAL_IMM:
+            lib_ord = immediate
+        elif opcode == mach_o.BIND_OPCODE_SET_DYLIB_ORDINAL_ULEB:
+            lib_ord = uleb()
+        elif opcode == mach_o.BIND_OPCODE_SET_DYLIB_SPECIAL_IMM:
+            lib_ord = (immediate | mach_o.BIND_OPCODE_MASK) - 256 if immediate else 0
+        elif opcode == mach_o.BIND_OPCODE_SET_SYMBOL_TRAILING_FLAGS_IMM:
+            name_end = blob.index(b'\0', index)
+            # names are UTF-8 by convention only, a name that is not must not fail the whole table
+            name = blob[index:name_end].decode('utf-8', errors='replace')
+            index = name_end + 1
+            name_index = name_indices.get(name)
+            if name_index is None:
+                name_index = name_indices[name] = len(table.names)
+                table.names.append(name)
+        elif opcode == mach_o.BIND_OPCODE_SET_TYPE_IMM:
+            binding_type = immediate
+        elif opcode == mach_o.BIND_OPCODE_SET_ADDEND_SLEB:
+            addend, size = read_sleb(blob, index)
+            index += size
+        elif opcode == mach_o.BIND_OPCODE_SET_SEGMENT_AND_OFFSET_ULEB:
+            seg = segments[immediate]
+            address = (seg.vaddr + uleb()) & mask
+            seg_end_address = seg.vaddr + seg.memsize
+        elif opcode == mach_o.BIND_OPCODE_ADD_ADDR_ULEB:
+            address = (address + uleb()) & mask
+        elif mach_o.BIND_OPCODE_DO_BIND <= opcode <= mach_o.BIND_OPCODE_DO_BIND_ULEB_TIMES_SKIPPING_ULEB:
+            if name_index < 0:
+                l.error("index %d: binding without a symbol name", opcode_index)
+                raise CLEInvalidBinaryError()
+
+            if opcode == mach_o.BIND_OPCODE_DO_BIND_ULEB_TIMES_SKIPPING_ULEB:
+                count = uleb()
+                stride = uleb() + ptr_size
+            else:
+                count = 1
+                if opcode == mach_o.BIND_OPCODE_DO_BIND_ADD_ADDR_ULEB:
+                    stride = uleb() + ptr_size
+                elif opcode == mach_o.BIND_OPCODE_DO_BIND_ADD_ADDR_IMM_SCALED:
+                    stride = immediate * ptr_size + ptr_size
+                else:
+                    stride = ptr_size
+
+            if count == 0:
+                continue
+            # a lazy binding binds exactly one pointer, which is not checked against its segment by dyld either
+            if not lazy:
+                # the addresses only grow, and one that wraps around is out of bounds anyway
+                check_bounds(address + (count - 1) * stride, opcode_index)
+
+            table.addresses.extend(range(address, address + count * stride, stride))
+            table.ordinals.extend([lib_ord] * count)
+            table.name_indices.extend([name_index] * count)
+            table.types.extend([binding_type] * count)
+            table.addends.extend([addend] * count)
+            address = (address + count * stride) & mask
+        else:
+            l.error("Invalid opcode for current binding: %#x", opcode)
+
+    return table
+
 class BindingHelper(object):
     """Factors out binding logic from MachO.
     Intended to work in close conjunction with MachO not for standalone use"""
@@ -92,287 +238,157 @@ class BindingHelper(object):
         self.binary = binary
 
     def do_normal_bind(self, blob):
-        """Performs non-lazy, non-weak bindings
+        """Performs non-lazy, non-weak bindings. The segments of the binary must not be rebased yet.
         :param blob: Blob containing binding opcodes"""
 
         if blob is None:
             return  # skip
 
         l.debug("Binding non-lazy, non-weak symbols")
-        s = BindingState(self.binary.arch.bits == 64)
-        seg = self.binary.segments[0]
-        # XXX: do self.binary.__text
-        # is it possible to have more than one __text?
-        s.seg_end_address = seg.vaddr + seg.memsize
-        s.bind_handler = default_binding_handler
-        self._do_bind_generic(blob, s, {
-            mach_o.BIND_OPCODE_DONE: n_opcode_done,
-            mach_o.BIND_OPCODE_SET_DYLIB_ORDINAL_IMM: n_opcode_set_dylib_ordinal_imm,
-            mach_o.BIND_OPCODE_SET_DYLIB_ORDINAL_ULEB: n_opcode_set_dylib_ordinal_uleb,
-            mach_o.BIND_OPCODE_SET_DYLIB_SPECIAL_IMM: n_opcode_set_dylib_special_imm,
-            mach_o.BIND_OPCODE_SET_SYMBOL_TRAILING_FLAGS_IMM: n_opcode_set_trailing_flags_imm,
-            mach_o.BIND_OPCODE_SET_TYPE_IMM: n_opcode_set_type_imm,
-            mach_o.BIND_OPCODE_SET_ADDEND_SLEB: n_opcode_set_addend_sleb,
-            mach_o.BIND_OPCODE_SET_SEGMENT_AND_OFFSET_ULEB: n_opcode_set_segment_and_offset_uleb,
-            mach_o.BIND_OPCODE_ADD_ADDR_ULEB: n_opcode_add_addr_uleb,
-            mach_o.BIND_OPCODE_DO_BIND: n_opcode_do_bind,
-            mach_o.BIND_OPCODE_DO_BIND_ADD_ADDR_ULEB: n_opcode_do_bind_add_addr_uleb,
-            mach_o.BIND_OPCODE_DO_BIND_ADD_ADDR_IMM_SCALED: n_opcode_do_bind_add_addr_imm_scaled,
-            mach_o.BIND_OPCODE_DO_BIND_ULEB_TIMES_SKIPPING_ULEB: n_opcode_do_bind_uleb_times_skipping_uleb
-        })
-
+        self.apply_bind_table(decode_bind_blob(blob, self.binary.segments, self.binary.arch.bits == 64))
         l.debug("Done binding non-lazy, non-weak symbols ")
 
     def do_lazy_bind(self, blob):
         """
-        Performs lazy binding
+        Performs lazy binding. The segments of the binary must not be rebased yet.
         """
         if blob is None:
             return  # skip
-        l.debug("Binding lazy symbols")
-
-        s = BindingState(self.binary.arch.bits == 64)
-        s.index = 0
-        s.bind_handler = default_binding_handler
-        end = len(blob)
-        # We need to iterate the iteration as every lazy binding entry ends with BIND_OPCODE_DONE
-        while s.index < end:
-            # re-initialise state (except index)
-            s.binding_type = 1
-            s.address = 0
-            s.sym_name = ""
-            s.sym_flags = 0
-            s.lib_ord = 0
-            s.done = False
-            s.addend = 0
-            s.segment_index = 0
-            s.seg_end_address = 0  # TODO: no rebasing support
-
-            self._do_bind_generic(blob, s, {
-                mach_o.BIND_OPCODE_DONE: n_opcode_done,
-                mach_o.BIND_OPCODE_SET_DYLIB_ORDINAL_IMM: n_opcode_set_dylib_ordinal_imm,
-                mach_o.BIND_OPCODE_SET_DYLIB_ORDINAL_ULEB: n_opcode_set_dylib_ordinal_uleb,
-                mach_o.BIND_OPCODE_SET_DYLIB_SPECIAL_IMM: n_opcode_set_dylib_special_imm,
-                mach_o.BIND_OPCODE_SET_SYMBOL_TRAILING_FLAGS_IMM: n_opcode_set_trailing_flags_imm,
-                mach_o.BIND_OPCODE_SET_TYPE_IMM: n_opcode_set_type_imm,
-                mach_o.BIND_OPCODE_SET_SEGMENT_AND_OFFSET_ULEB: l_opcode_set_segment_and_offset_uleb,
-                mach_o.BIND_OPCODE_DO_BIND: l_opcode_do_bind,
-            })
 
+        l.debug("Binding lazy symbols")
+        self.apply_bind_table(decode_bind_blob(blob, self.binary.segments, self.binary.arch.bits == 64, lazy=True))
         l.debug("Done binding lazy symbols")
 
-    def _do_bind_generic(self, blob, init_state, opcode_dict):
-        """
-        Does the actual binding work. Represents a generic framework for interpreting binding opcodes
-        :param blob: blob of binding opcodes
-        :param init_state: Initial BindingState
-        :param opcode_dict: Dictionary opcode=> handler
-        :return: resulting binding state
+    def apply_bind_table(self, table):
         """
+        Binds all records of a BindTable, see decode_bind_blob. Imports are resolved against the other Mach-O objects
+        of the loader, which have to be mapped already.
 
-        s = init_state
-        seg = self.binary.segments[s.segment_index]
-        s.seg_end_address = seg.vaddr + seg.memsize  # TODO: no rebasing support
-        end = len(blob)
-        while not s.done and s.index < end:
-            l.debug("Current address: %#x, blob index (offset): %#x", s.address, s.index)
-            raw_opcode = blob[s.index]
-            opcode = raw_opcode & mach_o.BIND_OPCODE_MASK
-            immediate = raw_opcode & mach_o.BIND_IMMEDIATE_MASK
-            s.index += 1
-            try:
-                binding_handler = opcode_dict[opcode]
-                s = binding_handler(s, self.binary, immediate, blob)
-            except KeyError:
-                l.error("Invalid opcode for current binding: %#x", opcode)
-
-        return s
-
-# pylint: disable=unused-argument
-# The following functions realize different variants of handling binding opcodes
-# the format is def X(state,binary,immediate,blob) => state
-def n_opcode_done(s, b, i, blob):
-    l.debug("BIND_OPCODE_DONE @ %#x", s.index)
-    s.done = True
-    return s
-
-def n_opcode_set_dylib_ordinal_imm(s, b, i, blob):
-    l.debug("SET_DYLIB_ORDINAL_IMM @ %#x: %d", s.index, i)
-    s.lib_ord = i
-    return s
-
-def n_opcode_set_dylib_ordinal_uleb(s, b, i, blob):
-    uleb = read_uleb(blob, s.index)
-    s.lib_ord = uleb[0]
-    s.index += uleb[1]
-    l.debug("SET_DYLIB_ORDINAL_ULEB @ %#x: %d", s.index, s.lib_ord)
-    return s
-
-def n_opcode_set_dylib_special_imm(s, b, i, blob):
-    if i == 0:
-        s.lib_ord = 0
-    else:
-        s.lib_ord = (i | mach_o.BIND_OPCODE_MASK) - 256
-    l.debug("SET_DYLIB_SPECIAL_IMM @ %#x: %d", s.index, s.lib_ord)
-    return s
-
-def n_opcode_set_trailing_flags_imm(s, b, i, blob):
-    s.sym_name = ""
-    s.sym_flags = i
-
-    while blob[s.index] != 0:
-        s.sym_name += chr(blob[s.index])
-        s.index += 1
-
-    s.index += 1  # move past 0 byte
-    l.debug("SET_SYMBOL_TRAILING_FLAGS_IMM @ %#x: %r,%#x", s.index - len(s.sym_name) - 1, s.sym_name, s.sym_flags)
-    return s
-
-def n_opcode_set_type_imm(s, b, i, blob):
-    s.binding_type = i
-    l.debug("SET_TYPE_IMM @ %#x: %d", s.index, s.binding_type)
-    return s
-
-def n_opcode_set_addend_sleb(s, b, i, blob):
-    sleb = read_sleb(blob, s.index)
-    s.addend = sleb[0]
-    l.debug("SET_ADDEND_SLEB @ %#x: %d", s.index, s.addend)
-    s.index += sleb[1]
-    return s
-
-def n_opcode_set_segment_and_offset_uleb(s, b, i, blob):
-    s.segment_index = i
-    uleb = read_uleb(blob, s.index)
-    l.debug("(n)SET_SEGMENT_AND_OFFSET_ULEB @ %#x: %d, %d", s.index, s.segment_index, uleb[0])
-    s.index += uleb[1]
-    seg = b.segments[s.segment_index]
-    s.add_address_ov(seg.vaddr, uleb[0])
-    s.seg_end_address = seg.vaddr + seg.memsize
-
-    return s
-
-def l_opcode_set_segment_and_offset_uleb(s, b, i, blob):
-    uleb = read_uleb(blob, s.index)
-    l.debug("(l)SET_SEGMENT_AND_OFFSET_ULEB @ %#x: %d, %d", s.index, i, uleb[0])
-    seg = b.segments[i]
-    s.add_address_ov(seg.vaddr, uleb[0])
-    s.index += uleb[1]
-    return s
-
-def n_opcode_add_addr_uleb(s, b, i, blob):
-    uleb = read_uleb(blob, s.index)
-    s.add_address_ov(s.address, uleb[0])
-    l.debug("ADD_ADDR_ULEB @ %#x: %d", s.index, uleb[0])
-    s.index += uleb[1]
-    return s
-
-def n_opcode_do_bind(s, b, i, blob):
-    l.debug("(n)DO_BIND @ %#x", s.index)
-    s.check_address_bounds()
-    s.bind_handler(s, b)
-    s.add_address_ov(s.address, s.sizeof_intptr_t)
-    return s
-
-def l_opcode_do_bind(s, b, i, blob):
-    l.debug("(l)DO_BIND @ %#x", s.index)
-    s.bind_handler(s, b)
-    return s
-
-def n_opcode_do_bind_add_addr_uleb(s, b, i, blob):
-    uleb = read_uleb(blob, s.index)
-    l.debug("DO_BIND_ADD_ADDR_ULEB @ %#x: %d", s.index, uleb[0])
-    if s.address >= s.seg_end_address:
-        l.error("DO_BIND_ADD_ADDR_ULEB @ %#x: address >= seg_end_address (%#x>=%#x)",
-                s.index, s.address, s.seg_end_address)
-        raise CLEInvalidBinaryError()
-    s.index += uleb[1]
-    s.bind_handler(s, b)
-    # this is done AFTER binding in preparation for the NEXT step
-    s.add_address_ov(s.address, uleb[0] + s.sizeof_intptr_t)
-    return s
-
-def n_opcode_do_bind_add_addr_imm_scaled(s, b, i, blob):
-    l.debug("DO_BIND_ADD_ADDR_IMM_SCALED @ %#x: %d", s.index, i)
-    if s.address >= s.seg_end_address:
-        l.error("DO_BIND_ADD_ADDR_IMM_SCALED @ %#x: address >= seg_end_address (%#x>=%#x)",
-                s.index, s.address, s.seg_end_address)
-        raise CLEInvalidBinaryError()
-    s.bind_handler(s, b)
-    # this is done AFTER binding in preparation for the NEXT step
-    s.add_address_ov(s.address, (i * s.sizeof_intptr_t) + s.sizeof_intptr_t)
-    return s
-
-def n_opcode_do_bind_uleb_times_skipping_uleb(s, b, i, blob):
-    count = read_uleb(blob, s.index)
-    s.index += count[1]
-    skip = read_uleb(blob, s.index)
-    s.index += skip[1]
-    l.debug(
-        "DO_BIND_ULEB_TIMES_SKIPPING_ULEB @ %#x: %d,%d", s.index - skip[1] - count[1], count[0], skip[0])
-    for i in range(0, count[0]):
-        if s.address >= s.seg_end_address:
-            l.error("DO_BIND_ADD_ADDR_IMM_SCALED @ %#x: address >= seg_end_address (%#x >= %#x)",
-                s.index - skip[1] - count[1], s.address, s.seg_end_address)
-            raise CLEInvalidBinaryError()
-        s.bind_handler(s, b)
-        s.add_address_ov(s.address, skip[0] + s.sizeof_intptr_t)
-    return s
-
-# default binding handler
-def default_binding_handler(state, binary):
-    """Binds location to the symbol with the given name and library ordinal
+        The bound values are written in runs of the same size with Clemory.pack_words, and the locations bound to the
+        same symbol one after the other are added to its bind_xrefs at once.
+        :param table: the BindTable to apply
+        """
+        binary = self.binary
+        memory = binary.memory
+        names = table.names
+        endness = Endness.LE if binary.struct_byteorder == '<' else Endness.BE
+        ptr_size = binary.arch.bytes
+        linked_base = binary.linked_base
+        slide = binary.mapped_base - linked_base
+
+        run_size, rvas, values = None, [], []
+        symbol, target, last_key, xrefs = None, None, None, []
+        for address, lib_ord, name_index, binding_type, addend in zip(
+                table.addresses, table.ordinals, table.name_indices, table.types, table.addends):
+            # bind records of the same symbol are mostly adjacent
+            if (name_index, lib_ord) != last_key:
+                if xrefs:
+                    binary._add_bind_xrefs(symbol, xrefs)
+                    xrefs = []
+                last_key = (name_index, lib_ord)
+                symbol = find_binding_symbol(binary, names[name_index], lib_ord)
+                target = self.resolve_binding(symbol, names[name_index], lib_ord)
+            # unresolved imports are left at zero, without the addend
+            value = target + addend if target is not None else 0
+
+            if binding_type == mach_o.BIND_TYPE_POINTER:
+                size, location = ptr_size, address
+            elif binding_type == mach_o.BIND_TYPE_TEXT_ABSOLUTE32:
+                size, location = 4, address % 2 ** 32
+            elif binding_type == mach_o.BIND_TYPE_TEXT_PCREL32:
+                size, location = 4, address % 2 ** 32
+                value -= address + slide + 4
+            else:
+                l.error("Unknown BIND_TYPE: %d", binding_type)
+                raise CLEInvalidBinaryError()
+
+            if size != run_size:
+                if rvas:
+                    memory.pack_words(rvas, values, size=run_size, endness=endness)
+                run_size, rvas, values = size, [], []
+            rvas.append(location - linked_base)
+            values.append(value)
+            xrefs.append(location)
+
+        if rvas:
+            memory.pack_words(rvas, values, size=run_size, endness=endness)
+        if xrefs:
+            binary._add_bind_xrefs(symbol, xrefs)
+
+    def apply_chained_fixups(self, table):
+        """
+        Binds the imports of a ChainedFixupsTable, see decode_chained_fixups. Imports are resolved like in
+        apply_bind_table, the rebases of the table are applied when the binary is mapped, see MachO.rebase.
+        :param table: the ChainedFixupsTable to apply
+        """
+        binary = self.binary
+        symbols = []
+        targets = []
+        for lib_ord, name, _, addend in table.imports:
+            symbol = find_binding_symbol(binary, name, lib_ord)
+            target = self.resolve_binding(symbol, name, lib_ord)
+            symbols.append(symbol)
+            # the addend of an import applies to every bind to it
+            targets.append(target + addend if target is not None else None)
+
+        apply_chained_fixups(binary, table, import_targets=targets)
+
+        xrefs = [[] for _ in symbols]
+        for address, import_index, _ in table:
+            if import_index != NO_IMPORT:
+                xrefs[import_index].append(address)
+        for symbol, symbol_xrefs in zip(symbols, xrefs):
+            if symbol_xrefs:
+                binary._add_bind_xrefs(symbol, symbol_xrefs)
+
+    def resolve_binding(self, symbol, name, lib_ord):
+        """
+        Locates what a bind to name from the library with the given ordinal refers to
+        :param symbol: the symbol of this binary for the bind, see find_binding_symbol
+        :return: the mapped address the bind refers to, or None if it cannot be resolved
+        """
+        binary = self.binary
+        if not symbol.is_import:
+            return symbol.rebased_addr
+
+        loader = binary.loader
+        if lib_ord in (mach_o.BIND_SPECIAL_DYLIB_FLAT_LOOKUP, BIND_SPECIAL_DYLIB_WEAK_LOOKUP):
+            if loader is not None:
+                # the first image of the loader exporting name
+                export = loader._mach_exports.lookup(name)
+                if export is not None:
+                    return export[1]
+                images = []
+            else:
+                images = [binary]
+        elif lib_ord == mach_o.BIND_SPECIAL_DYLIB_SELF:
+            images = [binary]
+        elif lib_ord == mach_o.BIND_SPECIAL_DYLIB_MAIN_EXECUTABLE:
+            images = [loader.main_object if loader is not None else binary]
+        else:
+            images = [binary.get_imported_library(lib_ord)]
+
+        for image in images:
+            if image is None:
+                continue
+            address = image.resolve_export(name)
+            if address is not None:
+                return address
+
+        l.info("Cannot resolve (%r,%d)", name, lib_ord)
+        return None
+
+def find_binding_symbol(binary, sym_name, lib_ord):
+    """Locates the symbol with the given name and library ordinal, generating a BindingSymbol if there is none
     """
-
-    # locate the symbol:
-    # TODO: A lookup structure of some kind would be nice (see __init__)
-    matches = list(
-        filter(
-            lambda s, compare_state=state:
-                s.name == compare_state.sym_name and
-                s.library_ordinal == compare_state.lib_ord
-                and not s.is_stab, binary.symbols
-        )
-    )
+    matches = binary.get_symbols_by_name_and_ordinal(sym_name, lib_ord)
     if len(matches) > 1:
-        l.error("Cannot bind: More than one match for (%r,%d)", state.sym_name, state.lib_ord)
+        l.error("Cannot bind: More than one match for (%r,%d)", sym_name, lib_ord)
         raise CLEInvalidBinaryError()
     elif len(matches) < 1:
-        l.info("No match for (%r,%d), generating BindingSymbol ...", state.sym_name, state.lib_ord)
-        matches = [BindingSymbol(binary,state.sym_name,state.lib_ord)]
-        binary.symbols.add(matches[0])
+        l.info("No match for (%r,%d), generating BindingSymbol ...", sym_name, lib_ord)
+        matches = [BindingSymbol(binary, sym_name, lib_ord)]
+        binary._add_symbol(matches[0])
         binary._ordered_symbols.append(matches[0])
 
-    symbol = matches[0]
-    location = state.address
-
-    # If the linked_addr is equal to zero, it's an imported symbol which is by that time unresolved.
-    # Don't write addend's there
-
-    value = symbol.linked_addr + state.addend if symbol.linked_addr != 0 else 0x0
-
-    if state.binding_type == 1:  # POINTER
-        l.debug("Updating address %#x with symobl %r @ %#x", location, state.sym_name, value)
-        binary.memory.store(
-            AT.from_lva(location, binary).to_rva(),
-            struct.pack(binary.struct_byteorder + ("Q" if binary.arch.bits == 64 else "I"), value))
-        symbol.bind_xrefs.append(location)
-    elif state.binding_type == 2:  # ABSOLUTE32
-        location_32 = location % (2 ** 32)
-        value_32 = value % (2 ** 32)
-        l.debug("Updating address %#x with symobl %r @ %#x", state.sym_name, location_32, value_32)
-        binary.memory.store(
-            AT.from_lva(location_32, binary).to_rva(),
-            struct.pack(binary.struct_byteorder + "I", value_32))
-        symbol.bind_xrefs.append(location_32)
-    elif state.binding_type == 3:  # PCREL32
-        location_32 = location % (2 ** 32)
-        value_32 = (value - (location + 4)) % (2 ** 32)
-        l.debug("Updating address %#x with symobl %r @ %#x", state.sym_name, location_32, value_32)
-        binary.memory.store(
-            AT.from_lva(location_32, binary).to_rva(),
-            struct.pack(binary.struct_byteorder + "I", value_32))
-        symbol.bind_xrefs.append(location_32)
-    else:
-        l.error("Unknown BIND_TYPE: %d", state.binding_type)
-        raise CLEInvalidBinaryError()
-
+    return matches[0]
@@ -0,0 +1,284 @@
+# -*-coding:utf8 -*-
+# This file is part of Mach-O Loader for CLE.
+
+import bisect
+import struct
+from array import array
+
+from ...errors import CLEInvalidBinaryError, CLECompatibilityError
+
+import logging
+l = logging.getLogger('cle.backends.macho.chained_fixups')
+
+# The format is defined by dyld's fixup-chains.h, see https://opensource.apple.com/source/dyld/
+
+# load commands which older macholib versions do not know about
+LC_DYLD_EXPORTS_TRIE = 0x80000033
+LC_DYLD_CHAINED_FIXUPS = 0x80000034
+
+BIND_SPECIAL_DYLIB_WEAK_LOOKUP = -3
+
+# pointer formats
+DYLD_CHAINED_PTR_ARM64E = 1
+DYLD_CHAINED_PTR_64 = 2
+DYLD_CHAINED_PTR_64_OFFSET = 6
+DYLD_CHAINED_PTR_ARM64E_USERLAND = 9
+DYLD_CHAINED_PTR_ARM64E_USERLAND24 = 12
+
+# import formats
+DYLD_CHAINED_IMPORT = 1
+DYLD_CHAINED_IMPORT_ADDEND = 2
+DYLD_CHAINED_IMPORT_ADDEND64 = 3
+
+# page starts
+DYLD_CHAINED_PTR_START_NONE = 0xffff
+DYLD_CHAINED_PTR_START_MULTI = 0x8000
+
+NO_IMPORT = -1
+
+# fixups_version, starts_offset, imports_offset, symbols_offset, imports_count, imports_format, symbols_format
+_fixups_header = struct.Struct('<7I')
+# size, page_size, pointer_format, segment_offset, max_valid_pointer, page_count
+_starts_in_segment = struct.Struct('<IHHQIH')
+_raw_pointer = struct.Struct('<Q')
+
+
+class ChainedFixupsTable(object):
+    """
+    The fixups of all pointer chains of a binary as produced by decode_chained_fixups, in the order of their pages.
+
+    Fixup i is at the linked address addresses[i]. If import_indices[i] is NO_IMPORT, it is a rebase to the linked
+    address values[i]. Otherwise it is a bind to imports[import_indices[i]] with the addend values[i]. The fixups of
+    page j are the ones from page_starts[j] up to page_starts[j + 1].
+
+    Each import is a (library ordinal, name, weak import, addend) tuple.
+    """
+
+    def __init__(self):
+        self.addresses = array('Q')
+        self.import_indices = array('q')
+        self.values = array('Q')
+        self.page_starts = array('Q')
+        self.imports = []
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def __iter__(self):
+        """Yields (address, import index, value) for each fixup"""
+        return zip(self.addresses, self.import_indices, self.values)
+
+    def iter_pages(self):
+        """Yields (start, end) for the fixups of each page"""
+        ends = self.page_starts[1:]
+        ends.append(len(self.addresses))
+        return zip(self.page_starts, ends)
+
+
+def _sign_extend(value, bits):
+    sign = 1 << (bits - 1)
+    return (value ^ sign) - sign
+
+def _decode_arm64e(raw, linked_base, pointer_format):
+    """:return: (next, import ordinal or NO_IMPORT, target or addend)"""
+    is_bind = (raw >> 62) & 1
+    is_auth = raw >> 63
+    next_ = (raw >> 51) & 0x7ff
+    if is_bind:
+        ordinal = raw & (0xffffff if pointer_format == DYLD_CHAINED_PTR_ARM64E_USERLAND24 else 0xffff)
+        # authenticated binds have the signing diversity where plain binds have the addend
+        addend = 0 if is_auth else _sign_extend((raw >> 32) & 0x7ffff, 19)
+        return next_, ordinal, addend & 0xffffffffffffffff
+    if is_auth:
+        # the pointer will not be signed, there is nothing to sign it with
+        return next_, NO_IMPORT, linked_base + (raw & 0xffffffff)
+    target = raw & 0x7ffffffffff
+    if pointer_format != DYLD_CHAINED_PTR_ARM64E:
+        target += linked_base
+    return next_, NO_IMPORT, target | ((raw >> 43) & 0xff) << 56
+
+def _decode_64(raw, linked_base, pointer_format):
+    """:return: (next, import ordinal or NO_IMPORT, target or addend)"""
+    next_ = (raw >> 51) & 0xfff
+    if raw >> 63:
+        return next_, raw & 0xffffff, (raw >> 24) & 0xff
+    target = raw & 0xfffffffff
+    if pointer_format == DYLD_CHAINED_PTR_64_OFFSET:
+        target += linked_base
+    return next_, NO_IMPORT, target | ((raw >> 36) & 0xff) << 56
+
+# pointer format => (decoder, stride)
+_pointer_formats = {
+    DYLD_CHAINED_PTR_ARM64E: (_decode_arm64e, 8),
+    DYLD_CHAINED_PTR_ARM64E_USERLAND: (_decode_arm64e, 8),
+    DYLD_CHAINED_PTR_ARM64E_USERLAND24: (_decode_arm64e, 8),
+    DYLD_CHAINED_PTR_64: (_decode_64, 4),
+    DYLD_CHAINED_PTR_64_OFFSET: (_decode_64, 4),
+}
+
+def _read_cstring(blob, offset):
+    end = blob.find(b'\0', offset)
+    if end == -1:
+        l.error("Unterminated import name @ %#x", offset)
+        raise CLEInvalidBinaryError()
+    return blob[offset:end].decode('utf-8', errors='replace')
+
+def decode_chained_imports(blob, imports_offset, imports_count, imports_format, symbols_offset):
+    """
+    Decodes the imports table of a chained fixups blob.
+
+    :return: a list of (library ordinal, name, weak import, addend) tuples
+    """
+    imports = []
+    try:
+        if imports_format == DYLD_CHAINED_IMPORT:
+            for raw in struct.unpack_from('<%dI' % imports_count, blob, imports_offset):
+                ordinal = raw & 0xff
+                imports.append((ordinal - 0x100 if ordinal > 0xf0 else ordinal, raw >> 9, (raw >> 8) & 1, 0))
+        elif imports_format == DYLD_CHAINED_IMPORT_ADDEND:
+            fields = struct.unpack_from('<' + 'Ii' * imports_count, blob, imports_offset)
+            for raw, addend in zip(fields[::2], fields[1::2]):
+                ordinal = raw & 0xff
+                imports.append((ordinal - 0x100 if ordinal > 0xf0 else ordinal, raw >> 9, (raw >> 8) & 1, addend))
+        elif imports_format == DYLD_CHAINED_IMPORT_ADDEND64:
+            fields = struct.unpack_from('<' + 'Qq' * imports_count, blob, imports_offset)
+            for raw, addend in zip(fields[::2], fields[1::2]):
+                ordinal = raw & 0xffff
+                imports.append((ordinal - 0x10000 if ordinal > 0xfff0 else ordinal, raw >> 32, (raw >> 16) & 1,
+                                addend))
+        else:
+            l.error("Unknown chained imports format: %d", imports_format)
+            raise CLEInvalidBinaryError()
+    except struct.error:
+        l.error("The chained imports are out of the bounds of the fixups blob")
+        raise CLEInvalidBinaryError()
+
+    return [(ordinal, _read_cstring(blob, symbols_offset + name_offset), weak, addend)
+            for ordinal, name_offset, weak, addend in imports]
+
+def decode_chained_fixups(blob, memory, linked_base):
+    """
+    Decodes the chained fixups of a binary into a ChainedFixupsTable. Each page with fixups is read from memory once,
+    to walk the chains in it.
+
+    :param blob: the contents of LC_DYLD_CHAINED_FIXUPS
+    :param memory: the memory of the binary, which has to hold the unmodified chains
+    :param linked_base: the linked address of the mach header
+    :return: ChainedFixupsTable
+    """
+    table = ChainedFixupsTable()
+    try:
+        _, starts_offset, imports_offset, symbols_offset, imports_count, imports_format, symbols_format = \
+            _fixups_header.unpack_from(blob, 0)
+        if symbols_format != 0:
+            l.error("Compressed chained fixups symbols are not supported")
+            raise CLECompatibilityError()
+        table.imports = decode_chained_imports(blob, imports_offset, imports_count, imports_format, symbols_offset)
+
+        seg_count, = struct.unpack_from('<I', blob, starts_offset)
+        seg_info_offsets = struct.unpack_from('<%dI' % seg_count, blob, starts_offset + 4)
+    except struct.error:
+        l.error("Malformed chained fixups header")
+        raise CLEInvalidBinaryError()
+
+    for seg_info_offset in seg_info_offsets:
+        if seg_info_offset == 0:
+            continue  # this segment has no fixups
+
+        offset = starts_offset + seg_info_offset
+        try:
+            _, page_size, pointer_format, segment_offset, _, page_count = _starts_in_segment.unpack_from(blob, offset)
+            page_starts = struct.unpack_from('<%dH' % page_count, blob, offset + _starts_in_segment.size)
+        except struct.error:
+            l.error("Malformed chained starts @ %#x", offset)
+            raise CLEInvalidBinaryError()
+
+        try:
+            decode, stride = _pointer_formats[pointer_format]
+        except KeyError:
+            l.error("Unsupported chained pointer format: %d", pointer_format)
+            raise CLECompatibilityError()
+
+        for page_index, chain_offset in enumerate(page_starts):
+            if chain_offset == DYLD_CHAINED_PTR_START_NONE:
+                continue
+            if chain_offset & DYLD_CHAINED_PTR_START_MULTI:
+                # only 32 bit pointer formats have several chains per page
+                l.error("Multiple chains per page are not supported")
+                raise CLECompatibilityError()
+
+            page_rva = segment_offset + page_index * page_size
+            page = memory.load(page_rva, page_size)
+            table.page_starts.append(len(table.addresses))
+            while True:
+                try:
+                    raw, = _raw_pointer.unpack_from(page, chain_offset)
+                except struct.error:
+                    l.error("Pointer chain leaves the page @ %#x", linked_base + page_rva)
+                    raise CLEInvalidBinaryError()
+
+                next_, import_index, value = decode(raw, linked_base, pointer_format)
+                if import_index != NO_IMPORT and import_index >= len(table.imports):
+                    l.error("Bind to unknown import %d @ %#x", import_index, linked_base + page_rva + chain_offset)
+                    raise CLEInvalidBinaryError()
+
+                table.addresses.append(linked_base + page_rva + chain_offset)
+                table.import_indices.append(import_index)
+                table.values.append(value)
+
+                if next_ == 0:
+                    break
+                chain_offset += next_ * stride
+
+    return table
+
+def apply_chained_fixups(binary, table, import_targets=None, delta=None):
+    """
+    Writes the fixed up pointers of a ChainedFixupsTable directly into the backers of the binary's memory, one page
+    at a time. The rebases are written when the binary is mapped, and the binds once its imports can be resolved, so
+    either half may be left out.
+
+    :param binary: the MachO the table belongs to
+    :param table: the ChainedFixupsTable to apply
+    :param import_targets: the mapped address each import of the table is bound to, or None if it is unresolved. The
+                           binds are not written if this is None.
+    :param delta: the difference between the mapped and the linked base of binary, which the rebases are slid by.
+                  The rebases are not written if this is None.
+    """
+    if not table:
+        return
+
+    pointer = struct.Struct(binary.struct_byteorder + "Q")
+    mask = 2 ** 64 - 1
+    linked_base = binary.linked_base
+
+    memory = binary.memory
+    backers = list(memory.backers())
+    backer_starts = [start for start, _ in backers]
+
+    addresses, import_indices, values = table.addresses, table.import_indices, table.values
+    for start, end in table.iter_pages():
+        # a page normally lies within a single backer, so that it is located once for all of its pointers
+        first_rva = addresses[start] - linked_base
+        idx = bisect.bisect_right(backer_starts, first_rva) - 1
+        backer_start, backer = backers[idx] if idx >= 0 else (0, b'')
+        in_backer = idx >= 0 and addresses[end - 1] - linked_base + pointer.size <= backer_start + len(backer)
+
+        for i in range(start, end):
+            import_index = import_indices[i]
+            if import_index == NO_IMPORT:
+                if delta is None:
+                    continue
+                value = (values[i] + delta) & mask
+            else:
+                if import_targets is None:
+                    continue
+                # unresolved imports are left at zero, without the addend
+                target = import_targets[import_index]
+                value = (target + values[i]) & mask if target is not None else 0
+
+            rva = addresses[i] - linked_base
+            if in_backer:
+                pointer.pack_into(backer, rva - backer_start, value)
+            else:
+                memory.store(rva, pointer.pack(value))
@@ -0,0 +1,428 @@
+# -*-coding:utf8 -*-
+# This file is part of Mach-O Loader for CLE.
+
+import io
+import mmap
+import struct
+from collections import OrderedDict
+
+import archinfo
+from macholib import mach_o
+from macholib.ptypes import sizeof
+
+from .macho import MachO
+from .symbol import SymbolTableSymbol
+from .. import Backend, register_backend
+from ..region import Segment
+from ...utils import stream_or_path, get_mmaped_backers
+from ...errors import CLEInvalidBinaryError, CLEError
+
+import logging
+l = logging.getLogger('cle.backends.macho.dyld_cache')
+
+__all__ = ('DyldSharedCache', 'DyldCacheImage', 'DyldCacheMapping')
+
+# The format is defined by dyld's cache_format.h, see https://opensource.apple.com/source/dyld/
+
+# magic, mappingOffset, mappingCount, imagesOffsetOld, imagesCountOld
+_cache_header = struct.Struct('<16s4I')
+# address, size, fileOffset, maxProt, initProt
+_cache_mapping = struct.Struct('<3Q2I')
+# address, modTime, inode, pathFileOffset, pad
+_cache_image = struct.Struct('<3Q2I')
+# nlistOffset, nlistCount, stringsOffset, stringsSize, entriesOffset, entriesCount
+_local_symbols_info = struct.Struct('<6I')
+# dylibOffset, nlistStartIndex, nlistCount
+_local_symbols_entry = struct.Struct('<3I')
+_local_symbols_entry_64 = struct.Struct('<Q2I')
+# n_strx, n_type, n_sect, n_desc, n_value
+_nlist = struct.Struct('<IBBHI')
+_nlist_64 = struct.Struct('<IBBHQ')
+
+# Fields were appended to the cache header over time. A cache has a field if its mappings start behind it.
+_LOCAL_SYMBOLS_OFFSET = 0x48  # localSymbolsOffset, localSymbolsSize
+_SYMBOL_FILE_UUID_OFFSET = 0x190  # caches which have it use 64 bit local symbols entries
+_IMAGES_OFFSET = 0x1c0  # imagesOffset, imagesCount, which replace imagesOffsetOld and imagesCountOld
+
+_CACHE_ARCHS = {
+    'arm64': 'aarch64',
+    'arm64e': 'aarch64',
+    'x86_64': 'amd64',
+    'x86_64h': 'amd64',
+    'i386': 'x86',
+}
+
+
+class DyldCacheMapping(Segment):
+    """
+    A mapping of a dyld shared cache, i.e. a range of the cache file that is mapped at a fixed address.
+
+        - offset is the offset into the cache file the mapping starts
+        - vaddr (or just addr) is the virtual address
+        - filesize and memsize are both the size of the mapping
+        - initprot and maxprot are initial and maximum permissions respectively
+    """
+
+    def __init__(self, address, size, file_offset, maxprot, initprot):
+        super(DyldCacheMapping, self).__init__(file_offset, address, size, size)
+        self.maxprot = maxprot
+        self.initprot = initprot
+
+    def __repr__(self):
+        return '<DyldCacheMapping: vaddr={:x}, size={:x}, offset={:x}>'.format(self.vaddr, self.memsize, self.offset)
+
+    @property
+    def is_readable(self):
+        return (self.initprot & 0x01) != 0
+
+    @property
+    def is_writable(self):
+        return (self.initprot & 0x02) != 0
+
+    @property
+    def is_executable(self):
+        return (self.initprot & 0x04) != 0
+
+
+class DyldSharedCache(Backend):
+    """
+    A dyld shared cache, the prelinked collection of the system's dylibs that iOS and macOS map into every process.
+
+    The mappings of the cache are mapped copy-on-write from the file, so loading the cache does not read it. Its images
+    are only indexed by their install names in self.images. They are parsed on demand by get_image, into DyldCacheImage
+    objects which behave like any other MachO.
+
+    Caches which are split into several files are not supported, only the images and local symbols of the main cache
+    file are visible.
+    """
+
+    is_default = True  # Tell CLE to automatically consider using the DyldSharedCache backend
+
+    def __init__(self, binary, **kwargs):
+        super(DyldSharedCache, self).__init__(binary, **kwargs)
+        if self.binary_stream is None:
+            raise CLEError("Unable to open the shared cache %s" % self.binary)
+
+        self._data = self._map_file(self.binary_stream)
+        if len(self._data) < _cache_header.size:
+            l.error("The shared cache is too small for its header")
+            raise CLEInvalidBinaryError()
+
+        magic, mapping_offset, mapping_count, images_offset, images_count = _cache_header.unpack_from(self._data, 0)
+        self.magic = magic.rstrip(b'\0').decode()
+        self._header_size = mapping_offset  # the header ends where the mappings start
+
+        cache_arch = self.magic.split()[-1]
+        arch_ident = 'arm' if cache_arch.startswith('armv') else _CACHE_ARCHS.get(cache_arch)
+        if arch_ident is None:
+            raise CLEError("Unsupported shared cache architecture %s" % cache_arch)
+        self.set_arch(archinfo.arch_from_id(arch_ident, endness="lsb"))
+
+        self.os = "Darwin"
+        self.linking = 'dynamic'
+        # the images are linked for their place in the cache. Moving it would require applying its slide info
+        self.pic = False
+
+        self.mappings = []
+        for i in range(mapping_count):
+            fields = self._unpack(_cache_mapping, mapping_offset + i * _cache_mapping.size)
+            self.mappings.append(DyldCacheMapping(*fields))
+        if not self.mappings:
+            l.error("The shared cache has no mappings")
+            raise CLEInvalidBinaryError()
+        self.segments = list(self.mappings)
+        self.mapped_base = self.linked_base = min(mapping.vaddr for mapping in self.mappings)
+
+        if self._header_size >= _IMAGES_OFFSET + 8:
+            images_offset, images_count = struct.unpack_from('<2I', self._data, _IMAGES_OFFSET)
+
+        # install name => address of the mach header of the image. Some images are listed under several paths
+        self.images = OrderedDict()
+        for i in range(images_count):
+            address, _, _, path_offset, _ = self._unpack(_cache_image, images_offset + i * _cache_image.size)
+            self.images[self._read_cstring(path_offset)] = address
+
+        self._images_by_address = {}  # address => DyldCacheImage, see get_image
+        self._local_symbols = None  # see _local_symbols_entries
+
+        self._map_mappings()
+
+    @staticmethod
+    def _map_file(stream):
+        """
+        Maps the whole cache file read-only, or reads it if it is not backed by a regular file
+        """
+        try:
+            return mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            stream.seek(0)
+            return stream.read()
+
+    def _unpack(self, fmt, offset):
+        if offset + fmt.size > len(self._data):
+            l.error("Structure @ %#x is out of the bounds of the shared cache", offset)
+            raise CLEInvalidBinaryError()
+        return fmt.unpack_from(self._data, offset)
+
+    def _read_cstring(self, offset):
+        end = self._data.find(b'\0', offset)
+        if end == -1:
+            l.error("Unterminated string @ %#x", offset)
+            raise CLEInvalidBinaryError()
+        return self._data[offset:end].decode()
+
+    def _map_mappings(self):
+        for mapping in self.mappings:
+            backers = get_mmaped_backers(self.binary_stream, mapping.offset, mapping.filesize)
+            if backers is None:
+                backers = [(0, bytearray(self._data[mapping.offset:mapping.offset + mapping.filesize]))]
+
+            for offset, blob in backers:
+                self.memory.add_backer(mapping.vaddr - self.linked_base + offset, blob)
+
+    def vaddr_to_offset(self, addr):
+        """
+        Translates a linked address of the cache to the offset in the cache file it is stored at
+
+        :return: the file offset or None if addr is not in any mapping
+        """
+        # there only ever are a handful of mappings
+        for mapping in self.mappings:
+            if mapping.contains_addr(addr):
+                return mapping.addr_to_offset(addr)
+        return None
+
+    def get_image(self, name):
+        """
+        Returns the image with the given install name, parsing it on first use.
+
+        :param name: the install name of the image, e.g. /usr/lib/libSystem.B.dylib
+        :return: DyldCacheImage
+        :raises KeyError: if there is no such image in the cache
+        """
+        address = self.images[name]
+        image = self._images_by_address.get(address)
+        if image is None:
+            l.debug("Parsing image %s @ %#x", name, address)
+            binary = self.binary if self.binary is not None else self.binary_stream
+            image = DyldCacheImage(binary, cache=self, image_address=address, loader=self.loader)
+            self._images_by_address[address] = image
+        return image
+
+    def _local_symbols_entries(self):
+        """
+        Indexes the local symbols of the cache, which the images' symbol tables have been stripped of.
+
+        :return: a dict mapping the dylib offset of an image to the index of its first local nlist and their count
+        """
+        if self._local_symbols is not None:
+            return self._local_symbols
+
+        self._local_symbols = {}
+        self._local_nlist_offset = self._local_strings_offset = 0
+        if self._header_size < _LOCAL_SYMBOLS_OFFSET + 16:
+            return self._local_symbols
+
+        offset, size = struct.unpack_from('<2Q', self._data, _LOCAL_SYMBOLS_OFFSET)
+        if offset == 0 or size == 0:
+            # split caches keep them in a separate .symbols file
+            return self._local_symbols
+
+        nlist_offset, _, strings_offset, _, entries_offset, entries_count = self._unpack(_local_symbols_info, offset)
+        self._local_nlist_offset = offset + nlist_offset
+        self._local_strings_offset = offset + strings_offset
+
+        entry_fmt = _local_symbols_entry_64 if self._header_size >= _SYMBOL_FILE_UUID_OFFSET else _local_symbols_entry
+        for i in range(entries_count):
+            dylib_offset, start, count = self._unpack(entry_fmt, offset + entries_offset + i * entry_fmt.size)
+            self._local_symbols[dylib_offset] = (start, count)
+
+        return self._local_symbols
+
+    def iter_local_symbols(self, image_address):
+        """
+        Iterates over the local symbols of the image at image_address
+
+        :return: a generator of (name, n_type, n_sect, n_desc, n_value) tuples
+        """
+        entries = self._local_symbols_entries()
+        if self._header_size >= _SYMBOL_FILE_UUID_OFFSET:
+            # 64 bit entries are keyed by the offset of the image from the start of the cache
+            key = image_address - self.linked_base
+        else:
+            key = self.vaddr_to_offset(image_address)
+
+        if key not in entries:
+            return iter(())
+        start, count = entries[key]
+        is_64 = self.arch.bits == 64
+        nlist_size = (_nlist_64 if is_64 else _nlist).size
+        return self.iter_nlists(self._local_nlist_offset + start * nlist_size, count, self._local_strings_offset, is_64)
+
+    def iter_nlists(self, offset, count, strings_offset, is_64):
+        """
+        Iterates over a symbol table of the cache file. Only the names of the symbols are read from the string table,
+        which is shared by all images.
+
+        :param offset: the file offset of the first nlist
+        :param count: the number of nlists
+        :param strings_offset: the file offset of the string table
+        :param is_64: whether the nlists are 64 bit ones
+        :return: a generator of (name, n_type, n_sect, n_desc, n_value) tuples
+        """
+        fmt = _nlist_64 if is_64 else _nlist
+        if offset + count * fmt.size > len(self._data):
+            l.error("Symbol table @ %#x is out of the bounds of the shared cache", offset)
+            raise CLEInvalidBinaryError()
+
+        for n_strx, n_type, n_sect, n_desc, n_value in fmt.iter_unpack(self._data[offset:offset + count * fmt.size]):
+            name = self._read_cstring(strings_offset + n_strx) if n_strx != 0 else ''
+            yield name, n_type, n_sect, n_desc, n_value
+
+    @staticmethod
+    def is_compatible(stream):
+        stream.seek(0)
+        identstring = stream.read(0x7)
+        stream.seek(0)
+        return identstring == b'dyld_v1'
+
+    @classmethod
+    def check_compatibility(cls, spec, main_obj):
+        with stream_or_path(spec) as stream:
+            return cls.is_compatible(stream)
+
+    def close(self):
+        for image in self._images_by_address.values():
+            image.close()
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        super(DyldSharedCache, self).close()
+
+    def __getstate__(self):
+        if self.binary is None:
+            raise ValueError("Can't pickle an object loaded from a stream")
+
+        state = dict(self.__dict__)
+        state['binary_stream'] = None
+        state['_data'] = None
+        return state
+
+    def __setstate__(self, data):
+        self.__dict__.update(data)
+        self.binary_stream = open(self.binary, 'rb')
+        self._data = self._map_file(self.binary_stream)
+
+
+class DyldCacheImageHeader(object):
+    """
+    The mach header and load commands of an image in a shared cache, with the attributes of a macholib MachOHeader
+    that MachO uses.
+
+    The file offsets in the load commands of a cached image are offsets into the cache file, so offset is always 0.
+    Unlike macholib, this does not read the contents of the sections.
+    """
+
+    def __init__(self, stream, header_offset):
+        self.offset = 0
+        self.endian = '<'  # all shared caches are little endian
+        kw = {'_endian_': self.endian}
+
+        stream.seek(header_offset)
+        magic, = struct.unpack('<I', stream.read(4))
+        if magic == mach_o.MH_MAGIC_64:
+            header_cls = mach_o.mach_header_64
+        elif magic == mach_o.MH_MAGIC:
+            header_cls = mach_o.mach_header
+        else:
+            l.error("Bad mach header magic %#x @ %#x", magic, header_offset)
+            raise CLEInvalidBinaryError()
+
+        stream.seek(header_offset)
+        self.header = header_cls.from_fileobj(stream, **kw)
+        self.filetype = mach_o.MH_FILETYPE_SHORTNAMES.get(self.header.filetype, 'unknown')
+
+        self.commands = []
+        for _ in range(self.header.ncmds):
+            cmd_load = mach_o.load_command.from_fileobj(stream, **kw)
+            klass = mach_o.LC_REGISTRY.get(cmd_load.cmd)
+            if klass is None:
+                data = stream.read(cmd_load.cmdsize - sizeof(mach_o.load_command))
+                self.commands.append((cmd_load, cmd_load, data))
+                continue
+
+            cmd_cmd = klass.from_fileobj(stream, **kw)
+            if cmd_load.cmd in (mach_o.LC_SEGMENT, mach_o.LC_SEGMENT_64):
+                section_cls = mach_o.section if cmd_load.cmd == mach_o.LC_SEGMENT else mach_o.section_64
+                data = [section_cls.from_fileobj(stream, **kw) for _ in range(cmd_cmd.nsects)]
+            else:
+                data = stream.read(cmd_load.cmdsize - sizeof(klass) - sizeof(mach_o.load_command))
+            self.commands.append((cmd_load, cmd_cmd, data))
+
+
+class DyldCacheImage(MachO):
+    """
+    A dylib contained in a dyld shared cache, see DyldSharedCache.get_image.
+
+    Cached images differ from standalone dylibs in a few ways:
+    *   Their segments are mapped from the mappings of the cache
+    *   They all share a single __LINKEDIT, which is not mapped. The symbol table and dyld info are read from the file
+    *   They are linked and bound for their place in the cache, so they are neither rebased nor bound again
+    *   Most of their local symbols are stripped from their symbol tables, they are read from the cache's instead
+    """
+
+    is_default = False
+
+    def __init__(self, binary, cache=None, image_address=None, **kwargs):
+        """
+        :param binary: the path to (or a stream of) the cache file
+        :param cache: the DyldSharedCache containing the image
+        :param image_address: the address of the mach header of the image
+        """
+        self.cache = cache
+        self.image_address = image_address
+
+        super(DyldCacheImage, self).__init__(binary, **kwargs)
+
+        self.pic = False
+        self.binding_done = True
+
+    def _load_header(self, target_arch):
+        header_offset = self.cache.vaddr_to_offset(self.image_address)
+        if header_offset is None:
+            l.error("The image @ %#x is not in any mapping of the cache", self.image_address)
+            raise CLEInvalidBinaryError()
+        return DyldCacheImageHeader(self.binary_stream, header_offset)
+
+    def _map_segments(self):
+        for seg in self.segments:
+            if seg.segname in ('__PAGEZERO', '__LINKEDIT'):
+                continue
+            offset = self.cache.vaddr_to_offset(seg.vaddr)
+            if offset is None:
+                l.warning("Segment %s is not in any mapping of the cache, skipping it", seg.segname)
+                continue
+
+            backers = get_mmaped_backers(self.binary_stream, offset, seg.filesize, max(seg.filesize, seg.memsize))
+            if backers is None:
+                blob = self._read(self.binary_stream, offset, seg.filesize)
+                if seg.filesize < seg.memsize:
+                    blob += b'\0' * (seg.memsize - seg.filesize)  # padding
+                backers = [(0, blob)]
+
+            for blob_offset, blob in backers:
+                self.memory.add_backer(seg.vaddr - self.linked_base + blob_offset, blob)
+
+    def _iter_nlists(self, symtab, start, count):
+        # the symbol tables of all images live in the cache's __LINKEDIT
+        is_64 = self.arch.bits == 64
+        nlist_size = (_nlist_64 if is_64 else _nlist).size
+        return self.cache.iter_nlists(symtab.symoff + start * nlist_size, count, symtab.stroff, is_64)
+
+    def _load_symbol_table(self):
+        super(DyldCacheImage, self)._load_symbol_table()
+
+        self._add_symbols([SymbolTableSymbol(self, sym_str, n_type, n_sect, n_desc, n_value - self.linked_base)
+                           for sym_str, n_type, n_sect, n_desc, n_value
+                           in self.cache.iter_local_symbols(self.image_address)])
+
+register_backend('dyld_shared_cache', DyldSharedCache)
@@ -0,0 +1,253 @@
+# -*-coding:utf8 -*-
+# This file is part of Mach-O Loader for CLE.
+
+from collections.abc import Mapping
+
+from .binding import read_uleb
+from ...errors import CLEInvalidBinaryError
+
+import logging
+l = logging.getLogger('cle.backends.macho.export_trie')
+
+# export flags
+EXPORT_SYMBOL_FLAGS_KIND_MASK = 0x03
+EXPORT_SYMBOL_FLAGS_KIND_ABSOLUTE = 0x02
+EXPORT_SYMBOL_FLAGS_REEXPORT = 0x08
+EXPORT_SYMBOL_FLAGS_STUB_AND_RESOLVER = 0x10
+
+
+class ExportTrie(Mapping):
+    """
+    The exports trie of a Mach-O binary, mapping exported names to their export information.
+
+    The trie is read on demand: looking up a name only walks the nodes on the path to it, and the full mapping is
+    only built (and kept) once all of it is asked for, e.g. by iterating. The values are tuples depending on the
+    kind of export, in which the first item is always the export flags:
+
+        - re-exports: (flags, library ordinal, name in that library)
+        - stubs with a resolver: (flags, stub offset, resolver offset)
+        - everything else: (flags, address), where the address is a linked address unless the kind is absolute
+
+    Names may be given as str or bytes, they are str in the results.
+    """
+
+    def __init__(self, blob, base_addr):
+        """
+        :param blob: the exports trie, or None if there is none
+        :param base_addr: the linked address of the mach header, which export addresses are relative to
+        """
+        self.blob = blob if blob is not None else b''
+        self.base_addr = base_addr
+        self._all_exports = None
+
+    def lookup(self, name):
+        """
+        Looks up the export information for name, walking only the path of the trie that matches it.
+
+        :return: the export information, or None if name is not exported
+        """
+        if self._all_exports is not None:
+            return self._all_exports.get(name.decode() if isinstance(name, bytes) else name)
+
+        if isinstance(name, str):
+            name = name.encode()
+
+        node = self._find_node(name, prefix=False)
+        return self._read_terminal(node[0]) if node is not None else None
+
+    def iter_prefix(self, prefix):
+        """
+        Iterates over all exports whose names start with prefix, visiting only the part of the trie below it.
+
+        :return: a generator of (name, export information) tuples
+        """
+        if isinstance(prefix, str):
+            prefix = prefix.encode()
+
+        node = self._find_node(prefix, prefix=True)
+        if node is None:
+            return
+
+        nodes_to_do = [node]
+        visited = set()
+        while nodes_to_do:
+            offset, name = nodes_to_do.pop()
+            self._visit(offset, visited)
+            info = self._read_terminal(offset)
+            if info is not None:
+                yield name.decode(), info
+            # push in reverse, so that children are visited in the order they are stored
+            nodes_to_do.extend(reversed([(child, name + label) for label, child in self._children(offset)]))
+
+    def materialize(self):
+        """
+        Reads the whole trie. The result is cached and used for all further lookups.
+
+        :return: a dict mapping each exported name to its export information
+        """
+        if self._all_exports is None:
+            l.debug("Parsing exports")
+            self._all_exports = dict(self.iter_prefix(b''))
+            l.debug("Done parsing exports")
+        return self._all_exports
+
+    def _find_node(self, name, prefix):
+        """
+        Walks the trie along name.
+
+        :param prefix: whether name may also end inside of an edge label
+        :return: (node offset, name of the node) or None if there is no such node
+        """
+        if not self.blob:
+            return None
+
+        offset = 0
+        matched = 0
+        visited = set()
+        while matched < len(name):
+            self._visit(offset, visited)
+            for label, child in self._children(offset):
+                if name.startswith(label, matched):
+                    matched += len(label)
+                    break
+                if prefix and label.startswith(name[matched:]):
+                    # the prefix ends inside of this edge label
+                    return child, name[:matched] + label
+            else:
+                return None
+            offset = child
+        return offset, name
+
+    @staticmethod
+    def _visit(offset, visited):
+        """
+        Records that the node at offset is walked. Every node of a trie has only one parent, so a node which is
+        reached twice means the edges of the trie form a loop.
+        """
+        if offset in visited:
+            l.error("Loop in exports trie @ %#x", offset)
+            raise CLEInvalidBinaryError()
+        visited.add(offset)
+
+    def _children(self, offset):
+        """
+        :return: a list of (edge label, child node offset) tuples of the node at offset
+        """
+        blob = self.blob
+        try:
+            terminal_size, index = read_uleb(blob, offset)
+            index += offset + terminal_size
+            child_count = blob[index]
+            index += 1
+
+            children = []
+            for _ in range(child_count):
+                label_end = blob.index(b'\0', index)
+                label = blob[index:label_end]
+                if not label:
+                    # nothing would be matched by following this edge
+                    l.error("Empty edge label in exports trie node @ %#x", offset)
+                    raise CLEInvalidBinaryError()
+                child, size = read_uleb(blob, label_end + 1)
+                index = label_end + 1 + size
+                children.append((label, child))
+        except (IndexError, ValueError):
+            l.error("Malformed exports trie node @ %#x", offset)
+            raise CLEInvalidBinaryError()
+
+        return children
+
+    def _read_terminal(self, offset):
+        """
+        :return: the export information stored in the node at offset, or None if it has none
+        """
+        blob = self.blob
+        try:
+            terminal_size, index = read_uleb(blob, offset)
+            if terminal_size == 0:
+                return None
+            index += offset
+
+            flags, size = read_uleb(blob, index)
+            index += size
+            if flags & EXPORT_SYMBOL_FLAGS_REEXPORT:
+                # REEXPORT: uleb: lib ordinal, zero-term str
+                lib_ordinal, size = read_uleb(blob, index)
+                index += size
+                lib_sym_name = blob[index:blob.index(b'\0', index)]
+                return flags, lib_ordinal, lib_sym_name.decode()
+            elif flags & EXPORT_SYMBOL_FLAGS_STUB_AND_RESOLVER:
+                # STUB_AND_RESOLVER: uleb: stub offset, uleb: resolver offset
+                stub_offset, size = read_uleb(blob, index)
+                index += size
+                resolver_offset, _ = read_uleb(blob, index)
+                return flags, stub_offset, resolver_offset
+            else:
+                # normal: offset from mach header, or an absolute value
+                symbol_offset, _ = read_uleb(blob, index)
+                if flags & EXPORT_SYMBOL_FLAGS_KIND_MASK == EXPORT_SYMBOL_FLAGS_KIND_ABSOLUTE:
+                    return flags, symbol_offset
+                return flags, symbol_offset + self.base_addr
+        except ValueError:
+            l.error("Malformed exports trie node @ %#x", offset)
+            raise CLEInvalidBinaryError()
+
+    def __getitem__(self, name):
+        info = self.lookup(name)
+        if info is None:
+            raise KeyError(name)
+        return info
+
+    def __contains__(self, name):
+        return self.lookup(name) is not None
+
+    def __iter__(self):
+        return iter(self.materialize())
+
+    def __len__(self):
+        return len(self.materialize())
+
+    def __repr__(self):
+        return '<ExportTrie (%d bytes)>' % len(self.blob)
+
+
+class ExportIndex(object):
+    """
+    The Mach-O objects of a loader in the order they were loaded, which flat lookups search for the first one that
+    exports a name.
+
+    Images are only recorded when they are added, see :meth:`add`. Their exports tries are read on demand by
+    :meth:`lookup`, which remembers what it found for each name. Names which are re-exported from a library that is
+    not loaded do not resolve, so they are left to the images after.
+    """
+
+    def __init__(self):
+        self.images = []
+        self._exports = {}  # name => (image, mapped address), or None if no image exports it
+
+    def add(self, images):
+        """
+        Adds images to the end of the search order. They have to be mapped already.
+        """
+        if images:
+            self.images.extend(images)
+            # the new images may export what was not found so far
+            self._exports = dict((name, export) for name, export in self._exports.items() if export is not None)
+
+    def lookup(self, name):
+        """
+        :return: (image, mapped address) of the first image exporting name, or None if no image does
+        """
+        try:
+            return self._exports[name]
+        except KeyError:
+            pass
+
+        export = None
+        for image in self.images:
+            address = image.resolve_export(name)
+            if address is not None:
+                export = (image, address)
+                break
+        self._exports[name] = export
+        return export
@@ -0,0 +1,104 @@
+# -*-coding:utf8 -*-
+# This file is part of Mach-O Loader for CLE.
+
+import os
+import struct
+
+from macholib import MachO as MachOLoader
+from macholib import mach_o
+
+from ...errors import CLEInvalidBinaryError
+from ...utils import LRUCache
+
+import logging
+l = logging.getLogger('cle.backends.macho.fat')
+
+# nfat_arch after the magic
+_fat_header = struct.Struct('>I')
+# cputype, cpusubtype, offset, size, align
+_fat_arch = struct.Struct('>5I')
+# cputype, cpusubtype, offset, size, align, reserved
+_fat_arch_64 = struct.Struct('>2I2Q2I')
+# the magic of a mach header decides the byte order of its cputype, cpusubtype and filetype
+_mach_header_start = struct.Struct('>I')
+
+# path => (size, mtime, slices) of the most recently probed files, see probe_slices
+_slices_cache = LRUCache(1024)
+
+
+def _probe_mach_header(stream, offset, size):
+    """:return: (cputype, cpusubtype, filetype, offset, size) of the Mach-O at offset"""
+    stream.seek(offset)
+    blob = stream.read(16)
+    if len(blob) < 16:
+        l.error("Truncated mach header @ %#x", offset)
+        raise CLEInvalidBinaryError()
+
+    magic, = _mach_header_start.unpack_from(blob, 0)
+    if magic in (mach_o.MH_MAGIC, mach_o.MH_MAGIC_64):
+        endian = '>'
+    elif magic in (mach_o.MH_CIGAM, mach_o.MH_CIGAM_64):
+        endian = '<'
+    else:
+        l.error("Unknown mach header magic %#x @ %#x", magic, offset)
+        raise CLEInvalidBinaryError()
+
+    cputype, cpusubtype, filetype = struct.unpack_from(endian + '3I', blob, 4)
+    return cputype, cpusubtype, filetype, offset, size
+
+
+def _probe_stream(stream):
+    stream.seek(0)
+    magic, = _mach_header_start.unpack(stream.read(4))
+    if magic not in (mach_o.FAT_MAGIC, mach_o.FAT_MAGIC_64):
+        stream.seek(0, os.SEEK_END)
+        return [_probe_mach_header(stream, 0, stream.tell())]
+
+    nfat_arch, = _fat_header.unpack(stream.read(4))
+    fat_arch = _fat_arch_64 if magic == mach_o.FAT_MAGIC_64 else _fat_arch
+    blob = stream.read(nfat_arch * fat_arch.size)
+    if len(blob) < nfat_arch * fat_arch.size:
+        l.error("Truncated fat header")
+        raise CLEInvalidBinaryError()
+
+    return [_probe_mach_header(stream, fields[2], fields[3]) for fields in fat_arch.iter_unpack(blob)]
+
+
+def probe_slices(spec):
+    """
+    Reads only the fat header and the mach header of each slice of a Mach-O, without parsing any load commands. The
+    result for a path is cached until its size or modification time changes, for the most recently probed paths.
+
+    :param spec: a path or a stream
+    :return: a list of (cputype, cpusubtype, filetype, offset, size) tuples, one for each slice
+    """
+    if hasattr(spec, 'read') and hasattr(spec, 'seek'):
+        return _probe_stream(spec)
+
+    st = os.stat(spec)
+    cached = _slices_cache.get(spec)
+    if cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+        return cached[2]
+
+    with open(spec, 'rb') as f:
+        slices = _probe_stream(f)
+    _slices_cache[spec] = (st.st_size, st.st_mtime_ns, slices)
+    return slices
+
+
+class MachOSlice(MachOLoader.MachO):
+    """
+    A macholib MachO for a single slice of a (FAT) Mach-O, so that the load commands of the other slices are not
+    parsed. headers holds just the MachOHeader of the slice.
+    """
+
+    def __init__(self, stream, offset, size, filename=None):  # pylint: disable=super-init-not-called
+        # what MachOLoader.MachO.__init__ sets, without it loading every slice
+        self.graphident = filename
+        self.filename = filename
+        self.loader_path = os.path.dirname(filename) if filename is not None else None
+        self.fat = None
+        self.headers = []
+        self.allow_unknown_load_commands = False
+
+        self.load_header(stream, offset, size)
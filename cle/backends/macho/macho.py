@@ -2,21 +2,31 @@
 # This file is part of Mach-O Loader for CLE.
 # Contributed December 2016 by Fraunhofer SIT (https://www.sit.fraunhofer.de/en/).
 
-from os import SEEK_CUR, SEEK_SET
+import bisect
+import os
 import struct
 import sys
-from io import BytesIO
+from array import array
+from itertools import accumulate, chain
 import archinfo
 
 from macholib import MachO as MachOLoader
-from macholib import SymbolTable as MachOLoaderSymbolTable
 from macholib import mach_o 
-from .section import MachOSection
+from .section import MachOSection, S_NON_LAZY_SYMBOL_POINTERS, S_LAZY_SYMBOL_POINTERS, S_SYMBOL_STUBS, \
+    S_LAZY_DYLIB_SYMBOL_POINTERS, S_THREAD_LOCAL_VARIABLE_POINTERS
 from .symbol import SymbolTableSymbol
 from .segment import MachOSegment
-from .binding import BindingHelper, read_uleb
+from .binding import BindingHelper, decode_bind_blob, read_uleb_array
+from .export_trie import ExportTrie, EXPORT_SYMBOL_FLAGS_KIND_MASK, EXPORT_SYMBOL_FLAGS_KIND_ABSOLUTE, \
+    EXPORT_SYMBOL_FLAGS_REEXPORT, EXPORT_SYMBOL_FLAGS_STUB_AND_RESOLVER
+from .fat import probe_slices, MachOSlice
+from .rebase import decode_rebase_blob, apply_rebase_table
+from .chained_fixups import decode_chained_fixups, apply_chained_fixups, LC_DYLD_CHAINED_FIXUPS, \
+    LC_DYLD_EXPORTS_TRIE
 from .. import Backend, register_backend
-from ...utils import stream_or_path
+from ...utils import stream_or_path, get_mmaped_backers
+from ...patched_stream import PatchedStream
+from ...address_translator import AT
 from ...errors import CLEInvalidBinaryError, CLECompatibilityError, CLEOperationError, CLEError
 
 import logging
@@ -35,6 +45,16 @@ __all__ = ('MachO', 'MachOSection', 'MachOSegment')
 # Enable checking for encrypted machos 
 # Handle the rest of the load cmds
 
+_arch_lookup = {
+    # contains all supported architectures. Note that apple deviates from standard ABI, see Apple docs
+    # XXX: these are referred to differently in mach/machine.h
+    0x100000c: "aarch64", # arm64
+    0xc: "arm",
+    0x7: "x86",
+    0x1000007: "amd64", # x64, amd64
+}
+
+
 class MachO(Backend):
     """
     Mach-O binaries for CLE
@@ -43,7 +63,8 @@ class MachO(Backend):
     *   Sections are always part of a segment, self.sections will thus be empty
     *   Symbols cannot be categorized like in ELF
     *   Symbol resolution must be handled by the binary
-    *   Rebasing cannot be done statically (i.e. self.mapped_base is ignored for now)
+    *   Rebasing is done by applying the rebase opcodes of the dyld info, or the rebases of the chained fixups, when
+        the image is mapped elsewhere
     *   ...
     *   In the case that the file loaded is not a corefile, this simulates the 
     *   dyld initialization routines.
@@ -57,27 +78,7 @@ class MachO(Backend):
 
         super(MachO, self).__init__(binary, **kwargs)
 
-        parsed_macho = MachOLoader.MachO(self.binary)
-
-        # First try to see which arch the main binary has
-        # Then try to match it to its dependencies
-        if not self.is_main_bin:
-            # target_arch prefrence goes to main bin...
-            target_arch = self.loader.main_object.arch.name.lower()
-
-        # If we have a target_arch, try to match it up with one of the FAT slices
-        if target_arch:
-            self._header = self.match_target_arch_to_header(target_arch, parsed_macho.headers)
-            if not self._header:
-                print(self.binary)
-                # Print out all architectures found?
-                raise CLEError("Couldn't find architecture %s" % target_arch)
-
-        # Otherwise, we'll just pick one..
-        else:
-            if len(parsed_macho.headers) > 1:
-                l.warning('No target slice specified. Picking one at random.. Good luck!')
-            self._header = parsed_macho.headers[0]
+        self._header = self._load_header(target_arch)
 
         arch_ident = self.get_arch_from_header(self._header.header)
 
@@ -97,25 +98,40 @@ class MachO(Backend):
 
         self.flags = None  # binary flags
         self.imported_libraries = ["Self"]  # ordinal 0 = SELF_LIBRARY_ORDINAL
+        self.reexported_ordinals = []  # ordinals of the imported libraries whose exports this binary re-exports
 
         # This was what was historically done: self.sections_by_ordinal.extend(seg.sections)
         self.sections_by_ordinal = [None] # ordinal 0 = None == Self
 
-        self.exports_by_name = {}  # note exports is currently a raw and unprocessed datastructure.
-        # If we intend to use it we must first upgrade it to a class or somesuch
+        self.exports_by_name = {}  # an ExportTrie once the load commands are parsed, see there for the values
         self.entryoff = None
         self.unixthread_pc = None
         self.os = "Darwin"
         
+        self.rebase_blob = None  # rebasing information
         self.export_blob = None  # exports trie
         self.binding_blob = None  # binding information
         self.lazy_binding_blob = None  # lazy binding information
         self.weak_binding_blob = None  # weak binidng information
-        self.binding_done = False # if true binding was already done and do_bind will be a no-op
+        self.chained_fixups_blob = None  # chained fixups, which replace the rebasing and binding information
+        self.binding_done = False # if true binding was already done and do_binding will be a no-op
+        self.bind_table = None  # the decoded binding_blob
+        self.lazy_bind_table = None  # the decoded lazy_binding_blob
+        self.weak_bind_table = None  # the decoded weak_binding_blob
+        self.chained_fixups = None  # the decoded chained_fixups_blob
+        self._imported_objects = {}  # ordinal => loaded MachO, see get_imported_library
+        self._export_addresses = {}  # name => mapped address, see resolve_export
+
+        # linked addresses of the functions listed in LC_FUNCTION_STARTS, sorted
+        self.lc_function_starts = array('Q')
+        # the data in code entries of LC_DATA_IN_CODE sorted by their linked address, see is_data_in_code
+        self.data_in_code_addresses = array('Q')
+        self.data_in_code_lengths = array('H')
+        self.data_in_code_kinds = array('H')
 
         # Module level constructors / destructors
         self.mod_init_func_pointers = []
-        self.mod_term_func_ponters = []
+        self.mod_term_func_pointers = []
 
         # Library dependencies.
         self.linking = 'dynamic' # static is impossible in macos... kinda 
@@ -124,6 +140,16 @@ class MachO(Backend):
         # This is has to be separate from self.symbols because the latter is sorted by address
         self._ordered_symbols = []
 
+        # Symbol names are not unique, so these map a name resp. a (name, library ordinal) pair to the list of symbols
+        # carrying it, in the order they were added. Symbols must be added through _add_symbol to keep them current.
+        self._symbols_by_name = {}
+        self._symbols_by_name_and_ordinal = {}
+        self._strtab = None  # the string table, while the symbol table is loaded
+        # linked address of a stub or symbol pointer => the symbol it refers to, see _load_indirect_symbols
+        self.indirect_symbols = {}
+        # address => the symbols at it or bound to it, in the order they were added, see get_symbol_by_address_fuzzy
+        self._symbols_by_address = {}
+
         self.segments = []
 
         if self.is_main_bin:
@@ -133,12 +159,45 @@ class MachO(Backend):
         self._parse_load_cmds()
         #self._parse_symbols(binary_file)
         self._parse_mod_funcs()
-        self._handle_rebase_info()
 
-        if self.is_main_bin:
-            # XXX: remove this after binding_helper is fixed.
-            # This is only for helping debug it
-            self._handle_bindings()
+        # the binding opcodes refer to the segments at their linked addresses, so they are decoded before rebasing.
+        # Binding itself happens once all images of the loader are mapped, see do_binding. Without a loader there
+        # are no other images, so the imports stay unresolved
+        self._decode_bindings()
+        if self.loader is None:
+            self.do_binding()
+
+    def _load_header(self, target_arch):
+        """
+        Picks the mach header to load and parses the load commands of just that slice
+
+        :param target_arch: the architecture of the FAT slice to load, or None
+        :return: the macholib MachOHeader
+        """
+        slices = probe_slices(self.binary if self.binary is not None else self.binary_stream)
+
+        # First try to see which arch the main binary has
+        # Then try to match it to its dependencies
+        if not self.is_main_bin:
+            # target_arch prefrence goes to main bin...
+            target_arch = self.loader.main_object.arch.name.lower()
+
+        # If we have a target_arch, try to match it up with one of the FAT slices
+        if target_arch:
+            matches = [s for s in slices if self.get_arch_from_cputype(s[0]) == target_arch]
+            if not matches:
+                print(self.binary)
+                # Print out all architectures found?
+                raise CLEError("Couldn't find architecture %s" % target_arch)
+            chosen = matches[0]
+        else:
+            # Otherwise, we'll just pick one..
+            if len(slices) > 1:
+                l.warning('No target slice specified. Picking one at random.. Good luck!')
+            chosen = slices[0]
+
+        _, _, _, offset, size = chosen
+        return MachOSlice(self.binary_stream, offset, size, self.binary).headers[0]
 
     def _handle_segment_load_command(self, macholib_seginfo, macholib_secinfo):
         seg = MachOSegment(macholib_seginfo, macholib_secinfo) 
@@ -149,11 +208,39 @@ class MachO(Backend):
         for seg in self.segments:
             if seg.segname == '__PAGEZERO':
                 continue
-            blob = self._read(self.binary_stream, self._header.offset + seg.offset, seg.filesize)
-            if seg.filesize < seg.memsize:
-                blob += b'\0' * (seg.memsize - seg.filesize)  # padding
+            # map the file copy-on-write if we can, so that only the pages which are actually touched get read
+            backers = get_mmaped_backers(self.binary_stream, self._header.offset + seg.offset, seg.filesize,
+                                         max(seg.filesize, seg.memsize))
+            if backers is None:
+                blob = self._read(self.binary_stream, self._header.offset + seg.offset, seg.filesize)
+                if seg.filesize < seg.memsize:
+                    blob += b'\0' * (seg.memsize - seg.filesize)  # padding
+                backers = [(0, blob)]
+
+            for offset, blob in backers:
+                self.memory.add_backer(seg.vaddr - self.linked_base + offset, blob)
+
+    def _handle_dylib_load_command(self, cmd_name, install_name):
+        self.imported_libraries.append(install_name)
+        if cmd_name == 'LC_REEXPORT_DYLIB':
+            self.reexported_ordinals.append(len(self.imported_libraries) - 1)
+
+        # the loader cannot expand these, so let it search the remaining relative path in the load path instead
+        for prefix in ('@rpath/', '@executable_path/', '@loader_path/'):
+            if install_name.startswith(prefix):
+                install_name = install_name[len(prefix):]
+                break
+        self.deps.append(install_name)
 
-            self.memory.add_backer(seg.vaddr - self.linked_base, blob)
+    def _handle_rpath_command(self, path):
+        if self.binary is None:
+            return
+        binary_dir = os.path.dirname(self.binary)
+        for prefix in ('@executable_path', '@loader_path'):
+            if path.startswith(prefix):
+                path = binary_dir + path[len(prefix):]
+                break
+        self.extra_load_path.append(path)
 
     def _handle_main_load_command(self, entry_point_command):
         # What do I do with stacksize? :x
@@ -167,115 +254,43 @@ class MachO(Backend):
         """
         Extracts information blobs for rebasing, binding and export
         """
-        f = self.binary_stream
-
-        def blob_or_None(f,off,size): # helper
-            return self._read(f,off,size) if off != 0 and size != 0 else None
-
         # Extract data blobs
-        self.rebase_blob = blob_or_None(f, dyld_info_cmd.rebase_off, dyld_info_cmd.rebase_size)
-        self.binding_blob = blob_or_None(f, dyld_info_cmd.bind_off, dyld_info_cmd.bind_size)
-        self.weak_binding_blob = blob_or_None(f, dyld_info_cmd.weak_bind_off, dyld_info_cmd.weak_bind_size)
-        self.lazy_binding_blob = blob_or_None(f, dyld_info_cmd.lazy_bind_off, dyld_info_cmd.lazy_bind_size)
-        self.export_blob = blob_or_None(f, dyld_info_cmd.export_off, dyld_info_cmd.export_size)
-
-    def _handle_rebase_info(self):
-        if not self.rebase_blob: 
-            return
+        self.rebase_blob = self._read_linkedit(dyld_info_cmd.rebase_off, dyld_info_cmd.rebase_size)
+        self.binding_blob = self._read_linkedit(dyld_info_cmd.bind_off, dyld_info_cmd.bind_size)
+        self.weak_binding_blob = self._read_linkedit(dyld_info_cmd.weak_bind_off, dyld_info_cmd.weak_bind_size)
+        self.lazy_binding_blob = self._read_linkedit(dyld_info_cmd.lazy_bind_off, dyld_info_cmd.lazy_bind_size)
+        self.export_blob = self._read_linkedit(dyld_info_cmd.export_off, dyld_info_cmd.export_size)
 
-    def _handle_export_info(self):
-        """
-        Parses the exports trie
+    def _read_linkedit(self, offset, size):
         """
-        l.debug("Parsing exports")
-        blob = self.export_blob
-        if blob is None:
-            l.debug("Parsing exports done: No exports found")
-            return
+        Reads a blob referenced by a load command, with offset relative to the start of the Mach-O in the file
 
-        # Note some of these fields are currently not used, keep them in to make used variables explicit
-        index = 0
-        sym_str = b''
-        # index,str
-        nodes_to_do = [(0, b'')]
-        blob_f = BytesIO(blob)  # easier to handle seeking here
-
-        # constants
-        #FLAGS_KIND_MASK = 0x03
-        #FLAGS_KIND_REGULAR = 0x00
-        #FLAGS_KIND_THREAD_LOCAL = 0x01
-        #FLAGS_WEAK_DEFINITION = 0x04
-        FLAGS_REEXPORT = 0x08
-        FLAGS_STUB_AND_RESOLVER = 0x10
-
-        try:
-            while True:
-                index, sym_str = nodes_to_do.pop()
-                l.debug("Processing node %#x %r", index, sym_str)
-                blob_f.seek(index, SEEK_SET)
-                info_len = struct.unpack("B", blob_f.read(1))[0]
-                if info_len > 127:
-                    # special case
-                    blob_f.seek(-1, SEEK_CUR)
-                    tmp = read_uleb(blob, blob_f.tell())  # a bit kludgy
-                    info_len = tmp[0]
-                    blob_f.seek(tmp[1], SEEK_CUR)
-
-                if info_len > 0:
-                    # a symbol is complete
-                    tmp = read_uleb(blob, blob_f.tell())
-                    blob_f.seek(tmp[1], SEEK_CUR)
-                    flags = tmp[0]
-                    if flags & FLAGS_REEXPORT:
-                        # REEXPORT: uleb:lib ordinal, zero-term str
-                        tmp = read_uleb(blob, blob_f.tell())
-                        blob_f.seek(tmp[1], SEEK_CUR)
-                        lib_ordinal = tmp[0]
-                        lib_sym_name = b''
-                        char = blob_f.read(1)
-                        while char != b'\0':
-                            lib_sym_name += char
-                            char = blob_f.read(1)
-                        l.info("Found REEXPORT export %r: %d,%r", sym_str, lib_ordinal, lib_sym_name)
-                        self.exports_by_name[sym_str.decode()] = (flags, lib_ordinal, lib_sym_name.decode())
-                    elif flags & FLAGS_STUB_AND_RESOLVER:
-                        # STUB_AND_RESOLVER: uleb: stub offset, uleb: resovler offset
-                        l.warning("EXPORT: STUB_AND_RESOLVER found")
-                        tmp = read_uleb(blob, blob_f.tell())
-                        blob_f.seek(tmp[1], SEEK_CUR)
-                        stub_offset = tmp[0]
-                        tmp = read_uleb(blob, blob_f.tell())
-                        blob_f.seek(tmp[1], SEEK_CUR)
-                        resolver_offset = tmp[0]
-                        l.info("Found STUB_AND_RESOLVER export %r: %#x,%#x'", sym_str, stub_offset, resolver_offset)
-                        self.exports_by_name[sym_str.decode()] = (flags, stub_offset, resolver_offset)
-                    else:
-                        # normal: offset from mach header
-                        tmp = read_uleb(blob, blob_f.tell())
-                        blob_f.seek(tmp[1], SEEK_CUR)
-                        symbol_offset = tmp[0] + self.segments[1].vaddr
-                        l.info("Found normal export %r: %#x", sym_str, symbol_offset)
-                        self.exports_by_name[sym_str.decode()] = (flags, symbol_offset)
-
-                child_count = struct.unpack("B", blob_f.read(1))[0]
-                for i in range(0, child_count):
-                    child_str = sym_str
-                    char = blob_f.read(1)
-                    while char != b'\0':
-                        child_str += char
-                        char = blob_f.read(1)
-                    tmp = read_uleb(blob, blob_f.tell())
-                    blob_f.seek(tmp[1], SEEK_CUR)
-                    next_node = tmp[0]
-                    l.debug("%d. child: (%#x, %r)", i, next_node, child_str)
-                    nodes_to_do.append((next_node, child_str))
-
-        except IndexError:
-            # List is empty we are done!
-            l.debug("Done parsing exports")
+        :return: the blob, or None if offset or size is 0
+        """
+        if offset == 0 or size == 0:
+            return None
+        return self._read(self.binary_stream, self._header.offset + offset, size)
+
+    def rebase(self):
+        # the rebase opcodes refer to the segments at their linked addresses, so decode them before moving those
+        delta = self.image_base_delta
+        table = None
+        if delta and self.rebase_blob:
+            table = decode_rebase_blob(self.rebase_blob, self.segments, self.arch.bits == 64)
+
+        super(MachO, self).rebase()
+
+        if table is not None:
+            l.debug("Applying %d rebases for a slide of %#x", len(table), delta)
+            apply_rebase_table(self, table, delta)
+        if delta and self.chained_fixups is not None:
+            l.debug("Applying the rebases of %d chained fixups for a slide of %#x", len(self.chained_fixups), delta)
+            apply_chained_fixups(self, self.chained_fixups, delta=delta)
 
     def _parse_load_cmds(self):
         has_symbol_table = False
+        function_starts_cmd = None
+        data_in_code_cmd = None
 
         unhandled_load_cmds = set()
         
@@ -288,18 +303,31 @@ class MachO(Backend):
             elif cmd_name == 'LC_MAIN':
                 self._handle_main_load_command(load_cmd_trie[1])
             elif cmd_name == 'LC_FUNCTION_STARTS':
-                # Should use this unless user explicitly turns off
-                # Store this and use it in CFGFast
-                pass
+                # the function starts are relative to a segment which may come later, so this is parsed last
+                function_starts_cmd = load_cmd_trie[1]
+            elif cmd_name == 'LC_DATA_IN_CODE':
+                data_in_code_cmd = load_cmd_trie[1]
             elif cmd_name == 'LC_SYMTAB':
                 has_symbol_table = True
             elif cmd_name == 'LC_LOAD_DYLINKER':
                 self.deps.append(load_cmd_trie[2].decode().strip('\x00'))
-            elif cmd_name == 'LC_LOAD_DYLIB':
-                self.deps.append(load_cmd_trie[2].decode().strip('\x00'))
+            elif cmd_name in ('LC_LOAD_DYLIB', 'LC_LOAD_WEAK_DYLIB', 'LC_REEXPORT_DYLIB', 'LC_LOAD_UPWARD_DYLIB',
+                              'LC_LAZY_LOAD_DYLIB'):
+                # each of these takes the next library ordinal
+                self._handle_dylib_load_command(cmd_name, load_cmd_trie[2].decode().strip('\x00'))
+            elif cmd_name == 'LC_ID_DYLIB':
+                self.provides = load_cmd_trie[2].decode().strip('\x00')
+            elif cmd_name == 'LC_RPATH':
+                self._handle_rpath_command(load_cmd_trie[2].decode().strip('\x00'))
             elif cmd_name == 'LC_DYLD_INFO' or cmd_name == 'LC_DYLD_INFO_ONLY':
                 # These two commands are handled identically in the dyld src code.
                 self._handle_dyld_info_command(load_cmd_trie[1])
+            elif cmd.cmd == LC_DYLD_CHAINED_FIXUPS:
+                # replaces the rebasing and binding information of LC_DYLD_INFO
+                self.chained_fixups_blob = self._read_linkedit(load_cmd_trie[1].dataoff, load_cmd_trie[1].datasize)
+            elif cmd.cmd == LC_DYLD_EXPORTS_TRIE:
+                # replaces the exports trie of LC_DYLD_INFO, if there are chained fixups
+                self.export_blob = self._read_linkedit(load_cmd_trie[1].dataoff, load_cmd_trie[1].datasize)
             elif cmd_name == 'LC_THREAD': # core file
                 l.error("Core file support not currently implemented.")
             else:
@@ -314,48 +342,121 @@ class MachO(Backend):
             l.warning(unhandled_load_cmds)
 
         seg_addrs = (x.vaddr for x in self.segments if x.segname != '__PAGEZERO')
-        self.linked_base = min(seg_addrs)
+        self.mapped_base = self.linked_base = min(seg_addrs)
+
+        self.exports_by_name = ExportTrie(self.export_blob, self.linked_base)
 
         self._map_segments()
 
         if has_symbol_table:
             self._load_symbol_table()
+            self._strtab = None
+        if function_starts_cmd is not None:
+            self._load_lc_function_starts(function_starts_cmd)
+        if data_in_code_cmd is not None:
+            self._load_lc_data_in_code(data_in_code_cmd)
 
     def _load_symbol_table(self):
-        stable = MachOLoaderSymbolTable.SymbolTable(self._header.parent)
-
-        # Parse out stable.extdefsyms
-        for esym in stable.extdefsyms:
-            sym = esym[0]
-            sym_str = esym[1] # No need to decode, apparently :-)
-            s = SymbolTableSymbol(self, sym_str, sym.n_type, sym.n_sect, sym.n_desc, sym.n_value - self.linked_base) 
-            self.symbols.add(s)
-
-        # Parse out stable.undefsyms
-        for usym in stable.undefsyms:
-            sym = usym[0]
-            sym_str = usym[1]
-            s = SymbolTableSymbol(self, sym_str, sym.n_type, sym.n_sect, sym.n_desc, sym.n_value - self.linked_base) 
-            self.symbols.add(s)
-
-        for lsym in stable.localsyms:
-            sym = lsym[0]
-            sym_str = lsym[1]
-            s = SymbolTableSymbol(self, sym_str, sym.n_type, sym.n_sect, sym.n_desc, sym.n_value - self.linked_base) 
-            self.symbols.add(s)
+        symtab = dysymtab = None
+        for load_cmd, cmd, _ in self._header.commands:
+            if load_cmd.cmd == mach_o.LC_SYMTAB:
+                symtab = cmd
+            elif load_cmd.cmd == mach_o.LC_DYSYMTAB:
+                dysymtab = cmd
+
+        if dysymtab is not None:
+            # the same order macholib's SymbolTable used to have
+            ranges = [(dysymtab.iextdefsym, dysymtab.nextdefsym),
+                      (dysymtab.iundefsym, dysymtab.nundefsym),
+                      (dysymtab.ilocalsym, dysymtab.nlocalsym)]
+        else:
+            ranges = [(0, symtab.nsyms)]
+
+        symbols = []
+        symbols_by_index = {}
+        for start, count in ranges:
+            for index, (sym_str, n_type, n_sect, n_desc, n_value) in \
+                    enumerate(self._iter_nlists(symtab, start, count), start):
+                symbol = SymbolTableSymbol(self, sym_str, n_type, n_sect, n_desc, n_value - self.linked_base)
+                symbols.append(symbol)
+                symbols_by_index[index] = symbol
+        self._add_symbols(symbols)
+
+        if dysymtab is not None and dysymtab.nindirectsyms:
+            self._load_indirect_symbols(dysymtab, symbols_by_index)
+
+    def _load_indirect_symbols(self, dysymtab, symbols_by_index):
+        """
+        Maps the entries of the symbol stub and symbol pointer sections to the symbols the indirect symbol table lists
+        for them. A section's reserved1 field is the index of its first entry in the indirect symbol table, stub
+        sections have the size of a stub in reserved2.
+
+        :param symbols_by_index: symbol table index => SymbolTableSymbol
+        """
+        blob = self._read_linkedit(dysymtab.indirectsymoff, dysymtab.nindirectsyms * 4)
+        if blob is None or len(blob) < dysymtab.nindirectsyms * 4:
+            l.warning("The indirect symbol table is truncated, ignoring it")
+            return
+        indirect_table = struct.unpack(self.struct_byteorder + "%dI" % dysymtab.nindirectsyms, blob)
+
+        for seg in self.segments:
+            for sec in seg.sections:
+                if sec.type == S_SYMBOL_STUBS:
+                    stride = sec.reserved2
+                    is_stub = True
+                elif sec.type in (S_NON_LAZY_SYMBOL_POINTERS, S_LAZY_SYMBOL_POINTERS, S_LAZY_DYLIB_SYMBOL_POINTERS,
+                                  S_THREAD_LOCAL_VARIABLE_POINTERS):
+                    stride = self.arch.bytes
+                    is_stub = False
+                else:
+                    continue
+                if stride == 0:
+                    l.warning("Section %s,%s has entries of size 0", sec.segname, sec.sectname)
+                    continue
+
+                for i, index in enumerate(indirect_table[sec.reserved1:sec.reserved1 + sec.memsize // stride]):
+                    # INDIRECT_SYMBOL_LOCAL and INDIRECT_SYMBOL_ABS entries have no symbol
+                    symbol = symbols_by_index.get(index)
+                    if symbol is None:
+                        continue
+                    address = sec.vaddr + i * stride
+                    self.indirect_symbols[address] = symbol
+                    if is_stub:
+                        symbol.symbol_stubs.append(address)
+
+    def _iter_nlists(self, symtab, start, count):
+        """
+        Decodes count entries of the symbol table, starting with the entry with index start
+
+        :param symtab: the symtab_command
+        :return: a generator of (name, n_type, n_sect, n_desc, n_value) tuples
+        """
+        nlist = struct.Struct(self.struct_byteorder + ("IBBHQ" if self.arch.bits == 64 else "IBBHI"))
+        blob = self._read_linkedit(symtab.symoff + start * nlist.size, count * nlist.size)
+        if blob is None:
+            return
+
+        if self._strtab is None:
+            self._strtab = self._read_linkedit(symtab.stroff, symtab.strsize) or b''
+        strtab = self._strtab
+
+        for n_strx, n_type, n_sect, n_desc, n_value in nlist.iter_unpack(blob[:len(blob) - len(blob) % nlist.size]):
+            if n_strx == 0:
+                yield '', n_type, n_sect, n_desc, n_value
+                continue
+            end = strtab.find(b'\0', n_strx)
+            name = strtab[n_strx:end if end != -1 else len(strtab)].decode('utf-8', errors='replace')
+            yield name, n_type, n_sect, n_desc, n_value
 
     # XXX: Should this be case insensitive?
     @staticmethod
     def get_arch_from_header(header):
-        arch_lookup = {
-            # contains all supported architectures. Note that apple deviates from standard ABI, see Apple docs
-            # XXX: these are referred to differently in mach/machine.h
-            0x100000c: "aarch64", # arm64
-            0xc: "arm",
-            0x7: "x86",
-            0x1000007: "amd64", # x64, amd64
-        }
-        return arch_lookup[header.cputype]
+        return _arch_lookup[header.cputype]
+
+    @staticmethod
+    def get_arch_from_cputype(cputype):
+        """:return: the name of the architecture with the given cputype, or None if it is not supported"""
+        return _arch_lookup.get(cputype)
 
     @staticmethod
     def match_target_arch_to_header(target_arch, headers):
@@ -370,9 +471,8 @@ class MachO(Backend):
             if not cls.is_compatible(stream):
                 return False
 
-        # It's definitely a MachO
-        parsed_macho = MachOLoader.MachO(spec)
-        archs = set(MachO.get_arch_from_header(mach_header.header) for mach_header in parsed_macho.headers)
+        # It's definitely a MachO, only its mach headers are needed to tell the architectures of its slices
+        archs = set(MachO.get_arch_from_cputype(cputype) for cputype, _, _, _, _ in probe_slices(spec))
         if main_obj.arch.name.lower() in archs:
             return True
 
@@ -396,11 +496,11 @@ class MachO(Backend):
 
     @property
     def initializers(self):
-        return self.mod_init_func_pointers
+        return [AT.from_lva(addr, self).to_mva() for addr in self.mod_init_func_pointers]
 
     @property
     def finalizers(self):
-        return self.mod_term_func_ponters
+        return [AT.from_lva(addr, self).to_mva() for addr in self.mod_term_func_pointers]
 
     #def is_thumb_interworking(self, address):
     #    """Returns true if the given address is a THUMB interworking address"""
@@ -464,31 +564,128 @@ class MachO(Backend):
     #    """Convenience"""
     #    return self._unpack_with_byteorder(fmt, self._read(fp, offset, size))
 
-    def _handle_bindings(self):
-        # Perform binding
+    def _decode_bindings(self):
+        is_64 = self.arch.bits == 64
+        if self.binding_blob:
+            self.bind_table = decode_bind_blob(self.binding_blob, self.segments, is_64)
+        if self.lazy_binding_blob:
+            self.lazy_bind_table = decode_bind_blob(self.lazy_binding_blob, self.segments, is_64, lazy=True)
+        if self.weak_binding_blob:
+            self.weak_bind_table = decode_bind_blob(self.weak_binding_blob, self.segments, is_64)
+        if self.chained_fixups_blob:
+            # the chains are stored in the pointers themselves, so they have to be read before anything is bound
+            self.chained_fixups = decode_chained_fixups(self.chained_fixups_blob, self.memory, self.linked_base)
+            # the chains are replaced by the linked pointers right away, and the binds by zeros until they are bound.
+            # Objects which are not moved need no other rebasing
+            apply_chained_fixups(self, self.chained_fixups, [None] * len(self.chained_fixups.imports), 0)
+
+    def do_binding(self):
+        """
+        Performs the non-lazy and lazy bindings of this binary, or the binds of its chained fixups. Imports are
+        resolved against the exports of the other Mach-O objects of the loader, so this is done by the loader once all
+        of them are mapped.
+        """
         if self.binding_done:
             l.warning("Binding already done, reset self.binding_done to override if you know what you are doing")
             return
 
         bh = BindingHelper(self)  # TODO: Make this configurable
-        bh.do_normal_bind(self.binding_blob)
-        bh.do_lazy_bind(self.lazy_binding_blob)
-        if self.weak_binding_blob is not None and len(self.weak_binding_blob) > 0:
+        if self.bind_table is not None:
+            bh.apply_bind_table(self.bind_table)
+        if self.lazy_bind_table is not None:
+            bh.apply_bind_table(self.lazy_bind_table)
+        if self.chained_fixups is not None:
+            bh.apply_chained_fixups(self.chained_fixups)
+        if self.weak_bind_table is not None:
             l.info("Found weak binding blob. According to current state of knowledge, weak binding "
                    "is only sensible if multiple binaries are involved and is thus skipped.")
 
         self.binding_done = True
 
-    def _load_lc_data_in_code(self, f, off):
+    def get_imported_library(self, ordinal):
+        """
+        Returns the loaded object for the library with the given ordinal, or None if it is not loaded
+        """
+        if ordinal not in self._imported_objects:
+            obj = None
+            if self.loader is not None and 0 < ordinal < len(self.imported_libraries):
+                obj = self.loader.find_object(self.imported_libraries[ordinal])
+            self._imported_objects[ordinal] = obj if isinstance(obj, MachO) else None
+        return self._imported_objects[ordinal]
+
+    def resolve_export(self, name, _visited=None):
+        """
+        Looks up the address this binary exports name at, following re-exports into other loaded objects.
+
+        :param name: the name of the export
+        :return: the mapped address of the export, or None if it is neither exported by this binary nor by any
+                 library it re-exports
+        """
+        if name in self._export_addresses:
+            return self._export_addresses[name]
+
+        # re-exports may refer to each other. Only complete lookups are cached, the others may have been cut short
+        top_level = _visited is None
+        if top_level:
+            _visited = set()
+        if (id(self), name) in _visited:
+            return None
+        _visited.add((id(self), name))
+
+        address = None
+        export = self.exports_by_name.lookup(name)
+        if export is not None:
+            flags = export[0]
+            if flags & EXPORT_SYMBOL_FLAGS_REEXPORT:
+                lib = self.get_imported_library(export[1])
+                if lib is not None:
+                    address = lib.resolve_export(export[2] or name, _visited)
+            elif flags & EXPORT_SYMBOL_FLAGS_STUB_AND_RESOLVER:
+                # we cannot run the resolver, the stub will have to do
+                address = AT.from_lva(self.linked_base + export[1], self).to_mva()
+            elif flags & EXPORT_SYMBOL_FLAGS_KIND_MASK == EXPORT_SYMBOL_FLAGS_KIND_ABSOLUTE:
+                address = export[1]
+            else:
+                address = AT.from_lva(export[1], self).to_mva()
+        else:
+            for ordinal in self.reexported_ordinals:
+                lib = self.get_imported_library(ordinal)
+                if lib is not None:
+                    address = lib.resolve_export(name, _visited)
+                    if address is not None:
+                        break
+
+        if top_level:
+            self._export_addresses[name] = address
+        return address
+
+    def _load_lc_data_in_code(self, data_in_code_cmd):
         l.debug("Parsing data in code")
 
-        (_, _, dataoff, datasize) = self._unpack("4I", f, off, 16)
-        for i in range(dataoff, datasize, 8):
-            blob = self._unpack("IHH", f, i, 8)
-            self.lc_data_in_code.append(blob)
+        blob = self._read_linkedit(data_in_code_cmd.dataoff, data_in_code_cmd.datasize)
+        if blob is None:
+            return
+
+        # offset from the mach header, length, kind. The linker emits them sorted, but nothing guarantees that
+        entry = struct.Struct(self.struct_byteorder + "IHH")
+        entries = sorted(entry.iter_unpack(blob[:len(blob) - len(blob) % entry.size]))
+
+        self.data_in_code_addresses = array('Q', (self.linked_base + offset for offset, _, _ in entries))
+        self.data_in_code_lengths = array('H', (length for _, length, _ in entries))
+        self.data_in_code_kinds = array('H', (kind for _, _, kind in entries))
 
         l.debug("Done parsing data in code")
 
+    def is_data_in_code(self, addr):
+        """
+        Checks whether addr lies in one of the ranges of data LC_DATA_IN_CODE lists within code, like jump tables
+
+        :param addr: a mapped address
+        """
+        lva = AT.from_mva(addr, self).to_lva()
+        idx = bisect.bisect_right(self.data_in_code_addresses, lva) - 1
+        return idx >= 0 and lva < self.data_in_code_addresses[idx] + self.data_in_code_lengths[idx]
+
     def _assert_unencrypted(self, f, off):
         l.debug("Asserting unencrypted file")
         (_, _, _, _, cryptid) = self._unpack("5I", f, off, 20)
@@ -496,39 +693,55 @@ class MachO(Backend):
             l.error("Cannot load encrypted files")
             raise CLEInvalidBinaryError()
 
-    def _load_lc_function_starts(self, f, off):
+    def _load_lc_function_starts(self, function_starts_cmd):
         # note that the logic below is based on Apple's dyldinfo.cpp, no official docs seem to exist
         l.debug("Parsing function starts")
-        (_, _, dataoff, datasize) = self._unpack("4I", f, off, 16)
 
-        i = 0
-        end = datasize
-        blob = self._read(f, dataoff, datasize)
-        self.lc_function_starts = []
+        blob = self._read_linkedit(function_starts_cmd.dataoff, function_starts_cmd.datasize)
+        if blob is None:
+            return
 
         address = None
         for seg in self.segments:
             if seg.offset == 0 and seg.filesize != 0:
                 address = seg.vaddr
                 break
+        else:
+            # the segments of images in a shared cache have file offsets into the cache
+            text = self.get_segment_by_name('__TEXT')
+            if text is not None:
+                address = text.vaddr
 
         if address is None:
             l.error("Could not determine base-address for function starts")
             raise CLEInvalidBinaryError()
         l.debug("Located base-address: %#x", address)
 
-        while i < end:
-            uleb = read_uleb(blob, i)
+        # the list holds the deltas between consecutive function starts and is 0 terminated
+        deltas = read_uleb_array(blob)
+        if 0 in deltas:
+            deltas = deltas[:deltas.index(0)]
 
-            if blob[i] == 0:
-                break  # list is 0 terminated
+        self.lc_function_starts = array('Q', accumulate(chain((address,), deltas)))[1:]
+        l.debug("Done parsing function starts")
 
-            address += uleb[0]
+    def function_containing(self, addr):
+        """
+        Looks up the function containing addr in LC_FUNCTION_STARTS. Each function is assumed to extend up to the
+        next function start or the end of its segment, whichever comes first.
 
-            self.lc_function_starts.append(address)
-            l.debug("Function start @ %#x (%#x)", uleb[0],address)
-            i += uleb[1]
-        l.debug("Done parsing function starts")
+        :param addr: a mapped address
+        :return: the mapped start address of the function, or None if addr is not in any function
+        """
+        idx = bisect.bisect_right(self.lc_function_starts, AT.from_mva(addr, self).to_lva()) - 1
+        if idx < 0:
+            return None
+
+        start = AT.from_lva(self.lc_function_starts[idx], self).to_mva()
+        segment = self.find_segment_containing(start)
+        if segment is None or not segment.contains_addr(addr):
+            return None
+        return start
 
     def _load_lc_unixthread(self, f, offset):
         if self.entryoff is not None or self.unixthread_pc is not None:
@@ -587,10 +800,42 @@ class MachO(Backend):
         Locates a symbol by checking the given address against sym.addr, sym.bind_xrefs and
         sym.symbol_stubs
         """
-        for sym in self.symbols:
-            if address == sym.relative_addr or address in sym.bind_xrefs or address in sym.symbol_stubs:
-                return sym
-        return None
+        # stubs and symbol pointers, which sym.symbol_stubs are a part of
+        if address in self.indirect_symbols:
+            return self.indirect_symbols[address]
+        symbols = self._symbols_by_address.get(address)
+        if not symbols:
+            return None
+        # the first one in self.symbols, which are sorted stably by their relative address
+        return min(symbols, key=lambda sym: sym.relative_addr)
+
+    def _add_bind_xrefs(self, symbol, xrefs):
+        """
+        Adds the addresses bound to symbol to its bind_xrefs, and to the index used by get_symbol_by_address_fuzzy
+        """
+        symbol.bind_xrefs.extend(xrefs)
+        for address in xrefs:
+            self._symbols_by_address.setdefault(address, []).append(symbol)
+
+    def _add_symbol(self, symbol):
+        """
+        Adds a symbol to self.symbols and to the name indices used by get_symbol and the binding code
+        """
+        self.symbols.add(symbol)
+        self._index_symbol(symbol)
+
+    def _add_symbols(self, symbols):
+        """
+        Adds many symbols like _add_symbol, sorting them into self.symbols at once
+        """
+        self.symbols.update(symbols)
+        for symbol in symbols:
+            self._index_symbol(symbol)
+
+    def _index_symbol(self, symbol):
+        self._symbols_by_address.setdefault(symbol.relative_addr, []).append(symbol)
+        self._symbols_by_name.setdefault(symbol.name, []).append(symbol)
+        self._symbols_by_name_and_ordinal.setdefault((symbol.name, symbol.library_ordinal), []).append(symbol)
 
     def get_symbol(self, name, include_stab=False, fuzzy=False): # pylint: disable=arguments-differ
         """
@@ -603,20 +848,23 @@ class MachO(Backend):
         :param include_stab: Include debugging symbols NOT RECOMMENDED
         :param fuzzy: Replace exact match with "contains"-style match
         """
-        result = []
-        for sym in self.symbols:
+        if fuzzy:
+            return [sym for sym in self.symbols if name in sym.name and (include_stab or not sym.is_stab)]
 
-            if sym.is_stab and not include_stab:
-                continue
+        # keep the address order of self.symbols, sorted() is stable for symbols at the same address
+        matches = self._symbols_by_name.get(name, ())
+        return sorted((sym for sym in matches if include_stab or not sym.is_stab), key=lambda sym: sym.relative_addr)
 
-            if fuzzy:
-                if name in sym.name:
-                    result.append(sym)
-            else:
-                if name == sym.name:
-                    result.append(sym)
+    def get_symbols_by_name_and_ordinal(self, name, library_ordinal, include_stab=False):
+        """
+        Returns all symbols with the given name and library ordinal, in the order they were added.
 
-        return result
+        :param name: the name of the symbol
+        :param library_ordinal: the library ordinal of the symbol
+        :param include_stab: Include debugging symbols NOT RECOMMENDED
+        """
+        matches = self._symbols_by_name_and_ordinal.get((name, library_ordinal), ())
+        return [sym for sym in matches if include_stab or not sym.is_stab]
 
     def get_segment_by_name(self, name):
         """
@@ -636,5 +884,30 @@ class MachO(Backend):
         """
         return self.get_segment_by_name(item)
 
+    def __getstate__(self):
+        if self.binary is None:
+            raise ValueError("Can't pickle an object loaded from a stream")
+
+        state = dict(self.__dict__)
+
+        # Trash the unpickleable
+        if type(self.binary_stream) is PatchedStream:
+            state['binary_stream'].stream = None
+        else:
+            state['binary_stream'] = None
+
+        # the parsed headers are only needed while loading
+        state.pop('_header', None)
+
+        return state
+
+    def __setstate__(self, data):
+        self.__dict__.update(data)
+
+        if self.binary_stream is None:
+            self.binary_stream = open(self.binary, 'rb')
+        else:
+            self.binary_stream.stream = open(self.binary, 'rb')
+
 register_backend('mach-o', MachO)
 
@@ -0,0 +1,147 @@
+# -*-coding:utf8 -*-
+# This file is part of Mach-O Loader for CLE.
+
+import bisect
+import struct
+from array import array
+
+from .binding import read_uleb
+from ...errors import CLEInvalidBinaryError
+from macholib import mach_o
+
+import logging
+l = logging.getLogger('cle.backends.macho.rebase')
+
+
+class RebaseTable(object):
+    """
+    The rebase records of a rebase blob as produced by decode_rebase_blob. Record i slides the pointer at the linked
+    address addresses[i], which is of the rebase type types[i].
+    """
+
+    def __init__(self):
+        self.addresses = array('Q')
+        self.types = array('B')
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def __iter__(self):
+        """Yields (address, rebase type) for each record"""
+        return zip(self.addresses, self.types)
+
+def decode_rebase_blob(blob, segments, is_64):
+    """
+    Decodes the rebase opcodes in blob into a RebaseTable in a single pass, without touching any memory.
+
+    :param blob: blob of rebase opcodes
+    :param segments: the segments of the binary at their linked addresses, indexed by the segment numbers in the blob
+    :param is_64: whether pointers are 64 bits wide
+    :return: RebaseTable
+    """
+    table = RebaseTable()
+    ptr_size = 8 if is_64 else 4
+    mask = 2 ** 64 - 1  # like binding, this relies on addresses to overflow
+
+    rebase_type = 0
+    address = 0
+    index = 0
+    end = len(blob)
+    while index < end:
+        opcode_index = index
+        opcode = blob[index] & mach_o.REBASE_OPCODE_MASK
+        immediate = blob[index] & mach_o.REBASE_IMMEDIATE_MASK
+        index += 1
+
+        if opcode == mach_o.REBASE_OPCODE_DONE:
+            break
+        elif opcode == mach_o.REBASE_OPCODE_SET_TYPE_IMM:
+            rebase_type = immediate
+        elif opcode == mach_o.REBASE_OPCODE_SET_SEGMENT_AND_OFFSET_ULEB:
+            offset, size = read_uleb(blob, index)
+            index += size
+            address = (segments[immediate].vaddr + offset) & mask
+        elif opcode == mach_o.REBASE_OPCODE_ADD_ADDR_ULEB:
+            offset, size = read_uleb(blob, index)
+            index += size
+            address = (address + offset) & mask
+        elif opcode == mach_o.REBASE_OPCODE_ADD_ADDR_IMM_SCALED:
+            address = (address + immediate * ptr_size) & mask
+        elif mach_o.REBASE_OPCODE_DO_REBASE_IMM_TIMES <= opcode <= mach_o.REBASE_OPCODE_DO_REBASE_ULEB_TIMES_SKIPPING_ULEB:
+            if opcode == mach_o.REBASE_OPCODE_DO_REBASE_IMM_TIMES:
+                count, stride = immediate, ptr_size
+            elif opcode == mach_o.REBASE_OPCODE_DO_REBASE_ULEB_TIMES:
+                count, size = read_uleb(blob, index)
+                index += size
+                stride = ptr_size
+            elif opcode == mach_o.REBASE_OPCODE_DO_REBASE_ADD_ADDR_ULEB:
+                skip, size = read_uleb(blob, index)
+                index += size
+                count, stride = 1, skip + ptr_size
+            else:
+                count, size = read_uleb(blob, index)
+                index += size
+                skip, size = read_uleb(blob, index)
+                index += size
+                stride = skip + ptr_size
+
+            if count == 0:
+                continue
+            if address + (count - 1) * stride > mask:
+                l.error("index %d: rebase address overflows", opcode_index)
+                raise CLEInvalidBinaryError()
+
+            table.addresses.extend(range(address, address + count * stride, stride))
+            table.types.extend([rebase_type] * count)
+            address = (address + count * stride) & mask
+        else:
+            l.error("Invalid rebase opcode @ %#x: %#x", opcode_index, opcode)
+            raise CLEInvalidBinaryError()
+
+    return table
+
+def apply_rebase_table(binary, table, delta):
+    """
+    Slides every pointer of a RebaseTable by delta, writing directly into the backers of the binary's memory.
+
+    :param binary: the MachO the table belongs to
+    :param table: the RebaseTable to apply
+    :param delta: the difference between the mapped and the linked base of binary
+    """
+    if not table:
+        return
+
+    pointer = struct.Struct(binary.struct_byteorder + ("Q" if binary.arch.bits == 64 else "I"))
+    absolute32 = struct.Struct(binary.struct_byteorder + "I")
+    formats = {
+        mach_o.REBASE_TYPE_POINTER: (pointer, 2 ** (pointer.size * 8) - 1),
+        mach_o.REBASE_TYPE_TEXT_ABSOLUTE32: (absolute32, 2 ** 32 - 1),
+    }
+
+    memory = binary.memory
+    backers = list(memory.backers())
+    backer_starts = [start for start, _ in backers]
+
+    linked_base = binary.linked_base
+    for address, rebase_type in table:
+        try:
+            fmt, mask = formats[rebase_type]
+        except KeyError:
+            l.error("Unsupported rebase type: %d", rebase_type)
+            raise CLEInvalidBinaryError()
+
+        rva = address - linked_base
+        idx = bisect.bisect_right(backer_starts, rva) - 1
+        if idx < 0 or rva >= backer_starts[idx] + len(backers[idx][1]):
+            l.error("Rebase address %#x is not mapped", address)
+            raise CLEInvalidBinaryError()
+
+        start, backer = backers[idx]
+        offset = rva - start
+        if offset + fmt.size <= len(backer):
+            value, = fmt.unpack_from(backer, offset)
+            fmt.pack_into(backer, offset, (value + delta) & mask)
+        else:
+            # the pointer straddles two backers
+            value, = fmt.unpack(memory.load(rva, fmt.size))
+            memory.store(rva, fmt.pack((value + delta) & mask))
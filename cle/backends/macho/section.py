@@ -7,6 +7,13 @@ from .. import Region
 TYPE_MASK = 0x000000ff
 ATTRIBUTES_MASK = 0xffffff00
 
+# the section types whose entries are described by the indirect symbol table
+S_NON_LAZY_SYMBOL_POINTERS = 0x6
+S_LAZY_SYMBOL_POINTERS = 0x7
+S_SYMBOL_STUBS = 0x8
+S_LAZY_DYLIB_SYMBOL_POINTERS = 0x10
+S_THREAD_LOCAL_VARIABLE_POINTERS = 0x14
+
 
 class MachOSection(Region):
     """
@@ -53,6 +53,11 @@ class MachOSegment(Region):
                 return sec
         return None
 
+    def _rebase(self, delta):
+        super(MachOSegment, self)._rebase(delta)
+        for sec in self.sections:
+            sec._rebase(delta)
+
     def __repr__(self):
         return '<MachoSegment: %s>' % self.segname
 
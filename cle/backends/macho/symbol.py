@@ -33,7 +33,7 @@ class AbstractMachOSymbol(Symbol):
 
         # additional properties
         self.bind_xrefs = []  # XREFs discovered during binding of the symbol
-        self.symbol_stubs = []  # starting addresses of stubs that resolve to this symbol - note that this must be obtained through an analysis of some sort
+        self.symbol_stubs = []  # starting addresses of stubs that resolve to this symbol, from the indirect symbol table
 
     @property
     def library_ordinal(self):
@@ -8,6 +8,7 @@ from .regions import PESection
 from .relocation.generic import DllImport, IMAGE_REL_BASED_HIGHADJ, IMAGE_REL_BASED_ABSOLUTE
 from .relocation import get_relocation
 from .. import register_backend, Backend
+from ..relocation import RelocationTable
 from ...address_translator import AT
 from ...patched_stream import PatchedStream
 
@@ -24,6 +25,7 @@ class PE(Backend):
     def __init__(self, *args, **kwargs):
         super(PE, self).__init__(*args, **kwargs)
         self.segments = self.sections # in a PE, sections and segments have the same meaning
+        self.relocs = RelocationTable(self)
         self.os = 'windows'
         if self.binary is None:
             self._pe = pefile.PE(data=self.binary_stream.read())
@@ -172,7 +174,13 @@ class PE(Backend):
                     entry_idx += 1
                     reloc = self._make_reloc(addr=reloc_data.rva, reloc_type=reloc_data.type, next_rva=next_entry.rva)
                 else:
-                    reloc = self._make_reloc(addr=reloc_data.rva, reloc_type=reloc_data.type)
+                    # a base relocation has no symbol, so it can be a row of the table
+                    RelocClass = self._base_reloc_class(reloc_data.type)
+                    if RelocClass is not None:
+                        self.pic = True
+                        self.relocs.append_row(RelocClass, None, reloc_data.rva)
+                    entry_idx += 1
+                    continue
 
                 if reloc is not None:
                     self.pic = True # I've seen binaries with the DYNAMIC_BASE DllCharacteristic unset but have tons of fixup relocations
@@ -195,9 +203,8 @@ class PE(Backend):
             return reloc
 
         # Handle all the normal base relocations
-        RelocClass = get_relocation(self.arch.name, reloc_type)
+        RelocClass = self._base_reloc_class(reloc_type)
         if RelocClass is None:
-            l.debug('Failed to find relocation class for arch %s, type %d', 'pe'+self.arch.name, reloc_type)
             return None
 
         cls = RelocClass(owner=self, symbol=symbol, addr=addr)
@@ -206,6 +213,17 @@ class PE(Backend):
 
         return cls
 
+    def _base_reloc_class(self, reloc_type):
+        """
+        :return: The relocation class of a base relocation type other than IMAGE_REL_BASED_HIGHADJ, or None.
+        """
+        if reloc_type == 0:
+            return IMAGE_REL_BASED_ABSOLUTE
+        RelocClass = get_relocation(self.arch.name, reloc_type)
+        if RelocClass is None:
+            l.debug('Failed to find relocation class for arch %s, type %d', 'pe'+self.arch.name, reloc_type)
+        return RelocClass
+
     def _register_tls(self):
         if hasattr(self._pe, 'DIRECTORY_ENTRY_TLS'):
             tls = self._pe.DIRECTORY_ENTRY_TLS.struct
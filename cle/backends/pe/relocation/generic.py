@@ -1,5 +1,6 @@
 import struct
 import logging
+import archinfo
 from .pereloc import PEReloc
 from ....address_translator import AT
 
@@ -13,7 +14,10 @@ class DllImport(PEReloc):
     pass
 
 class IMAGE_REL_BASED_ABSOLUTE(PEReloc):
-    pass
+    @classmethod
+    def relocate_rows(cls, table, indices, solist):
+        # these only pad the blocks of the base relocation table, there is nothing to apply
+        pass
 
 class IMAGE_REL_BASED_HIGHADJ(PEReloc):
     def __init__(self, owner, addr, next_rva):
@@ -33,6 +37,38 @@ class IMAGE_REL_BASED_HIGHADJ(PEReloc):
         adjusted_bytes = struct.pack('<I', adjusted_value)
         return adjusted_bytes
 
+def _rebase_rows(base_cls, cls, table, indices, size):
+    """
+    Applies the base relocations of size bytes at the rows at indices of table at once, see
+    :meth:`cle.backends.relocation.Relocation.relocate_rows`. Rows whose word does not rebase to an address of that size
+    are applied one by one, as are all of them if cls changes how base_cls relocates.
+
+    :return:    The rows which are left to be applied one by one.
+    """
+    if cls.value is not base_cls.value or cls.relocate is not base_cls.relocate:
+        return indices
+    addrs = [table.row(i)[1] for i in indices]
+    if len(set(addrs)) != len(addrs):
+        # a word which is rebased twice has to be read after it is rebased the first time
+        return indices
+
+    owner = table.owner
+    memory = owner.memory
+    fmt = '<I' if size == 4 else '<Q'
+    delta = owner.mapped_base - owner.linked_base
+    left = []
+    rebased_addrs = []
+    rebased_values = []
+    for i, addr in zip(indices, addrs):
+        rebased_value = memory.unpack(addr, fmt)[0] + delta
+        if 0 <= rebased_value < 1 << (size * 8):
+            rebased_addrs.append(addr)
+            rebased_values.append(rebased_value)
+        else:
+            left.append(i)
+    memory.pack_words(rebased_addrs, rebased_values, size=size, endness=archinfo.Endness.LE)
+    return left
+
 class IMAGE_REL_BASED_HIGHLOW(PEReloc):
     @property
     def value(self):
@@ -42,6 +78,12 @@ class IMAGE_REL_BASED_HIGHLOW(PEReloc):
         rebased_bytes = struct.pack('<I', rebased_value)
         return rebased_bytes
 
+    @classmethod
+    def relocate_rows(cls, table, indices, solist):
+        left = _rebase_rows(IMAGE_REL_BASED_HIGHLOW, cls, table, indices, 4)
+        if left:
+            super(IMAGE_REL_BASED_HIGHLOW, cls).relocate_rows(table, left, solist)
+
 class IMAGE_REL_BASED_DIR64(PEReloc):
     @property
     def value(self):
@@ -55,6 +97,12 @@ class IMAGE_REL_BASED_DIR64(PEReloc):
         rebased_bytes = struct.pack('<Q', rebased_value)
         return rebased_bytes
 
+    @classmethod
+    def relocate_rows(cls, table, indices, solist):
+        left = _rebase_rows(IMAGE_REL_BASED_DIR64, cls, table, indices, 8)
+        if left:
+            super(IMAGE_REL_BASED_DIR64, cls).relocate_rows(table, left, solist)
+
 class IMAGE_REL_BASED_HIGH(PEReloc):
     @property
     def value(self):
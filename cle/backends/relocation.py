@@ -1,8 +1,10 @@
 import logging
+from array import array
 
 from . import Backend
 from .symbol import Symbol
 from ..address_translator import AT
+from ..resolution_scope import ResolutionScope, find_export
 
 l = logging.getLogger('cle.backends.relocation')
 
@@ -19,6 +21,12 @@ class Relocation:
                             this attribute holds the symbol from a different binary that was used to resolve the import.
     :ivar resolved:         Whether the application of this relocation was successful
     """
+
+    # Whether the value of this relocation only depends on the symbol it was resolved by and on addresses, and not on
+    # the contents of memory. Such relocations which are applied by the generic relocate() are written to memory in
+    # batches by relocate_all(). This has to be set by the class which defines value.
+    batchable = False
+
     def __init__(self, owner: Backend, symbol: Symbol, relative_addr: int):
         self.owner = owner
         self.arch = owner.arch
@@ -39,23 +47,13 @@ class Relocation:
             self.resolve(self.symbol)
             return True
 
-        weak_result = None
-        for so in solist:
-            symbol = so.get_symbol(self.symbol.name)
-            if symbol is not None and symbol.is_export:
-                if not symbol.is_weak:
-                    self.resolve(symbol)
-                    return True
-                elif weak_result is None:
-                    weak_result = symbol
-            # TODO: Was this check obsolted by the addition of is_static?
-            # I think right now symbol.is_import = !symbol.is_export
-            elif symbol is not None and not symbol.is_import and so is self.owner:
-                if not symbol.is_weak:
-                    self.resolve(symbol)
-                    return True
-                elif weak_result is None:
-                    weak_result = symbol
+        if isinstance(solist, ResolutionScope):
+            symbol, weak_result = solist.lookup(self.symbol.name, self.owner)
+        else:
+            symbol, weak_result = find_export(solist, self.symbol.name, self.owner)
+        if symbol is not None:
+            self.resolve(symbol)
+            return True
 
         if weak_result is not None:
             self.resolve(weak_result)
@@ -103,7 +101,7 @@ class Relocation:
 
         This implementation is a generic version that can be overridden in subclasses.
 
-        :param solist:       A list of objects from which to resolve symbols.
+        :param solist:       A list of objects from which to resolve symbols, or a ResolutionScope.
         """
         if not self.resolve_symbol(solist, bypass_compatibility):
             return False
@@ -111,6 +109,33 @@ class Relocation:
         self.owner.memory.pack_word(self.dest_addr, self.value)
         return True
 
+    @classmethod
+    def from_row(cls, owner, symbol, relative_addr, addend, is_rela): # pylint: disable=unused-argument
+        """
+        Makes the relocation a row of a :class:`RelocationTable` stands for.
+
+        :param addend:  The addend of the row, for the relocation types which have one.
+        :param is_rela: Whether the addend was given by the relocation entry.
+        """
+        return cls(owner, symbol, relative_addr)
+
+    @classmethod
+    def relocate_rows(cls, table, indices, solist):
+        """
+        Applies the relocations of the rows at indices of table, which are all of this class and not resolved yet,
+        like :meth:`relocate` would.
+
+        This implementation does so with a temporary relocation for each row, which is only kept if it was resolved by
+        a symbol, as a row cannot hold one.
+        """
+        for i in indices:
+            reloc = table.make_relocation(i)
+            reloc.relocate(solist)
+            if reloc.resolvedby is not None:
+                table.keep(i, reloc)
+            elif reloc.resolved:
+                table.set_resolved(i)
+
     # compatibility layer
 
     _complained_owner = False
@@ -121,3 +146,260 @@ class Relocation:
             Relocation._complained_owner = True
             l.critical("Deprecation warning: use relocation.owner instead of relocation.owner_obj")
         return self.owner
+
+
+class RelocationTable(object):
+    """
+    The relocations of an object, in order, which can be used like a list of them.
+
+    Most relocations of an object only ever get resolved to nothing, like the relative relocations of an ELF or the base
+    relocations of a PE, of which there are tens of thousands. Instead of Relocation objects, these are added as rows
+    of arrays of addresses, classes, symbols, addends and flags. Looking up or iterating over a row makes a new
+    Relocation in the state of the row, which is not kept, so rows are told apart by their class and address. Only a
+    row which gets resolved by a symbol is replaced by its Relocation. The loader applies the rows without making
+    Relocations for them, see :meth:`Relocation.relocate_rows`.
+
+    :ivar owner:    The object whose relocations these are.
+    """
+
+    ROW_RESOLVED = 1
+    ROW_RELA = 2
+
+    def __init__(self, owner):
+        self.owner = owner
+        self._addrs = array('Q')
+        self._addends = array('q')
+        self._classes = array('H')  # index into _class_list, 0 for relocations which are objects
+        self._symbols = array('I')  # index into _symbol_list
+        self._flags = bytearray()
+        self._objects = {}  # row => Relocation
+        self._class_list = [None]
+        self._symbol_list = [None]
+        self._class_indices = {}
+        self._symbol_indices = {}
+
+    def _append(self, column, value):
+        try:
+            getattr(self, column).append(value)
+        except OverflowError:
+            # a value too large or negative for the array, so it has to become a list
+            values = list(getattr(self, column))
+            values.append(value)
+            setattr(self, column, values)
+
+    def append(self, reloc):
+        """
+        Add a Relocation object.
+        """
+        self._objects[len(self._flags)] = reloc
+        self._add_row(0, 0, 0, 0, 0)
+
+    def extend(self, relocs):
+        for reloc in relocs:
+            self.append(reloc)
+
+    def append_row(self, cls, symbol, relative_addr, addend=0, is_rela=False):
+        """
+        Add a relocation of cls which is not resolved yet, as a row. Rows are meant for relocations which are only
+        resolved to nothing, i.e. whose symbol, if any, is not looked up.
+
+        :param cls:             The Relocation class.
+        :param symbol:          The symbol of the relocation, or None.
+        :param relative_addr:   The address the relocation writes to.
+        :param addend:          The addend of the relocation, if it has one.
+        :param is_rela:         Whether the addend was given by the relocation entry.
+        """
+        try:
+            cls_index = self._class_indices[cls]
+        except KeyError:
+            cls_index = self._class_indices[cls] = len(self._class_list)
+            self._class_list.append(cls)
+        try:
+            symbol_index = self._symbol_indices[id(symbol)]
+        except KeyError:
+            symbol_index = self._symbol_indices[id(symbol)] = len(self._symbol_list)
+            self._symbol_list.append(symbol)
+        self._add_row(cls_index, symbol_index, relative_addr, addend, self.ROW_RELA if is_rela else 0)
+
+    def _add_row(self, cls_index, symbol_index, relative_addr, addend, flags):
+        self._classes.append(cls_index)
+        self._symbols.append(symbol_index)
+        self._append('_addrs', relative_addr)
+        self._append('_addends', addend)
+        self._flags.append(flags)
+
+    def __len__(self):
+        return len(self._flags)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self[i] for i in range(*k.indices(len(self)))]
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError(k)
+        try:
+            return self._objects[k]
+        except KeyError:
+            return self.make_relocation(k)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __contains__(self, reloc):
+        if any(obj is reloc for obj in self._objects.values()):
+            return True
+        if getattr(reloc, 'owner', None) is not self.owner:
+            return False
+        cls_index = self._class_indices.get(type(reloc))
+        if cls_index is None:
+            return False
+        addr = reloc.relative_addr
+        return any(row_addr == addr and row_cls == cls_index and i not in self._objects
+                   for i, (row_addr, row_cls) in enumerate(zip(self._addrs, self._classes)))
+
+    def __repr__(self):
+        return '<RelocationTable of %d relocations of %r>' % (len(self), self.owner)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        # these are keyed by id
+        state['_symbol_indices'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._symbol_indices = dict((id(symbol), i) for i, symbol in enumerate(self._symbol_list))
+
+    def objects(self):
+        """
+        Iterate over the relocations which are Relocation objects already, without making any more of them. The others
+        are all rows which are only resolved to nothing.
+        """
+        for i in sorted(self._objects):
+            yield self._objects[i]
+
+    def make_relocation(self, i):
+        """
+        Make a new Relocation for row i, in the state the row is in.
+        """
+        cls = self._class_list[self._classes[i]]
+        flags = self._flags[i]
+        reloc = cls.from_row(self.owner, self._symbol_list[self._symbols[i]], self._addrs[i], self._addends[i],
+                             bool(flags & self.ROW_RELA))
+        if flags & self.ROW_RESOLVED:
+            # it was resolved already, which is not to be repeated on the symbol
+            reloc.resolvedby = None
+            reloc.resolved = True
+        return reloc
+
+    def row(self, i):
+        """
+        :return: The symbol, relative address and addend of row i.
+        """
+        return self._symbol_list[self._symbols[i]], self._addrs[i], self._addends[i]
+
+    def set_resolved(self, i):
+        self._flags[i] |= self.ROW_RESOLVED
+
+    def keep(self, i, reloc):
+        """
+        Replace row i with the Relocation reloc.
+        """
+        self._objects[i] = reloc
+
+    def runs(self):
+        """
+        Iterate over the relocations in order, as Relocation objects and runs of rows which are not resolved yet. Each
+        item is a tuple of a Relocation and None, or of None, the class of a run of rows and the list of their indices.
+        """
+        objects = self._objects
+        run_cls = None
+        run = []
+        for i in range(len(self)):
+            if i in objects:
+                if run:
+                    yield None, self._class_list[run_cls], run
+                    run = []
+                yield objects[i], None, None
+                continue
+            if self._flags[i] & self.ROW_RESOLVED:
+                continue
+            cls_index = self._classes[i]
+            if run and cls_index != run_cls:
+                yield None, self._class_list[run_cls], run
+                run = []
+            run_cls = cls_index
+            run.append(i)
+        if run:
+            yield None, self._class_list[run_cls], run
+
+
+# relocation class => whether it is applied in batches by relocate_all
+_batchable_classes = {}
+
+
+def is_batchable(cls):
+    """
+    Whether the relocations of cls are applied by the generic relocate() and have a batchable value, see
+    :attr:`Relocation.batchable`.
+    """
+    try:
+        return _batchable_classes[cls]
+    except KeyError:
+        pass
+
+    value_cls = next(c for c in cls.__mro__ if 'value' in vars(c))
+    result = _batchable_classes[cls] = (vars(value_cls).get('batchable', False) and
+                                        cls.relocate is Relocation.relocate and cls.dest_addr is Relocation.dest_addr)
+    return result
+
+
+def relocate_all(relocs, solist):
+    """
+    Applies the relocations of relocs which are not resolved yet, in order, as if calling their relocate(solist).
+
+    The values of batchable relocations are packed into the memory of their owner together, see
+    :meth:`cle.memory.Clemory.pack_words`. They are written before any other relocation is applied, so that it sees
+    them in memory.
+
+    The rows of a :class:`RelocationTable` are applied a run at a time, see :meth:`Relocation.relocate_rows`.
+
+    :param relocs:  The relocations to apply, a list or a RelocationTable.
+    :param solist:  A list of objects from which to resolve symbols, or a ResolutionScope.
+    """
+    pending = {}  # id of a memory => (memory, addresses, values)
+
+    def flush():
+        for memory, addrs, values in pending.values():
+            memory.pack_words(addrs, values)
+        pending.clear()
+
+    if isinstance(relocs, RelocationTable):
+        items = relocs.runs()
+    else:
+        items = ((reloc, None, None) for reloc in relocs)
+
+    for reloc, run_cls, run in items:
+        if reloc is None:
+            flush()
+            run_cls.relocate_rows(relocs, run, solist)
+            continue
+        if reloc.resolved:
+            continue
+        if not is_batchable(type(reloc)):
+            flush()
+            reloc.relocate(solist)
+            continue
+        if not reloc.resolve_symbol(solist):
+            continue
+
+        memory = reloc.owner.memory
+        try:
+            batch = pending[id(memory)]
+        except KeyError:
+            batch = pending[id(memory)] = (memory, [], [])
+        batch[1].append(reloc.dest_addr)
+        batch[2].append(reloc.value)
+    flush()
@@ -0,0 +1,239 @@
+"""
+An on-disk cache of fully loaded :class:`cle.loader.Loader` images.
+
+Loading the same set of binaries over and over means parsing them, resolving their symbols and relocating them over
+and over. With a cache directory, the loader pickles its entire state after a successful load, keyed by the contents
+of the main binary and the loader options, and restores it on the next load with the same key instead of loading
+anything.
+
+The memory of the loaded objects is not part of the pickle. It is written out of band, page-aligned, after it in the
+same file, and on a hit the file is mapped copy-on-write, so that the (relocated) memory of the cached image is only
+paged in when it is touched.
+
+A cache file looks like this::
+
+    header | buffer table | metadata pickle | state pickle | padding | buffers...
+
+where the metadata records the size and modification time of every file that went into the image, and for every
+directory that was searched for them its modification time and the names found in it, so that stale entries are
+detected before anything is unpickled. A directory whose modification time changed is listed again, and only makes
+the entry stale if a search would find other names in it, e.g. when a library appears earlier in the load path than
+the one that was loaded. Unrelated files coming and going, e.g. in the working directory, do not.
+
+Restoring an ELF object does not parse its file again until something needs its pyelftools reader.
+
+The key also covers the directory of the main binary and, on Windows, the ``PATH``, as they decide which directories
+are searched in the first place.
+"""
+
+import io
+import os
+import sys
+import mmap
+import struct
+import pickle
+import hashlib
+import logging
+import tempfile
+
+from .memory import Clemory
+from .load_path import directory_stamps_valid
+from .utils import ALIGN_UP
+
+l = logging.getLogger('cle.cache')
+
+__all__ = ('loader_cache_key', 'load_cached_loader', 'store_cached_loader')
+
+CACHE_FORMAT_VERSION = 7
+
+_MAGIC = b'CLECACHE'
+_HEADER = struct.Struct('<8sIIQQ')  # magic, format version, buffer count, metadata length, state length
+_EXTENT = struct.Struct('<QQ')      # file offset, length of a buffer
+
+
+def loader_cache_key(main_binary, options):
+    """
+    Compute the key of the cache entry for loading `main_binary` with the given loader options.
+
+    :param main_binary: The main binary argument of the loader.
+    :param options:     A dict of all other loader arguments.
+    :return:            A hex digest, or None if this load can't be cached (i.e. something is loaded from a stream).
+    """
+    from . import __version__
+
+    if not hasattr(pickle, 'PickleBuffer'):
+        l.warning("Caching loaded images requires pickle protocol 5 (python 3.8+)")
+        return None
+    if hasattr(main_binary, 'seek') and hasattr(main_binary, 'read'):
+        return None
+    for name in ('force_load_libs', 'preload_libs'):
+        if any(not isinstance(lib, str) for lib in options.get(name, ())):
+            return None
+    if options.get('concrete_target') is not None:
+        return None
+
+    h = hashlib.sha256()
+    h.update(repr((CACHE_FORMAT_VERSION, __version__, sorted(options.items()))).encode())
+    try:
+        h.update(repr((os.path.dirname(os.path.realpath(main_binary)),
+                       os.environ.get('PATH') if sys.platform == 'win32' else None)).encode())
+        with open(main_binary, 'rb') as f:
+            for chunk in iter(lambda: f.read(0x100000), b''):
+                h.update(chunk)
+    except (OSError, TypeError):
+        return None
+    return h.hexdigest()
+
+
+def _cache_path(cache_dir, key):
+    return os.path.join(cache_dir, key + '.clecache')
+
+
+def _file_stamps(loader):
+    stamps = []
+    for obj in loader.all_objects:
+        if isinstance(obj.binary, str) and os.path.isfile(obj.binary):
+            st = os.stat(obj.binary)
+            stamps.append((obj.binary, st.st_size, st.st_mtime_ns))
+    return {'files': stamps, 'directories': loader._path_index.directory_stamps()}
+
+
+def _stamps_valid(stamps):
+    for path, size, mtime in stamps['files']:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        if st.st_size != size or st.st_mtime_ns != mtime:
+            return False
+    for libdir, abspath, _, _ in stamps['directories']:
+        # a relative directory is another one in another working directory
+        if os.path.abspath(libdir) != abspath:
+            return False
+    return directory_stamps_valid(stamps['directories'])
+
+
+class _LoaderPickler(pickle.Pickler):
+    """
+    Pickles the state of a loader, leaving out the loader itself (it is substituted with the loader the state is
+    restored into) and the contents of its memory (which is written out of band).
+    """
+    def __init__(self, file, loader, buffers):
+        super(_LoaderPickler, self).__init__(file, protocol=5, buffer_callback=buffers.append)
+        self._loader = loader
+
+    def persistent_id(self, obj):
+        if obj is self._loader:
+            return 'loader'
+        return None
+
+    def reducer_override(self, obj):
+        if type(obj) is not Clemory:
+            return NotImplemented
+        backers = [(start, backer if type(backer) in (list, Clemory) else pickle.PickleBuffer(backer))
+                   for start, backer in obj._backers]
+        return Clemory.__new__, (Clemory,), obj._pickle_state(backers)
+
+
+class _LoaderUnpickler(pickle.Unpickler):
+    def __init__(self, file, loader, buffers):
+        super(_LoaderUnpickler, self).__init__(file, buffers=buffers)
+        self._loader = loader
+
+    def persistent_load(self, pid):
+        if pid == 'loader':
+            return self._loader
+        raise pickle.UnpicklingError("Unknown persistent id %r" % (pid,))
+
+
+def store_cached_loader(loader, cache_dir, key):
+    """
+    Write the state of a fully loaded loader to the cache.
+
+    :param loader:      The loader.
+    :param cache_dir:   The cache directory. It is created if it doesn't exist.
+    :param key:         The key computed by :func:`loader_cache_key`.
+    :return:            Whether the loader could be cached.
+    """
+    buffers = []
+    stream = tempfile.SpooledTemporaryFile(max_size=0x1000000)
+    try:
+        _LoaderPickler(stream, loader, buffers).dump(loader.__dict__)
+    except (pickle.PicklingError, TypeError, ValueError, AttributeError, RecursionError) as e:
+        l.warning("Could not cache %r: %s", loader, e)
+        stream.close()
+        return False
+    state_len = stream.tell()
+    stream.seek(0)
+    meta = pickle.dumps(_file_stamps(loader), protocol=5)
+
+    extents = []
+    offset = _HEADER.size + _EXTENT.size * len(buffers) + len(meta) + state_len
+    for buf in buffers:
+        offset = ALIGN_UP(offset, mmap.PAGESIZE)
+        length = buf.raw().nbytes
+        extents.append((offset, length))
+        offset += length
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, CACHE_FORMAT_VERSION, len(buffers), len(meta), state_len))
+            for extent in extents:
+                f.write(_EXTENT.pack(*extent))
+            f.write(meta)
+            for chunk in iter(lambda: stream.read(0x100000), b''):
+                f.write(chunk)
+            for (offset, _), buf in zip(extents, buffers):
+                f.seek(offset)
+                f.write(buf.raw())
+        os.replace(tmp_path, _cache_path(cache_dir, key))
+    except OSError as e:
+        l.warning("Could not write the cache entry for %r: %s", loader, e)
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        return False
+    finally:
+        stream.close()
+        for buf in buffers:
+            buf.release()
+    return True
+
+
+def load_cached_loader(loader, cache_dir, key):
+    """
+    Restore the state of a loader from the cache.
+
+    :param loader:      The loader to restore the state into. It must not have loaded anything yet.
+    :param cache_dir:   The cache directory.
+    :param key:         The key computed by :func:`loader_cache_key`.
+    :return:            Whether there was a valid cache entry for this key.
+    """
+    path = _cache_path(cache_dir, key)
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return False
+
+    with f:
+        try:
+            magic, version, buffer_count, meta_len, state_len = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC or version != CACHE_FORMAT_VERSION:
+                l.warning("Ignoring cache entry %s with an unknown format", path)
+                return False
+            extents = [_EXTENT.unpack(f.read(_EXTENT.size)) for _ in range(buffer_count)]
+            if not _stamps_valid(pickle.loads(f.read(meta_len))):
+                l.info("Ignoring stale cache entry %s", path)
+                return False
+            state = f.read(state_len)
+
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY) if extents else None
+            buffers = [memoryview(mapping)[offset:offset + length] for offset, length in extents]
+            loader.__dict__.update(_LoaderUnpickler(io.BytesIO(state), loader, buffers).load())
+        except Exception as e: # pylint: disable=broad-except
+            l.warning("Ignoring broken cache entry %s: %s", path, e)
+            return False
+
+    l.info("Loaded %r from cache entry %s", loader, path)
+    return True
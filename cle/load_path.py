@@ -0,0 +1,193 @@
+"""
+An index of the directories on the load path, and of what the loader learned about the files in them.
+
+Resolving a dependency used to cost an ``os.path.exists`` per directory, a full ``os.listdir`` per directory when
+ignoring version numbers, and opening every candidate to tell its backend and whether it is compatible with the main
+object. The index lists each directory once and remembers the results per file, so that these are done once per
+directory and file instead of once per dependency.
+
+Directory listings and file results are shared between loaders. A listing is reused as long as the modification time
+of its directory is the same, which changes whenever an entry is added, removed or renamed. File results are keyed by
+device, inode, size and modification time. Only the most recently used listings and files are kept.
+
+The index also records which names each lookup in a directory found, so that whoever keeps the result of a load (see
+:mod:`cle.cache`) can tell whether searching the same directories again would find the same files, even after
+unrelated entries were added to them.
+"""
+
+import os
+
+from .utils import LRUCache
+
+__all__ = ('LoadPathIndex', 'DirectoryListing', 'directory_stamps_valid')
+
+VERSION_CHARS = '.0123456789'
+
+# directory => (modification time, DirectoryListing)
+_shared_listings = LRUCache(256)
+# (device, inode, size, modification time) => {key => result}
+_shared_file_results = LRUCache(4096)
+
+
+class DirectoryListing(object):
+    """
+    The names of the entries of a directory, indexed the ways the loader searches them. The name lists are in the
+    order os.listdir returned the names.
+
+    :ivar names:                The set of all names.
+    :ivar by_lower:             Lowercase name => names.
+    :ivar by_stripped:          Name without version numbers => names.
+    :ivar by_lower_stripped:    Lowercase name without version numbers => names.
+    """
+
+    __slots__ = ('names', 'by_lower', 'by_stripped', 'by_lower_stripped')
+
+    def __init__(self, names):
+        self.names = set(names)
+        self.by_lower = {}
+        self.by_stripped = {}
+        self.by_lower_stripped = {}
+        for name in names:
+            lower = name.lower()
+            self.by_lower.setdefault(lower, []).append(name)
+            self.by_stripped.setdefault(name.strip(VERSION_CHARS), []).append(name)
+            self.by_lower_stripped.setdefault(lower.strip(VERSION_CHARS), []).append(name)
+
+    def lookup(self, table, key):
+        """
+        :param table:   Which names to look in: ``'names'``, ``'by_lower'``, ``'by_stripped'`` or
+                        ``'by_lower_stripped'``.
+        :return:        A tuple of the names under key.
+        """
+        if table == 'names':
+            return (key,) if key in self.names else ()
+        return tuple(getattr(self, table).get(key, ()))
+
+
+class LoadPathIndex(object):
+    """
+    The index a loader searches its load path with. Within one loader, a directory is listed and a file is looked at
+    at most once, even if they change while loading.
+    """
+
+    def __init__(self):
+        self._listings = {}  # directory => DirectoryListing, or None if it cannot be listed
+        self._stamps = {}  # path => (device, inode, size, modification time), or None if it cannot be stat'ed
+        self._lookups = {}  # directory => {(table, key) => names found}
+        # (directory, absolute path, modification time or None, its lookups), in the order searched
+        self._directory_stamps = []
+
+    def __getstate__(self):
+        # the index is only useful while loading
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    def listing(self, libdir):
+        """
+        :return: the DirectoryListing of libdir, or None if it is not a directory that can be listed
+        """
+        try:
+            return self._listings[libdir]
+        except KeyError:
+            pass
+
+        listing = None
+        mtime = None
+        # relative directories may be different ones for another loader
+        key = os.path.abspath(libdir)
+        try:
+            mtime = os.stat(libdir).st_mtime_ns
+            shared = _shared_listings.get(key)
+            if shared is not None and shared[0] == mtime:
+                listing = shared[1]
+            else:
+                listing = DirectoryListing(os.listdir(libdir))
+                _shared_listings[key] = (mtime, listing)
+        except (IOError, OSError):
+            pass
+
+        self._listings[libdir] = listing
+        self._lookups[libdir] = {}
+        self._directory_stamps.append((libdir, key, mtime if listing is not None else None, self._lookups[libdir]))
+        return listing
+
+    def lookup(self, libdir, table, key):
+        """
+        Look up key in the listing of libdir, see :meth:`DirectoryListing.lookup`, and record what was found.
+
+        :return: A tuple of names, or None if libdir cannot be listed.
+        """
+        listing = self.listing(libdir)
+        if listing is None:
+            return None
+        names = self._lookups[libdir][(table, key)] = listing.lookup(table, key)
+        return names
+
+    def directory_stamps(self):
+        """
+        :return: A list of ``(directory, absolute path, modification time, lookups)`` tuples of the directories searched
+                 so far, with a modification time of None for those which could not be listed, and the names each
+                 lookup in them found. See :func:`directory_stamps_valid`.
+        """
+        return [(libdir, key, mtime, dict(lookups)) for libdir, key, mtime, lookups in self._directory_stamps]
+
+    def _stamp(self, path):
+        try:
+            return self._stamps[path]
+        except KeyError:
+            pass
+
+        try:
+            st = os.stat(path)
+            stamp = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        except (IOError, OSError):
+            stamp = None
+        self._stamps[path] = stamp
+        return stamp
+
+    def cached(self, path, key, compute):
+        """
+        Looks up what is known about the file at path under key, computing it if it is not known yet.
+
+        :param path:    The path of the file.
+        :param key:     What is looked up, e.g. ``'backend'``. It must be hashable.
+        :param compute: A function without arguments that returns the result for the file.
+        :return:        The result for the file.
+        """
+        stamp = self._stamp(path)
+        if stamp is None:
+            return compute()
+
+        results = _shared_file_results.setdefault(stamp, {})
+        try:
+            return results[key]
+        except KeyError:
+            result = results[key] = compute()
+            return result
+
+
+def directory_stamps_valid(stamps):
+    """
+    Tell whether searching the directories of :meth:`LoadPathIndex.directory_stamps` again finds the same files. A
+    directory which changed since is listed again, and is fine as long as its lookups still find the same names.
+    """
+    for libdir, key, mtime, lookups in stamps:
+        try:
+            current = os.stat(libdir).st_mtime_ns
+        except (IOError, OSError):
+            current = None
+        if current == mtime:
+            continue
+        if current is None or mtime is None:
+            return False
+
+        try:
+            listing = DirectoryListing(os.listdir(libdir))
+        except (IOError, OSError):
+            return False
+        _shared_listings[key] = (current, listing)
+        if any(listing.lookup(table, name) != names for (table, name), names in lookups.items()):
+            return False
+    return True
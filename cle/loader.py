@@ -1,13 +1,23 @@
+import io
 import os
 import sys
+import mmap
+import heapq
+import pickle
 import platform
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from collections import OrderedDict
 
 import archinfo
 from archinfo.arch_soot import ArchSoot
 
 from .address_translator import AT
+from .cache import loader_cache_key, load_cached_loader, store_cached_loader
+from .load_path import LoadPathIndex, VERSION_CHARS
+from .symbol_index import SymbolIndex
+from .resolution_scope import ResolutionScope, ExportLookups
 from .utils import ALIGN_UP, key_bisect_insort_left, key_bisect_floor_key
 
 try:
@@ -53,6 +63,14 @@ class Loader:
                                 in a non-paged environment.
     :param preload_libs:        Similar to `force_load_libs` but will provide for symbol resolution, with precedence
                                 over any dependencies.
+    :param parallel_load:       The number of processes to parse shared libraries with, or True for one per CPU. Each
+                                level of the dependency graph is parsed concurrently, and the result is the same as
+                                loading the libraries one by one. Parsing is pure python, so it is done in forked
+                                processes rather than threads; where those are not available, or there is only one CPU
+                                to run them on, the libraries are loaded one by one.
+    :param cache_dir:           A directory in which fully loaded images are cached. Loading the same main binary
+                                with the same options again restores the cached image instead of loading it. See
+                                :mod:`cle.cache`.
     :ivar memory:               The loaded, rebased, and relocated memory of the program.
     :vartype memory:            cle.memory.Clemory
     :ivar main_object:          The object representing the main binary (i.e., the executable).
@@ -77,7 +95,21 @@ class Loader:
                  main_opts=None, lib_opts=None, ld_path=(), use_system_libs=True,
                  ignore_import_version_numbers=True, case_insensitive=False, rebase_granularity=0x1000000,
                  except_missing_libs=False, aslr=False, perform_relocations=True,
-                 page_size=0x1, extern_size=0x8000, preload_libs=(), arch=None):
+                 page_size=0x1, extern_size=0x8000, preload_libs=(), arch=None, parallel_load=None,
+                 cache_dir=None):
+        cache_key = None
+        if cache_dir is not None:
+            cache_key = loader_cache_key(main_binary, {
+                'auto_load_libs': auto_load_libs, 'concrete_target': concrete_target,
+                'force_load_libs': tuple(force_load_libs), 'skip_libs': tuple(skip_libs), 'main_opts': main_opts,
+                'lib_opts': lib_opts, 'ld_path': ld_path, 'use_system_libs': use_system_libs,
+                'ignore_import_version_numbers': ignore_import_version_numbers, 'case_insensitive': case_insensitive,
+                'rebase_granularity': rebase_granularity, 'except_missing_libs': except_missing_libs, 'aslr': aslr,
+                'perform_relocations': perform_relocations, 'page_size': page_size, 'extern_size': extern_size,
+                'preload_libs': tuple(preload_libs), 'arch': arch})
+            if cache_key is not None and load_cached_loader(self, cache_dir, cache_key):
+                return
+
         if hasattr(main_binary, 'seek') and hasattr(main_binary, 'read'):
             self._main_binary_path = None
             self._main_binary_stream = main_binary
@@ -102,6 +134,11 @@ class Loader:
         self._extern_size = extern_size
         self._relocated_objects = set()
         self._perform_relocations = perform_relocations
+        self._parallel_load = parallel_load
+        self._path_index = LoadPathIndex()
+        self._symbol_index = SymbolIndex()
+        self._export_lookups = ExportLookups()
+        self._mach_exports = ExportIndex()
 
         # case insensitivity setup
         if sys.platform == 'win32': # TODO: a real check for case insensitive filesystems
@@ -133,6 +170,9 @@ class Loader:
         if self._extern_object and self._extern_object._warned_data_import:
             l.warning('For more information about "Symbol was allocated without a known size", see https://docs.angr.io/extending-angr/environment#simdata')
 
+        if cache_key is not None:
+            store_cached_loader(self, cache_dir, cache_key)
+
     # Basic functions and properties
 
     def close(self):
@@ -315,12 +355,19 @@ class Loader:
         """
         If the given library specification has been loaded, return its object, otherwise return None.
         """
-        if self._case_insensitive:
-            spec = spec.lower()
         extra_idents = {}
         for obj in extra_objects:
-            for ident in self._possible_idents(obj):
-                extra_idents[ident] = obj
+            self._add_idents(extra_idents, obj)
+        return self._find_object(spec, extra_idents)
+
+    def _find_object(self, spec, extra_idents):
+        """
+        Like find_object, with the objects to consider besides the registered ones given by the table of their idents
+        that _add_idents builds. Loading keeps such a table up to date instead of generating the idents of every
+        object it loaded so far for each dependency.
+        """
+        if self._case_insensitive:
+            spec = spec.lower()
 
         for ident in self._possible_idents(spec):
             if ident in self._satisfied_deps:
@@ -330,6 +377,13 @@ class Loader:
 
         return None
 
+    def _add_idents(self, idents, obj):
+        """
+        Map each possible ident of obj to obj in the dict idents, so that later objects take precedence.
+        """
+        for ident in self._possible_idents(obj):
+            idents[ident] = obj
+
     def find_object_containing(self, addr, membership_check=True):
         """
         Return the object that contains the given address, or None if the address is unmapped.
@@ -454,21 +508,19 @@ class Loader:
             return thing.method.fullname
         elif type(thing) is int:
             # address
-            if fuzzy:
-                so = self.find_object_containing(thing)
-                if so is None:
-                    return None
-                objs = [so]
-            else:
-                objs = self.all_objects
+            if not fuzzy:
+                self._symbol_index.update(self.all_objects)
+                return self._symbol_index.find(thing)
 
-            for so in objs:
-                idx = so.symbols.bisect_key_right(AT.from_mva(thing, so).to_rva()) - 1
-                while idx >= 0 and (fuzzy or so.symbols[idx].rebased_addr == thing):
-                    if so.symbols[idx].is_import:
-                        idx -= 1
-                        continue
-                    return so.symbols[idx]
+            so = self.find_object_containing(thing)
+            if so is None:
+                return None
+            idx = so.symbols.bisect_key_right(AT.from_mva(thing, so).to_rva()) - 1
+            while idx >= 0:
+                if so.symbols[idx].is_import:
+                    idx -= 1
+                    continue
+                return so.symbols[idx]
         else:
             # name
             for so in self.all_objects:
@@ -497,21 +549,10 @@ class Loader:
 
     @property
     def symbols(self):
-        peeks = []
-        for so in self.all_objects:
-            if so.symbols:
-                i = iter(so.symbols)
-                n = next(i)
-                peeks.append((n, i))
-        while peeks:
-            element = min(peeks, key=lambda x: x[0].rebased_addr) # if we don't do this it might crash on comparing iterators
-            n, i = element
-            idx = peeks.index(element)
-            yield n
-            try:
-                peeks[idx] = next(i), i
-            except StopIteration:
-                peeks.pop(idx)
+        """
+        All symbols of all objects, sorted by their rebased address.
+        """
+        return heapq.merge(*[so.symbols for so in self.all_objects], key=lambda sym: sym.rebased_addr)
 
     def find_all_symbols(self, name, exclude_imports=True, exclude_externs=False, exclude_forwards=True):
         """
@@ -549,7 +590,11 @@ class Loader:
         Iterate through all the relocations referring to the symbol with the given ``name``
         """
         for so in self.all_objects:
-            for reloc in so.relocs:
+            relocs = so.relocs
+            if name and isinstance(relocs, RelocationTable):
+                # the rows of the table have no symbol or one without a name
+                relocs = relocs.objects()
+            for reloc in relocs:
                 if reloc.symbol is not None:
                     if reloc.symbol.name == name:
                         yield reloc
@@ -643,15 +688,17 @@ class Loader:
                            not treated like preload_libs)
         """
         objects = []
+        idents = {}  # the idents of objects, see _find_object
         dependencies = []
         cached_failures = set() # this assumes that the load path is global and immutable by the time we enter this func
 
         for main_spec in args:
-            if self.find_object(main_spec, extra_objects=objects) is not None:
+            if self._find_object(main_spec, idents) is not None:
                 l.info("Skipping load request %s - already loaded", main_spec)
                 continue
             main_obj = self._load_object_isolated(main_spec)
             objects.append(main_obj)
+            self._add_idents(idents, main_obj)
             dependencies.extend(main_obj.deps)
 
             if self.main_object is None:
@@ -660,12 +707,18 @@ class Loader:
             elif preloading:
                     self.preload_libs.append(main_obj)
 
+        if self._auto_load_libs and dependencies and self._parallel_load_workers() > 1:
+            pool = self._parallel_load_pool()
+            if pool is not None:
+                with pool:
+                    self._load_dependencies_parallel(pool, objects, idents, dependencies, cached_failures)
+
         while self._auto_load_libs and dependencies:
             dep_spec = dependencies.pop(0)
             if dep_spec in cached_failures:
                 l.debug("Skipping implicit dependency %s - cached failure", dep_spec)
                 continue
-            if self.find_object(dep_spec, extra_objects=objects) is not None:
+            if self._find_object(dep_spec, idents) is not None:
                 l.debug("Skipping implicit dependency %s - already loaded", dep_spec)
                 continue
 
@@ -681,12 +734,21 @@ class Loader:
                     continue
 
             objects.append(dep_obj)
+            self._add_idents(idents, dep_obj)
             dependencies.extend(dep_obj.deps)
 
         for obj in objects:
             self._register_object(obj)
         for obj in objects:
             self._map_object(obj)
+        # flat lookups of Mach-O imports search the images in the order they were loaded. Mach-O has no relocations
+        # for imports, they are bound by the binary itself once all images are mapped, which is part of loading it
+        # whether relocations are performed or not
+        mach_objects = [obj for obj in objects if isinstance(obj, MachO)]
+        self._mach_exports.add(mach_objects)
+        for obj in mach_objects:
+            if not obj.binding_done:
+                obj.do_binding()
         for obj in objects:
             if isinstance(obj, (MetaELF, PE)) and obj.tls_used:
                 self.tls_object.register_object(obj)
@@ -704,6 +766,100 @@ class Loader:
 
         return objects
 
+    def _parallel_load_workers(self):
+        """
+        :return: How many processes to parse shared libraries with, at most one per CPU.
+        """
+        if not self._parallel_load:
+            return 0
+        cpus = os.cpu_count() or 1
+        if self._parallel_load is True:
+            return cpus
+        return min(self._parallel_load, cpus)
+
+    def _parallel_load_pool(self):
+        """
+        :return: A pool of processes to parse objects in with :func:`_load_in_worker`, each of them a fork of this
+                 process, or None if there can't be one.
+        """
+        if sys.version_info < (3, 8) or 'fork' not in multiprocessing.get_all_start_methods():
+            l.warning("Loading libraries in parallel requires forking processes, loading them one by one")
+            return None
+        # the workers inherit this loader as it is now, so that they look for libraries and their options the same way
+        return ProcessPoolExecutor(max_workers=self._parallel_load_workers(), mp_context=multiprocessing.get_context('fork'),
+                                   initializer=_init_load_worker, initargs=(self,))
+
+    def _load_dependencies_parallel(self, pool, objects, idents, dependencies, cached_failures):
+        """
+        Load `dependencies` and everything they depend on breadth-first, parsing the objects of each level of the
+        dependency graph in `pool`. Each level is merged into `objects` in order, skipping whatever is already loaded
+        by then, so the result is exactly what the serial loop in :meth:`_internal_load` would produce. `idents` is
+        kept up to date with `objects`, see :meth:`_find_object`.
+
+        The files are looked up in this process, so that the load path index sees every directory that is searched.
+        A level with a single object to parse is parsed here, as nothing would run alongside it. An object which cannot
+        be sent back from its worker, or whose file changed meanwhile, is loaded again here.
+        """
+        while dependencies:
+            level, dependencies[:] = dependencies[:], []
+
+            futures = {}
+            try:
+                found = []
+                for dep_spec in level:
+                    if dep_spec in futures or dep_spec in cached_failures:
+                        continue
+                    if self._find_object(dep_spec, idents) is not None:
+                        continue
+                    l.info("Loading %s...", dep_spec)
+                    # an error finding the file is kept in place of the future, as the serial loop only runs into it here
+                    try:
+                        full_spec = self._search_load_path(dep_spec)
+                    except CLEFileNotFoundError as e:
+                        futures[dep_spec] = (None, e)
+                        continue
+                    futures[dep_spec] = (full_spec, None)
+                    found.append(dep_spec)
+                if len(found) > 1:
+                    for dep_spec in found:
+                        full_spec = futures[dep_spec][0]
+                        futures[dep_spec] = (full_spec, pool.submit(_load_in_worker, full_spec))
+
+                for dep_spec in level:
+                    if dep_spec in cached_failures:
+                        l.debug("Skipping implicit dependency %s - cached failure", dep_spec)
+                        continue
+                    if self._find_object(dep_spec, idents) is not None:
+                        l.debug("Skipping implicit dependency %s - already loaded", dep_spec)
+                        continue
+
+                    full_spec, pending = futures.pop(dep_spec)
+                    if full_spec is None:
+                        l.info("... %s not found", dep_spec)
+                        cached_failures.add(dep_spec)
+                        if self._except_missing_libs:
+                            raise pending
+                        continue
+
+                    data = pending.result() if pending is not None else None
+                    dep_obj = None
+                    if data is not None:
+                        try:
+                            dep_obj = _ObjectUnpickler(io.BytesIO(data), self).load()
+                        except (pickle.UnpicklingError, OSError, ValueError) as e:
+                            l.debug("Could not take %s over from its worker: %s", full_spec, e)
+                    if dep_obj is None:
+                        dep_obj = self._load_object_isolated(full_spec)
+
+                    objects.append(dep_obj)
+                    self._add_idents(idents, dep_obj)
+                    dependencies.extend(dep_obj.deps)
+            finally:
+                # these were satisfied by another object of the same level, or are not needed anymore after an error
+                for full_spec, pending in futures.values():
+                    if full_spec is not None and pending is not None:
+                        pending.cancel()
+
     def _register_object(self, obj):
         """
         Insert this object's clerical information into the loader
@@ -743,6 +899,7 @@ class Loader:
                 options = {}
 
         # STEP 3: identify backend
+        options = dict(options)
         backend_spec = options.pop('backend', None)
         backend_cls = self._backend_resolver(backend_spec)
         if backend_cls is None:
@@ -791,6 +948,7 @@ class Loader:
             l.info("Mapping %s at %#x", obj.binary, base_addr)
             self.memory.add_backer(base_addr, obj.memory)
         key_bisect_insort_left(self.all_objects, obj, keyfunc=lambda o: o.min_addr)
+        self._symbol_index.object_mapped(obj)
         obj._is_mapped = True
 
     def _relocate_object(self, obj):
@@ -809,9 +967,9 @@ class Loader:
             self._relocate_object(dep_obj)
 
         l.info("Relocating %s", obj.binary)
-        for reloc in obj.relocs:
-            if not reloc.resolved:
-                reloc.relocate(([self.main_object] if self.main_object is not obj else []) + self.preload_libs + dep_objs + [obj])
+        scope = ResolutionScope(([self.main_object] if self.main_object is not obj else []) + self.preload_libs +
+                                dep_objs + [obj], obj, self._export_lookups)
+        relocate_all(obj.relocs, scope)
 
     # Address space management
 
@@ -867,7 +1025,11 @@ class Loader:
                     # ... skip compatibility check, since it always evaluates to false
                     # with native libraries (which are the only valid dependencies)
                     return path
-                if not backend_cls.check_compatibility(path, self.main_object):
+                arch = self.main_object.arch
+                compatible = self._path_index.cached(
+                    path, ('compatible', backend_cls, arch.name, arch.bits, arch.memory_endness),
+                    lambda: backend_cls.check_compatibility(path, self.main_object))
+                if not compatible:
                     continue
 
             return path
@@ -878,7 +1040,8 @@ class Loader:
         """
         This iterates through each possible path that could possibly be used to satisfy the specification.
 
-        The only check performed is whether the file exists or not.
+        The only check performed is whether the file exists or not. The directories are searched through
+        self._path_index, so that each of them is listed once.
         """
         dirs = []
         dirs.extend(self._custom_ld_path)                   # if we say dirs = blah, we modify the original
@@ -928,23 +1091,39 @@ class Loader:
         if self._case_insensitive:
             spec = spec.lower()
 
+        # only a plain file name can be looked up in the listing of a directory
+        is_name = spec != '' and os.path.basename(spec) == spec
+
+        index = self._path_index
         for libdir in dirs:
-            if self._case_insensitive:
-                insensitive_path = self._path_insensitive(os.path.join(libdir, spec))
-                if insensitive_path is not None:
-                    yield os.path.realpath(insensitive_path)
-            else:
+            listing = index.listing(libdir)
+            if not is_name or listing is None:
+                if self._case_insensitive:
+                    insensitive_path = self._path_insensitive(os.path.join(libdir, spec))
+                    if insensitive_path is not None:
+                        yield os.path.realpath(insensitive_path)
+                else:
+                    fullpath = os.path.realpath(os.path.join(libdir, spec))
+                    if os.path.exists(fullpath):
+                        yield fullpath
+            elif self._case_insensitive:
+                # like _path_insensitive, the exact name wins over the other spellings
+                if index.lookup(libdir, 'names', spec):
+                    yield os.path.realpath(os.path.join(libdir, spec))
+                else:
+                    names = index.lookup(libdir, 'by_lower', spec)
+                    if names:
+                        yield os.path.realpath(os.path.join(libdir, names[0]))
+            elif index.lookup(libdir, 'names', spec):
+                # the entry may be a dangling link
                 fullpath = os.path.realpath(os.path.join(libdir, spec))
                 if os.path.exists(fullpath):
                     yield fullpath
 
-            if self._ignore_import_version_numbers:
-                try:
-                    for libname in os.listdir(libdir):
-                        ilibname = libname.lower() if self._case_insensitive else libname
-                        if ilibname.strip('.0123456789') == spec.strip('.0123456789'):
-                            yield os.path.realpath(os.path.join(libdir, libname))
-                except (IOError, OSError): pass
+            if self._ignore_import_version_numbers and listing is not None:
+                table = 'by_lower_stripped' if self._case_insensitive else 'by_stripped'
+                for libname in index.lookup(libdir, table, spec.strip(VERSION_CHARS)):
+                    yield os.path.realpath(os.path.join(libdir, libname))
 
     @classmethod
     def _path_insensitive(cls, path):
@@ -1015,7 +1194,8 @@ class Loader:
             if os.path.exists(spec):
                 backend_cls = self._static_backend(spec)
                 if backend_cls is not None:
-                    soname = backend_cls.extract_soname(spec)
+                    soname = self._path_index.cached(spec, ('soname', backend_cls),
+                                                     lambda: backend_cls.extract_soname(spec))
                     if soname is not None:
                         yield soname
                         if self._ignore_import_version_numbers:
@@ -1037,12 +1217,16 @@ class Loader:
         except KeyError:
             pass
 
-        with stream_or_path(spec) as stream:
-            for rear in ALL_BACKENDS.values():
-                if rear.is_default and rear.is_compatible(stream):
-                    return rear
+        def sniff():
+            with stream_or_path(spec) as stream:
+                for rear in ALL_BACKENDS.values():
+                    if rear.is_default and rear.is_compatible(stream):
+                        return rear
+            return None
 
-        return None
+        if type(spec) is str:
+            return self._path_index.cached(spec, 'backend', sniff)
+        return sniff()
 
     @staticmethod
     def _backend_resolver(backend, default=None):
@@ -1056,9 +1240,117 @@ class Loader:
             raise CLEError('Invalid backend: %s' % backend)
 
 
+class _ObjectPickler(pickle.Pickler):
+    """
+    Pickles an object parsed in a worker of :meth:`Loader._parallel_load_pool`, leaving out the loader of the worker,
+    which is substituted with the one the object is unpickled for.
+
+    The memory of the object is mostly copy-on-write mappings of its file, see :func:`cle.utils.get_mmaped_backers`.
+    Instead of their contents, only where they are mapped from and the pages the worker changed are sent back, and
+    the file is mapped again where the object is unpickled, see :func:`_remap_backer`.
+    """
+    def __init__(self, file, loader):
+        super(_ObjectPickler, self).__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._loader = loader
+
+    def persistent_id(self, obj):
+        if obj is self._loader:
+            return 'loader'
+        return None
+
+    def reducer_override(self, obj):
+        if type(obj) is Clemory:
+            # with the backers as they are, instead of materialized by Clemory.__getstate__
+            return Clemory.__new__, (Clemory,), obj._pickle_state(list(obj._backers))
+        if type(obj) in (mmap.mmap, memoryview):
+            source = mmaped_backer_source(obj)
+            if source is None:
+                return bytearray, (bytes(obj),)
+            return _remap_backer, _mmaped_backer_args(obj, *source)
+        return NotImplemented
+
+
+def _mmaped_backer_args(backer, path, offset, delta):
+    """
+    :return: The arguments to :func:`_remap_backer` for a backer made by :func:`cle.utils.get_mmaped_backers`.
+    """
+    mapping = backer.obj if type(backer) is memoryview else backer
+    length = len(mapping)
+    if path is None:
+        stamp = None
+        original = bytes(length)
+    else:
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            stamp = (st.st_size, st.st_mtime_ns)
+            f.seek(offset)
+            original = f.read(length)
+
+    # compared a chunk at a time, and the pages of a chunk which differs one by one
+    changes = []
+    chunk = 0x100000
+    for start in range(0, length, chunk):
+        end = min(start + chunk, length)
+        if mapping[start:end] == original[start:end]:
+            continue
+        for page in range(start, end, mmap.PAGESIZE):
+            data = mapping[page:min(page + mmap.PAGESIZE, end)]
+            if data != original[page:page + len(data)]:
+                changes.append((page, data))
+    return path, stamp, offset, delta, length, changes
+
+
+def _remap_backer(path, stamp, offset, delta, length, changes):
+    if path is not None:
+        st = os.stat(path)
+        if (st.st_size, st.st_mtime_ns) != stamp:
+            raise pickle.UnpicklingError("%s changed while it was loaded" % path)
+    return remap_mmaped_backer(path, offset, delta, length, changes)
+
+
+class _ObjectUnpickler(pickle.Unpickler):
+    def __init__(self, file, loader):
+        super(_ObjectUnpickler, self).__init__(file)
+        self._loader = loader
+
+    def persistent_load(self, pid):
+        if pid == 'loader':
+            return self._loader
+        raise pickle.UnpicklingError("Unknown persistent id %r" % (pid,))
+
+
+# the loader a worker process of a parallel load was forked from
+_worker_loader = None
+
+
+def _init_load_worker(loader):
+    global _worker_loader # pylint: disable=global-statement
+    _worker_loader = loader
+
+
+def _load_in_worker(full_spec):
+    """
+    Parse the object at full_spec in a worker process.
+
+    :return: The pickled object, or None if it cannot be pickled.
+    """
+    obj = _worker_loader._load_object_isolated(full_spec)
+    # the file is opened again where the object is unpickled
+    obj.close()
+    try:
+        stream = io.BytesIO()
+        _ObjectPickler(stream, _worker_loader).dump(obj)
+        return stream.getvalue()
+    except (pickle.PicklingError, TypeError, ValueError, AttributeError, RecursionError, OSError) as e:
+        l.debug("Could not send %r back from its worker: %s", obj, e)
+        return None
+
+
 from .errors import CLEError, CLEFileNotFoundError, CLECompatibilityError, CLEOperationError
 from .memory import Clemory
 from .backends import MachO, MetaELF, ELF, PE, Blob, ALL_BACKENDS, Backend
+from .backends.macho.export_trie import ExportIndex
 from .backends.tls import PETLSObject, ELFTLSObject, TLSObject
 from .backends.externs import ExternObject, KernelObject
-from .utils import stream_or_path
+from .backends.relocation import relocate_all, RelocationTable
+from .utils import stream_or_path, mmaped_backer_source, remap_mmaped_backer
@@ -1,15 +1,23 @@
 
 import bisect
+import mmap
 import struct
 from typing import Tuple, Union, List
 
 __all__ = ('Clemory',)
 
+if hasattr(memoryview, 'toreadonly'):
+    _readonly_view = memoryview.toreadonly
+else:
+    # python < 3.8 cannot make a read-only view of a mutable buffer
+    _readonly_view = lambda view: memoryview(view.tobytes())
+
 
 class Clemory:
 
-    __slots__ = ('_arch', '_backers', '_pointer', '_root',
-                 'consecutive', 'min_addr', 'max_addr', 'concrete_target' )
+    __slots__ = ('_arch', '_backers', '_pointer', '_root', '_parents', '_flattened', '_flattened_starts',
+                 '_flattened_disjoint', '_flattened_overlapping', 'consecutive', 'min_addr', 'max_addr',
+                 'concrete_target' )
 
     """
     An object representing a memory space.
@@ -18,9 +26,14 @@ class Clemory:
     """
     def __init__(self, arch, root=False):
         self._arch = arch
-        self._backers = []  # type: Tuple[int, Union[bytearray, Clemory, List[int]]]
+        self._backers = []  # type: Tuple[int, Union[bytearray, mmap.mmap, memoryview, Clemory, List[int]]]
         self._pointer = 0
         self._root = root
+        self._parents = []  # type: List[Clemory]
+        self._flattened = None  # type: List[Tuple[int, int, Union[bytearray, List[int]]]]
+        self._flattened_starts = None  # type: List[int]
+        self._flattened_disjoint = None  # type: List[int]
+        self._flattened_overlapping = None  # type: List[int]
 
         self.consecutive = True
         self.min_addr = 0
@@ -39,49 +52,61 @@ class Clemory:
         Adds a backer to the memory.
 
         :param start:   The address where the backer should be loaded.
-        :param data:    The backer itself. Can be either a bytestring or another :class:`Clemory`.
+        :param data:    The backer itself. Can be either a bytestring, a copy-on-write mmap or a writable memoryview of
+                        one, or another :class:`Clemory`.
         """
         if not data:
             raise ValueError("Backer is empty!")
 
-        if not isinstance(data, (bytes, list, Clemory)):
-            raise TypeError("Data must be a bytes, list, or Clemory object.")
+        if not isinstance(data, _BACKER_TYPES):
+            raise TypeError("Data must be a bytes, list, mmap, memoryview, or Clemory object.")
         if start in self:
             raise ValueError("Address %#x is already backed!" % start)
         if isinstance(data, Clemory) and data._root:
             raise ValueError("Cannot add a root clemory as a backer!")
         if type(data) is bytes:
             data = bytearray(data)
+        if type(data) is Clemory:
+            data._parents.append(self)
         bisect.insort(self._backers, (start, data))
         self._update_min_max()
+        self._invalidate_flattened()
 
     def update_backer(self, start, data):
-        if not isinstance(data, (bytes, list, Clemory)):
-            raise TypeError("Data must be a bytes, list, or Clemory object.")
+        if not isinstance(data, _BACKER_TYPES):
+            raise TypeError("Data must be a bytes, list, mmap, memoryview, or Clemory object.")
         if type(data) is bytes:
             data = bytearray(data)
-        for i, (oldstart, _) in enumerate(self._backers):
+        for i, (oldstart, olddata) in enumerate(self._backers):
             if oldstart == start:
+                if type(olddata) is Clemory:
+                    olddata._parents.remove(self)
+                if type(data) is Clemory:
+                    data._parents.append(self)
                 self._backers[i] = (start, data)
                 break
         else:
             raise ValueError("Can't find backer to update")
 
         self._update_min_max()
+        self._invalidate_flattened()
 
     def remove_backer(self, start):
-        for i, (oldstart, _) in enumerate(self._backers):
+        for i, (oldstart, olddata) in enumerate(self._backers):
             if oldstart == start:
+                if type(olddata) is Clemory:
+                    olddata._parents.remove(self)
                 self._backers.pop(i)
                 break
         else:
             raise ValueError("Can't find backer to remove")
 
         self._update_min_max()
+        self._invalidate_flattened()
 
     def __iter__(self):
         for start, string in self._backers:
-            if isinstance(string, (bytes, list)):
+            if isinstance(string, (bytes, list, mmap.mmap, memoryview)):
                 for x in range(len(string)):
                     yield start + x
             else:
@@ -95,31 +120,16 @@ class Clemory:
             # l.debug("invoked get_byte %x" % (k))
             return self.concrete_target.read_memory(k, 1)
 
-        for start, data in self._backers:
-            if type(data) in (bytearray, list):
-                if 0 <= k - start < len(data):
-                    return data[k - start]
-            elif isinstance(data, Clemory):
-                if data.min_addr <= k - start < data.max_addr:
-                    try:
-                        return data[k - start]
-                    except KeyError:
-                        pass
+        start, end, data = self._find_flattened(k)
+        if start <= k < end:
+            return data[k - start]
         raise KeyError(k)
 
     def __setitem__(self, k, v):
-        for start, data in self._backers:
-            if type(data) in (bytearray, list):
-                if 0 <= k - start < len(data):
-                    data[k - start] = v
-                    return
-            elif isinstance(data, Clemory):
-                if data.min_addr <= k - start < data.max_addr:
-                    try:
-                        data[k - start] = v
-                        return
-                    except KeyError:
-                        pass
+        start, end, data = self._find_flattened(k)
+        if start <= k < end:
+            data[k - start] = v
+            return
         raise KeyError(k)
 
     def __contains__(self, k):
@@ -142,9 +152,17 @@ class Clemory:
             return True
 
     def __getstate__(self):
+        # mappings cannot be pickled, so whatever has been mapped in is materialized here
+        return self._pickle_state([(start, bytearray(backer) if type(backer) in (mmap.mmap, memoryview) else backer)
+                                   for start, backer in self._backers])
+
+    def _pickle_state(self, backers):
+        """
+        Build the pickled state of this clemory, using `backers` in place of its backer list.
+        """
         s = {
             '_arch': self._arch,
-            '_backers': self._backers,
+            '_backers': backers,
             '_pointer': self._pointer,
             '_root': self._root,
             'consecutive': self.consecutive,
@@ -164,27 +182,103 @@ class Clemory:
         self.min_addr = s['min_addr']
         self.max_addr = s['max_addr']
         self.concrete_target = s['concrete_target']
+        self._flattened = None
+        self._flattened_starts = None
+        self._flattened_disjoint = None
+        self._flattened_overlapping = None
+        if not hasattr(self, '_parents'):
+            self._parents = []
+        for _, backer in self._backers:
+            if type(backer) is Clemory:
+                if not hasattr(backer, '_parents'):
+                    backer._parents = []
+                backer._parents.append(self)
+
+    def _invalidate_flattened(self):
+        """
+        Drop the cached flattened view of the backer tree, for this clemory and every clemory it is a backer of.
+        """
+        self._flattened = None
+        self._flattened_starts = None
+        for parent in self._parents:
+            parent._invalidate_flattened()
+
+    def _flattened_backers(self):
+        """
+        Return the backer tree of this clemory flattened into a list of ``(start, end, backer)`` tuples sorted by start
+        address, where no backer is a :class:`Clemory`. The result is cached until the backers of this clemory or
+        of any of its children change.
+        """
+        if self._flattened is None:
+            flattened = []
+            for start, backer in self._backers:
+                if type(backer) is Clemory:
+                    flattened.extend((start + s, start + e, b) for s, e, b in backer._flattened_backers())
+                else:
+                    flattened.append((start, start + len(backer), backer))
+            # backers may overlap, in which case the first one containing an address is the one it is read from. The
+            # spans which start inside an earlier one are kept apart, so that the others can still be bisected
+            starts, disjoint, overlapping = [], [], []
+            max_end = None
+            for i in sorted(range(len(flattened)), key=lambda i: flattened[i][0]):
+                start, end, _ = flattened[i]
+                if max_end is None or start >= max_end:
+                    starts.append(start)
+                    disjoint.append(i)
+                else:
+                    overlapping.append(i)
+                max_end = end if max_end is None else max(max_end, end)
+            overlapping.sort()
+            self._flattened = flattened
+            self._flattened_starts = starts
+            self._flattened_disjoint = disjoint
+            self._flattened_overlapping = overlapping
+        return self._flattened
+
+    def _find_flattened(self, addr):
+        """
+        Return the flattened ``(start, end, backer)`` tuple of the first backer containing `addr`, in the order of the
+        backer tree, or a span which does not contain `addr` if there is none. The caller has to check whether `addr` is
+        actually contained in it.
+
+        The disjoint backers are found by bisection, and only the ones overlapping them are scanned.
+        """
+        flattened = self._flattened_backers()
+        found = None
+        idx = bisect.bisect_right(self._flattened_starts, addr) - 1
+        if idx >= 0 and addr < flattened[self._flattened_disjoint[idx]][1]:
+            found = self._flattened_disjoint[idx]
+        for i in self._flattened_overlapping:
+            if found is not None and i > found:
+                break
+            if flattened[i][0] <= addr < flattened[i][1]:
+                found = i
+                break
+        if found is None:
+            return 0, 0, None
+        return flattened[found]
 
     def backers(self, addr=0):
         """
         Iterate through each backer for this clemory and all its children, yielding tuples of
-        ``(start_addr, backer)`` where each backer is a bytearray.
+        ``(start_addr, backer)`` where each backer is a bytearray or a writable mapping of a file.
 
         :param addr:    An optional starting address - all backers before and not including this
                         address will be skipped.
         """
-        started = addr <= 0
-        for start, backer in self._backers:
-            if not started:
-                end = start + backer.max_addr if type(backer) is Clemory else start + len(backer)
-                if addr >= end:
-                    continue
-                started = True
-            if type(backer) is Clemory:
-                for s, b in backer.backers(addr - start):
-                    yield s + start, b
-            else:
-                yield start, backer
+        flattened = self._flattened_backers()
+        idx = 0
+        if addr > 0 and self._flattened_overlapping:
+            # everything from there on is yielded anyway
+            while idx < len(flattened) and flattened[idx][1] <= addr:
+                idx += 1
+        elif addr > 0:
+            idx = bisect.bisect_right(self._flattened_starts, addr) - 1
+            if idx < 0 or flattened[idx][1] <= addr:
+                idx += 1
+        for i in range(idx, len(flattened)):
+            start, _, backer = flattened[i]
+            yield start, backer
 
     def load(self, addr, n):
         """
@@ -218,6 +312,27 @@ class Clemory:
             raise KeyError(addr)
         return b''.join(views)
 
+    def view(self, addr, n):
+        """
+        Return a read-only memoryview of up to `n` bytes at address `addr`.
+
+        If the range lies within a single backer, the view points directly into it and nothing is copied. Note that such
+        a view reflects any later writes to that memory. Otherwise, the data is copied with the same semantics as
+        :meth:`load`.
+        """
+
+        # concrete memory read
+        if self.is_concrete_target_set():
+            return memoryview(self.concrete_target.read_memory(addr, n))
+
+        start, end, backer = self._find_flattened(addr)
+        if not start <= addr < end:
+            raise KeyError(addr)
+        if addr + n <= end and type(backer) is not list:
+            offset = addr - start
+            return _readonly_view(memoryview(backer)[offset:offset + n])
+        return memoryview(self.load(addr, n))
+
     def store(self, addr, data):
         """
         Write bytes from `data` at address `addr`.
@@ -246,20 +361,19 @@ class Clemory:
         Use the ``struct`` module to unpack the data at address `addr` with the format `fmt`.
         """
 
-        try:
-            start, backer = next(self.backers(addr))
-        except StopIteration:
+        start, end, backer = self._find_flattened(addr)
+        if not start <= addr < end:
             raise KeyError(addr)
 
-        if start > addr:
-            raise KeyError(addr)
-
-        try:
+        size = struct.calcsize(fmt)
+        if addr + size <= end:
             return struct.unpack_from(fmt, backer, addr - start)
-        except struct.error as e:
-            if len(backer) - (addr - start) >= struct.calcsize(fmt):
-                raise e
-            raise KeyError(addr)
+
+        # the data spans several backers
+        data = self.load(addr, size)
+        if len(data) < size:
+            raise KeyError(addr + len(data))
+        return struct.unpack(fmt, data)
 
     def unpack_word(self, addr, size=None, signed=False, endness=None):
         """
@@ -309,6 +423,44 @@ class Clemory:
             data &= (1 << (size*8 if size is not None else self._arch.bits)) - 1
         return self.pack(addr, self._arch.struct_fmt(size=size, signed=signed, endness=endness), data)
 
+    def pack_words(self, addrs, values, size=None, signed=False, endness=None):
+        """
+        Pack many integers into memory, as if calling :meth:`pack_word` with each address of `addrs` and the value of
+        `values` at the same index, in order.
+
+        Words which follow each other in the same backer are packed with a single ``struct.pack_into``.
+
+        :param addrs:   The addresses to pack at.
+        :param values:  The integers to pack.
+
+        The other parameters are the same as for :meth:`pack_word`.
+        """
+        fmt = self._arch.struct_fmt(size=size, signed=signed, endness=endness)
+        word_size = struct.calcsize(fmt)
+        if not signed:
+            mask = (1 << (size*8 if size is not None else self._arch.bits)) - 1
+            values = [value & mask for value in values]
+
+        # sorting is stable, so a later word at the same address still overwrites an earlier one
+        order = sorted(range(len(addrs)), key=addrs.__getitem__)
+        i = 0
+        while i < len(order):
+            addr = addrs[order[i]]
+            start, end, backer = self._find_flattened(addr)
+            if not start <= addr <= end - word_size or type(backer) is list:
+                # unbacked, spanning several backers or not packable, which pack takes care of
+                self.pack(addr, fmt, values[order[i]])
+                i += 1
+                continue
+
+            j = i + 1
+            next_addr = addr + word_size
+            while j < len(order) and addrs[order[j]] == next_addr and next_addr <= end - word_size:
+                j += 1
+                next_addr += word_size
+            struct.pack_into(fmt[0] + str(j - i) + fmt[1:], backer, addr - start, *[values[k] for k in order[i:j]])
+            i = j
+
     def read(self, nbytes):
         """
         The stream-like function that reads up to a number of bytes starting from the current
@@ -365,6 +517,8 @@ class Clemory:
             else:
                 if search_max < start or search_min > start + len(data):
                     continue
+                if type(backer) is memoryview:
+                    backer = backer.tobytes()
                 ptr = search_min - start - 1
                 while True:
                     ptr += 1
@@ -391,7 +545,7 @@ class Clemory:
                 if next_start != start:
                     is_consecutive = False
 
-            if isinstance(backer, (bytearray, list)):
+            if isinstance(backer, (bytearray, list, mmap.mmap, memoryview)):
                 backer_length = len(backer)
                 # Update max_addr
                 if max_addr is None or start + backer_length > max_addr:
@@ -414,3 +568,6 @@ class Clemory:
         self.consecutive = is_consecutive
         self.min_addr = min_addr
         self.max_addr = max_addr
+
+
+_BACKER_TYPES = (bytes, list, mmap.mmap, memoryview, Clemory)
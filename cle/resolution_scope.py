@@ -0,0 +1,106 @@
+"""
+The scope the imports of an object are resolved in while relocating it.
+
+Resolving the symbol of a relocation used to ask every object of the scope for the symbol's name, in order, for every
+single relocation. A :class:`ResolutionScope` remembers what it found for each name, and the answers of the objects
+themselves are remembered across scopes by :class:`ExportLookups`, so that every object is asked for a name once.
+"""
+
+__all__ = ('ResolutionScope', 'ExportLookups', 'find_export')
+
+
+def find_export(objects, name, owner, lookup=None):
+    """
+    Find the symbol the import name of owner resolves to in objects, searched in order. The first symbol which is
+    exported by an object (or just defined, if the object is owner) and not weak wins. The first weak one is the
+    fallback.
+
+    :param objects: The objects to search.
+    :param name:    The name of the symbol.
+    :param owner:   The object whose import this is.
+    :param lookup:  A function to get the symbol of a name from an object with, ``obj.get_symbol(name)`` by default.
+    :return:        A tuple of the strong symbol and the first weak symbol found, either of which may be None. The
+                    search stops at the strong symbol, so the weak one is only ever one that comes before it.
+    """
+    weak_result = None
+    for so in objects:
+        symbol = so.get_symbol(name) if lookup is None else lookup(so, name)
+        if symbol is None:
+            continue
+        # TODO: Was the check for owner obsoleted by the addition of is_static?
+        # I think right now symbol.is_import = !symbol.is_export
+        if symbol.is_export or (not symbol.is_import and so is owner):
+            if not symbol.is_weak:
+                return symbol, weak_result
+            if weak_result is None:
+                weak_result = symbol
+    return None, weak_result
+
+
+class ExportLookups(object):
+    """
+    What the objects of a loader answered when asked for a symbol by name, see :meth:`cle.Backend.get_symbol`.
+
+    The symbols an object has do not change once it is loaded, so neither do the answers.
+    """
+
+    def __init__(self):
+        self._lookups = {}  # id of an object => (object, {name => symbol or None})
+
+    def __getstate__(self):
+        # the lookups are made again when they are needed
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    def get(self, obj, name):
+        """
+        :return: ``obj.get_symbol(name)``
+        """
+        entry = self._lookups.get(id(obj))
+        if entry is None or entry[0] is not obj:
+            entry = self._lookups[id(obj)] = (obj, {})
+        try:
+            return entry[1][name]
+        except KeyError:
+            symbol = entry[1][name] = obj.get_symbol(name)
+            return symbol
+
+
+class ResolutionScope(tuple):
+    """
+    The objects the imports of an object are resolved against, in order. It is passed to the relocations of the object
+    wherever they take a list of objects, see :meth:`cle.backends.relocation.Relocation.relocate`.
+
+    The scope maps each name looked up in it to the strong and weak symbol found for it, see :func:`find_export`.
+
+    :ivar owner:    The object whose imports are resolved in this scope.
+    """
+
+    def __new__(cls, objects, owner, exports=None):
+        return super(ResolutionScope, cls).__new__(cls, objects)
+
+    def __init__(self, objects, owner, exports=None):
+        """
+        :param objects: The objects to search, in order.
+        :param owner:   The object whose imports are resolved in this scope.
+        :param exports: The ExportLookups to ask the objects with, if they are shared with other scopes.
+        """
+        super(ResolutionScope, self).__init__()
+        self.owner = owner
+        self._exports = ExportLookups() if exports is None else exports
+        self._resolved = {}  # name => (strong symbol or None, weak symbol or None)
+
+    def lookup(self, name, owner):
+        """
+        Like :func:`find_export` over the objects of the scope, but done once per name if owner is the owner of the
+        scope.
+        """
+        if owner is not self.owner:
+            return find_export(self, name, owner, self._exports.get)
+        try:
+            return self._resolved[name]
+        except KeyError:
+            result = self._resolved[name] = find_export(self, name, owner, self._exports.get)
+            return result
@@ -0,0 +1,86 @@
+"""
+An index of the symbols of all objects of a loader, sorted by their rebased address.
+
+Looking up a symbol by its exact address used to bisect the symbols of every loaded object in turn. The index keeps
+all of them in one sorted list, so that a lookup is a single bisection.
+"""
+
+import itertools
+
+import sortedcontainers
+
+__all__ = ('SymbolIndex',)
+
+
+class SymbolIndex(object):
+    """
+    The symbols of the mapped objects of a loader, sorted by their rebased address.
+
+    The loader tells the index about each object it maps, whose symbols are then merged in. The symbols of an object
+    can still change once it is mapped (the extern object gets new symbols all the time), so every symbol list counts
+    its changes, see :class:`cle.backends._SymbolList`. Whenever an object that is already indexed changed, only its
+    own symbols are taken out of the index and merged in again.
+    """
+
+    def __init__(self):
+        # (rebased address, number of the object, position in its symbol list, symbol), sorted. The first three tell
+        # all entries apart, so symbols are never compared
+        self._entries = sortedcontainers.SortedList()
+        self._indexed = {}  # id of an indexed object => (object, its symbol list, version of it, its entries)
+        self._mapped = []  # objects mapped since the last update
+        self._numbers = itertools.count()
+
+    def __getstate__(self):
+        # the index is rebuilt when it is needed again
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    def object_mapped(self, obj):
+        """
+        Merge the symbols of obj into the index with the next update.
+        """
+        self._mapped.append(obj)
+
+    def update(self, objects):
+        """
+        Bring the index up to date with the symbol lists of objects, the mapped objects of the loader.
+        """
+        present = dict((id(obj), obj) for obj in objects)
+        remapped = set(id(obj) for obj in self._mapped)
+        self._mapped = []
+
+        # indexed objects which changed, went away or were mapped again
+        for obj_id, (obj, symbols, version, entries) in list(self._indexed.items()):
+            if present.get(obj_id) is not obj or obj_id in remapped or obj.symbols is not symbols or \
+                    symbols.version != version:
+                del self._indexed[obj_id]
+                for entry in entries:
+                    self._entries.remove(entry)
+
+        for obj in objects:
+            if id(obj) in self._indexed:
+                continue
+            number = next(self._numbers)
+            entries = [(symbol.rebased_addr, number, i, symbol) for i, symbol in enumerate(obj.symbols)]
+            self._entries.update(entries)
+            self._indexed[id(obj)] = (obj, obj.symbols, obj.symbols.version, entries)
+
+    def find(self, addr):
+        """
+        Find the symbol at the rebased address addr, which is not an import. If several objects have such a symbol, it
+        is the one of the object with the lowest address. If that object has several, it is the one sorted last.
+
+        :return: the Symbol, or None
+        """
+        lo = self._entries.bisect_left((addr,))
+        hi = self._entries.bisect_left((addr + 1,))
+
+        found = None
+        for _, _, _, symbol in self._entries[lo:hi]:
+            if symbol.is_import:
+                continue
+            if found is None or symbol.owner is found.owner or symbol.owner.min_addr < found.owner.min_addr:
+                found = symbol
+        return found
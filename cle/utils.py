@@ -1,5 +1,8 @@
 import os
+import mmap
+import weakref
 import contextlib
+from collections import OrderedDict
 
 from .errors import CLEError, CLEFileNotFoundError
 
@@ -57,6 +60,76 @@ def get_mmaped_data(stream, offset, length, page_size):
     data = stream.read(read_length)
     return data.ljust(read_length, b'\0')
 
+# the mappings made by get_mmaped_backers => (absolute path of the file or None if anonymous, offset of the mapping in
+# the file, offset of the backer in the mapping), see mmaped_backer_source
+_mmaped_sources = weakref.WeakKeyDictionary()
+
+def get_mmaped_backers(stream, offset, length, total_length=None):
+    """
+    Map `length` bytes at `offset` of the file behind `stream` as a private copy-on-write mapping, followed by zeros up to
+    `total_length`. Nothing is read up front: pages are only materialized when they are touched, and writes never reach
+    the file. The zero-filled tail is an anonymous mapping, so it consists of virtual zero pages until it is written to.
+    Like :func:`get_mmaped_data`, anything past the end of the file reads as zeros.
+
+    :return:    A list of ``(offset, backer)`` tuples, with offsets relative to the start of the mapping, or None if
+                `stream` is not backed by a regular file and cannot be mapped.
+    """
+    try:
+        fileno = stream.fileno()
+        file_size = os.fstat(fileno).st_size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+    if total_length is None:
+        total_length = length
+    length = max(0, min(length, file_size - offset))
+
+    backers = []
+    if length > 0:
+        map_offset = ALIGN_DOWN(offset, mmap.ALLOCATIONGRANULARITY)
+        delta = offset - map_offset
+        mapping = mmap.mmap(fileno, delta + length, access=mmap.ACCESS_COPY, offset=map_offset)
+        name = getattr(stream, 'name', None)
+        if isinstance(name, str) and os.path.isfile(name):
+            _mmaped_sources[mapping] = (os.path.abspath(name), map_offset, delta)
+        backers.append((0, mapping if delta == 0 else memoryview(mapping)[delta:]))
+    if total_length > length:
+        mapping = mmap.mmap(-1, total_length - length)
+        _mmaped_sources[mapping] = (None, 0, 0)
+        backers.append((length, mapping))
+    return backers
+
+def mmaped_backer_source(backer):
+    """
+    :return:    ``(path, offset, delta)`` for a backer made by :func:`get_mmaped_backers`, where the backer starts
+                `delta` bytes into a mapping of the file at `path` from `offset` on, or of zeros if `path` is None.
+                None for any other backer.
+    """
+    mapping = backer.obj if type(backer) is memoryview else backer
+    if type(mapping) is not mmap.mmap:
+        return None
+    source = _mmaped_sources.get(mapping)
+    if source is None or (backer is mapping) != (source[2] == 0) or len(backer) != len(mapping) - source[2]:
+        return None
+    return source
+
+def remap_mmaped_backer(path, offset, delta, length, changes):
+    """
+    Map a backer described by :func:`mmaped_backer_source` again, as a private copy-on-write mapping of `length`
+    bytes, and write what was changed in the original over it.
+
+    :param changes: A list of ``(offset, data)`` tuples, with offsets relative to the start of the mapping.
+    """
+    if path is None:
+        mapping = mmap.mmap(-1, length)
+    else:
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), length, access=mmap.ACCESS_COPY, offset=offset)
+    _mmaped_sources[mapping] = (path, offset, delta)
+    for change_offset, data in changes:
+        mapping[change_offset:change_offset + len(data)] = data
+    return mapping if delta == 0 else memoryview(mapping)[delta:]
+
 @contextlib.contextmanager
 def stream_or_path(obj, perms='rb'):
     if hasattr(obj, 'read') and hasattr(obj, 'seek'):
@@ -112,3 +185,49 @@ def key_bisect_insort_left(lst, item, lo=0, hi=None, keyfunc=lambda x: x):
         else:
             hi = mid
     lst.insert(lo, item)
+
+
+class LRUCache(object):
+    """
+    A mapping which keeps at most maxsize items. Looking an item up or storing it makes it the most recently used one,
+    and storing an item beyond maxsize drops the least recently used one.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self._items[key]
+        except KeyError:
+            return default
+        self._items.move_to_end(key)
+        return value
+
+    def setdefault(self, key, default):
+        try:
+            value = self._items[key]
+        except KeyError:
+            self[key] = default
+            return default
+        self._items.move_to_end(key)
+        return value
+
+    def pop(self, key, *default):
+        return self._items.pop(key, *default)
+
+    def clear(self):
+        self._items.clear()
+
+    def __setitem__(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,134 @@
+"""
+Helpers for the Mach-O tests, which build the binaries they load instead of depending on test binaries.
+"""
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import archinfo
+
+import cle
+from cle.memory import Clemory
+
+BASE = 0x100000000
+
+CPU_TYPE_X86_64 = 0x1000007
+CPU_TYPE_ARM64 = 0x100000c
+
+MH_EXECUTE = 2
+MH_DYLIB = 6
+MH_PIE = 0x200000
+
+
+def segment_command(segname, vmaddr, vmsize, fileoff, filesize, nsects=0, prot=5):
+    """Packs an LC_SEGMENT_64 command, to be followed by its nsects sections"""
+    return struct.pack('<2I16s4Q2i2I', 0x19, 72 + 80 * nsects, segname, vmaddr, vmsize, fileoff, filesize, prot, prot,
+                       nsects, 0)
+
+
+def section(sectname, segname, addr, size, offset, align=0, flags=0, reserved1=0, reserved2=0):
+    """Packs a section_64 of a segment command"""
+    return struct.pack('<16s16s2Q8I', sectname, segname, addr, size, offset, align, 0, 0, flags, reserved1, reserved2,
+                       0)
+
+
+def build_macho(commands, filetype=MH_EXECUTE, cputype=CPU_TYPE_ARM64, cpusubtype=0, flags=0, size=0x1000):
+    """
+    Builds a 64-bit Mach-O of size bytes with the given load commands after its header. The rest of it is zeros, for
+    the caller to fill in.
+
+    :return: A bytearray.
+    """
+    data = bytearray(size)
+    blob = b''.join(commands)
+    data[0:0x20] = struct.pack('<8I', 0xfeedfacf, cputype, cpusubtype, filetype, len(commands), len(blob), flags, 0)
+    data[0x20:0x20 + len(blob)] = blob
+    return data
+
+
+class MachOTestCase(unittest.TestCase):
+    """
+    A test case with a temporary directory to write binaries to. The directory is removed, and the loaders made with
+    :meth:`load` are closed, after each test.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self._loaders = []
+
+    def tearDown(self):
+        for ld in self._loaders:
+            ld.close()
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, data):
+        """
+        :return: The path of the file name in the temporary directory, holding data.
+        """
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def load(self, path, **kwargs):
+        """
+        :return: A loader for path, which does not load its libraries unless told to.
+        """
+        kwargs.setdefault('auto_load_libs', False)
+        ld = cle.Loader(path, **kwargs)
+        self._loaders.append(ld)
+        return ld
+
+
+class FakeSegment(object):
+    def __init__(self, vaddr, memsize):
+        self.vaddr = vaddr
+        self.memsize = memsize
+
+
+class FakeImage(object):
+    """A library to bind to, which exports the addresses in exports and records the names looked up in it"""
+
+    def __init__(self, exports):
+        self.exports = exports
+        self.lookups = []
+
+    def resolve_export(self, name):
+        self.lookups.append(name)
+        return self.exports.get(name)
+
+
+class FakeMachO(object):
+    """
+    Just what the rebase, bind and chained fixup tables need of a MachO: size bytes of memory filled with fill, linked
+    at linked_base and mapped at mapped_base, the symbols bound so far and library, its library of ordinal 1.
+    """
+
+    def __init__(self, arch=None, linked_base=BASE, mapped_base=None, size=0x8000, fill=b'\0', library=None):
+        self.arch = arch if arch is not None else archinfo.ArchAArch64()
+        self.struct_byteorder = '<' if self.arch.memory_endness == 'Iend_LE' else '>'
+        self.linked_base = linked_base
+        self.mapped_base = linked_base if mapped_base is None else mapped_base
+        self.image_base_delta = self.mapped_base - linked_base
+        self.memory = Clemory(self.arch, root=True)
+        self.memory.add_backer(0, fill * size)
+        self.loader = None
+        self.provides = 'fake'
+        self.exports_by_name = {}
+        self.symbols = {}
+        self._ordered_symbols = []
+        self.library = library
+
+    def get_symbols_by_name_and_ordinal(self, name, lib_ord):
+        return [sym for sym in self.symbols.get(name, ()) if sym.library_ordinal == lib_ord]
+
+    def _add_symbol(self, symbol):
+        self.symbols.setdefault(symbol.name, []).append(symbol)
+
+    def get_imported_library(self, lib_ord):
+        return self.library if lib_ord == 1 else None
+
+    def _add_bind_xrefs(self, symbol, xrefs):
+        symbol.bind_xrefs.extend(xrefs)
@@ -0,0 +1,76 @@
+import os
+import pickle
+import shutil
+import tempfile
+
+import nose
+
+import cle
+
+TEST_BASE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                         os.path.join('..', '..', 'binaries'))
+
+
+def _loaded_state(ld):
+    return ([(obj.binary, obj.mapped_base) for obj in ld.all_objects],
+            [(sym.name, sym.rebased_addr) for sym in ld.symbols],
+            ld.memory.load(ld.min_addr, ld.max_addr - ld.min_addr))
+
+
+def test_pickle_loader():
+    ld = cle.Loader(os.path.join(TEST_BASE, 'tests', 'x86_64', 'fauxware'))
+    ld2 = pickle.loads(pickle.dumps(ld))
+    nose.tools.assert_equal(_loaded_state(ld), _loaded_state(ld2))
+    nose.tools.assert_is(ld2.find_symbol('authenticate').owner, ld2.main_object)
+
+
+def test_cache_dir():
+    tempdir = tempfile.mkdtemp()
+    try:
+        binary = os.path.join(tempdir, 'fauxware')
+        shutil.copy(os.path.join(TEST_BASE, 'tests', 'x86_64', 'fauxware'), binary)
+        cache_dir = os.path.join(tempdir, 'cache')
+        # creating the cache directory would change the directory of the binary, which is searched for its libraries
+        os.mkdir(cache_dir)
+
+        ld = cle.Loader(binary, cache_dir=cache_dir)
+        nose.tools.assert_equal(len(os.listdir(cache_dir)), 1)
+
+        cached = cle.Loader(binary, cache_dir=cache_dir)
+        nose.tools.assert_equal(_loaded_state(ld), _loaded_state(cached))
+        nose.tools.assert_is(cached.main_object.loader, cached)
+        nose.tools.assert_is(cached.find_symbol('authenticate').owner, cached.main_object)
+
+        # the cached memory is copy-on-write
+        cached.memory.store(cached.main_object.entry, b'\xcc')
+        nose.tools.assert_equal(cle.Loader(binary, cache_dir=cache_dir).memory[ld.main_object.entry],
+                                ld.memory[ld.main_object.entry])
+
+        # different options are cached separately
+        cle.Loader(binary, cache_dir=cache_dir, auto_load_libs=False)
+        nose.tools.assert_equal(len(os.listdir(cache_dir)), 2)
+
+        # unrelated files appearing in a searched directory do not invalidate it
+        open(os.path.join(tempdir, 'unrelated'), 'w').close()
+        hit = cle.Loader(binary, cache_dir=cache_dir)
+        nose.tools.assert_is_instance(hit.main_object.memory._backers[0][1], memoryview)
+
+        # touching a file that went into the image invalidates it
+        st = os.stat(binary)
+        os.utime(binary, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+        reloaded = cle.Loader(binary, cache_dir=cache_dir)
+        nose.tools.assert_not_is_instance(reloaded.main_object.memory._backers[0][1], memoryview)
+        nose.tools.assert_equal(_loaded_state(ld), _loaded_state(reloaded))
+
+        # so does a library appearing earlier in the load path
+        libc = os.path.join(tempdir, 'libc.so.6')
+        shutil.copy(ld.shared_objects['libc.so.6'].binary, libc)
+        reloaded = cle.Loader(binary, cache_dir=cache_dir)
+        nose.tools.assert_equal(reloaded.shared_objects['libc.so.6'].binary, os.path.realpath(libc))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    test_pickle_loader()
+    test_cache_dir()
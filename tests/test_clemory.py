@@ -1,3 +1,8 @@
+import os
+import pickle
+import tempfile
+
+import archinfo
 import cffi
 import nose.tools
 
@@ -114,6 +119,146 @@ def test_clemory_contains():
     nose.tools.assert_equal(clemory.consecutive, True)
 
 
+def test_clemory_nested_lookup():
+    root = cle.Clemory(None, root=True)
+    child1 = cle.Clemory(None)
+    child1.add_backer(0, b"A" * 0x10)
+    child1.add_backer(0x20, b"B" * 0x10)
+    child2 = cle.Clemory(None)
+    child2.add_backer(0, b"C" * 0x10)
+    root.add_backer(0x1000, child1)
+    root.add_backer(0x2000, child2)
+
+    nose.tools.assert_equal(root[0x1000], ord("A"))
+    nose.tools.assert_equal(root[0x102f], ord("B"))
+    nose.tools.assert_equal(root[0x2005], ord("C"))
+    nose.tools.assert_false(0x1010 in root)
+    nose.tools.assert_false(0xfff in root)
+    nose.tools.assert_false(0x2010 in root)
+    nose.tools.assert_equal([start for start, _ in root.backers()], [0x1000, 0x1020, 0x2000])
+    nose.tools.assert_equal([start for start, _ in root.backers(0x1015)], [0x1020, 0x2000])
+    nose.tools.assert_equal([start for start, _ in root.backers(0x3000)], [])
+
+    # writes go through to the child backers
+    root[0x1021] = ord("X")
+    nose.tools.assert_equal(child1.load(0x20, 3), b"BXB")
+
+    # changing a child's backers must be visible from the root
+    child1.add_backer(0x10, b"D" * 0x10)
+    nose.tools.assert_equal(root.load(0x100e, 4), b"AADD")
+    child2.update_backer(0, b"E" * 0x10)
+    nose.tools.assert_equal(root[0x2000], ord("E"))
+    root.remove_backer(0x2000)
+    nose.tools.assert_false(0x2000 in root)
+    nose.tools.assert_equal(child2._parents, [])
+
+
+
+def test_clemory_overlapping_backers():
+    # an address backed twice is read from and written to the first backer containing it, as it always was
+    clemory = cle.Clemory(None, root=True)
+    clemory.add_backer(0x10, b"B" * 0x10)
+    clemory.add_backer(0, b"A" * 0x18)
+    nose.tools.assert_equal(clemory[0x14], ord("A"))
+    nose.tools.assert_equal(clemory.load(0x14, 8), b"A" * 4 + b"B" * 4)
+    nose.tools.assert_equal(clemory.unpack(0x18, "4s"), (b"BBBB",))
+    clemory[0x12] = ord("X")
+    nose.tools.assert_equal(clemory._backers[0][1][0x12], ord("X"))
+    nose.tools.assert_equal(clemory._backers[1][1], bytearray(b"B" * 0x10))
+    nose.tools.assert_equal([start for start, _ in clemory.backers(0x14)], [0, 0x10])
+
+def test_clemory_overlapping_index():
+    # one overlapping backer does not keep the others from being found by bisection
+    clemory = cle.Clemory(None, root=True)
+    clemory.add_backer(0x540, b"O" * 0x80)
+    nested = cle.Clemory(None)
+    nested.add_backer(0, b"N" * 0x20)
+    nested.add_backer(0x100, b"M" * 0x10)
+    clemory.add_backer(0x470, nested)
+    for i in range(16):
+        clemory.add_backer(0x100 * i, bytes([i]) * 0x80)
+
+    flattened = clemory._flattened_backers()
+    nose.tools.assert_equal(sorted(flattened[i][0] for i in clemory._flattened_overlapping),
+                            [0x470, 0x540, 0x570])
+    nose.tools.assert_equal(len(clemory._flattened_starts), 16)
+    for addr in range(0x1000):
+        expected = next((span for span in flattened if span[0] <= addr < span[1]), None)
+        found = clemory._find_flattened(addr)
+        nose.tools.assert_equal(found if found[0] <= addr < found[1] else None, expected)
+    nose.tools.assert_equal(clemory.load(0x47e, 4), b"\x04\x04NN")
+    nose.tools.assert_equal(clemory[0x570], ord("M"))
+    nose.tools.assert_equal(clemory[0x5a0], ord("O"))
+    nose.tools.assert_equal(clemory[0x600], 6)
+
+def test_clemory_view():
+    clemory = cle.Clemory(None, root=True)
+    clemory.add_backer(0, b"ABCDEFGH")
+    clemory.add_backer(8, b"IJKLMNOP")
+    clemory.add_backer(0x20, b"QRSTUVWX")
+
+    view = clemory.view(2, 4)
+    nose.tools.assert_equal(bytes(view), b"CDEF")
+    nose.tools.assert_true(view.readonly)
+    # contiguous views are not copies
+    clemory.store(2, b"c")
+    nose.tools.assert_equal(bytes(view), b"cDEF")
+
+    # spanning and truncated reads behave like load()
+    nose.tools.assert_equal(bytes(clemory.view(6, 4)), b"GHIJ")
+    nose.tools.assert_equal(bytes(clemory.view(0xe, 4)), b"OP")
+    nose.tools.assert_raises(KeyError, clemory.view, 0x18, 4)
+
+    nose.tools.assert_equal(clemory.unpack(6, "<I"), (0x4a494847,))
+    nose.tools.assert_equal(clemory.unpack(0x20, "<I"), (0x54535251,))
+    nose.tools.assert_raises(KeyError, clemory.unpack, 0xe, "<I")
+    nose.tools.assert_raises(KeyError, clemory.unpack, 0x18, "<I")
+
+
+def test_clemory_mmap_backers():
+    fd, path = tempfile.mkstemp()
+    try:
+        os.write(fd, b"0123456789abcdef")
+        os.close(fd)
+        with open(path, 'rb') as f:
+            backers = cle.utils.get_mmaped_backers(f, 4, 8, 16)
+        nose.tools.assert_equal([(off, len(b)) for off, b in backers], [(0, 8), (8, 8)])
+
+        clemory = cle.Clemory(None, root=True)
+        for off, backer in backers:
+            clemory.add_backer(0x1000 + off, backer)
+        nose.tools.assert_equal(clemory.load(0x1000, 16), b"456789ab" + b"\0" * 8)
+        nose.tools.assert_equal(clemory[0x1007], ord("b"))
+
+        # stores are copy-on-write and never reach the file
+        clemory.store(0x1000, b"XY")
+        clemory.store(0x100e, b"Z")
+        nose.tools.assert_equal(clemory.load(0x1000, 4), b"XY67")
+        nose.tools.assert_equal(clemory[0x100e], ord("Z"))
+        with open(path, 'rb') as f:
+            nose.tools.assert_equal(f.read(), b"0123456789abcdef")
+
+        clemory2 = pickle.loads(pickle.dumps(clemory))
+        nose.tools.assert_equal(clemory2.load(0x1000, 16), clemory.load(0x1000, 16))
+    finally:
+        os.unlink(path)
+
+
+def test_clemory_pack_words():
+    clemory = cle.Clemory(archinfo.ArchAMD64(), root=True)
+    clemory.add_backer(0, b"\0" * 0x20)
+    clemory.add_backer(0x20, b"\0" * 0x10)
+
+    # a run which ends with its backer, a word written twice and a negative value
+    clemory.pack_words([0x10, 0x0, 0x8, 0x18, 0x28, 0x8], [3, 1, 2, 5, -1, 4])
+    nose.tools.assert_equal(clemory.unpack(0, "<4Q"), (1, 4, 3, 5))
+    nose.tools.assert_equal(clemory.unpack(0x20, "<2Q"), (0, 0xffffffffffffffff))
+
+    # like pack_word, words must not span backers
+    nose.tools.assert_raises(KeyError, clemory.pack_words, [0x1c], [0])
+    nose.tools.assert_raises(KeyError, clemory.pack_words, [0x30], [0])
+
+
 def main():
     g = globals()
     for func_name, func in g.items():
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from elftools.elf import elffile
+
+import cle
+from cle.backends.elf.symbol import ELFSymbol
+from cle.backends.elf.symbol_type import ELFSymbolType
+
+
+SYMBOLS = [
+    # name, value, size, info, other, shndx
+    (b'', 0, 0, 0, 0, 0),
+    (b'local_func', 0x1000, 0x10, 0x02, 0, 1),
+    (b'global_obj', 0x2000, 8, 0x11, 0, 1),
+    (b'weak_func', 0x1010, 0x20, 0x22, 0, 1),
+    (b'hidden_func', 0x1030, 4, 0x12, 2, 1),
+    (b'ifunc', 0x1040, 4, 0x1a, 0, 1),
+    (b'common', 8, 4, 0x11, 0, 0xfff2),
+    (b'absolute', 0x1234, 0, 0x10, 0, 0xfff1),
+    (b'import', 0, 0, 0x12, 0, 0),
+    (b'os_type', 0x1050, 0, 0x1b, 0, 0xff00),
+]
+
+
+def build_elf(elfclass, endness):
+    """Builds an x86-64 or MIPS ELF executable without segments whose only contents are a .symtab"""
+    strtab = b'\0'
+    symtab = b''
+    for name, value, size, info, other, shndx in SYMBOLS:
+        st_name = 0
+        if name:
+            st_name = len(strtab)
+            strtab += name + b'\0'
+        if elfclass == 64:
+            symtab += struct.pack(endness + 'IBBHQQ', st_name, info, other, shndx, value, size)
+        else:
+            symtab += struct.pack(endness + 'IIIBBH', st_name, value, size, info, other, shndx)
+    shstrtab = b'\0.symtab\0.strtab\0.shstrtab\0'
+
+    if elfclass == 64:
+        ehdr, shdr, entsize, machine = endness + '16sHHIQQQIHHHHHH', endness + 'IIQQQQIIQQ', 24, 62
+    else:
+        ehdr, shdr, entsize, machine = endness + '16sHHIIIIIHHHHHH', endness + 'IIIIIIIIII', 16, 8
+    ehsize, shentsize = struct.calcsize(ehdr), struct.calcsize(shdr)
+
+    symtab_off = ehsize
+    strtab_off = symtab_off + len(symtab)
+    shstrtab_off = strtab_off + len(strtab)
+    shoff = shstrtab_off + len(shstrtab)
+
+    ident = b'\x7fELF' + bytes([1 if elfclass == 32 else 2, 1 if endness == '<' else 2, 1, 3])
+    data = struct.pack(ehdr, ident, 2, machine, 1, 0x1000, 0, shoff, 0, ehsize, 0, 0, shentsize, 4, 3)
+    data += symtab + strtab + shstrtab
+    data += b'\0' * shentsize
+    # sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size, sh_link, sh_info, sh_addralign, sh_entsize
+    data += struct.pack(shdr, 1, 2, 0, 0, symtab_off, len(symtab), 2, 2, 8, entsize)
+    data += struct.pack(shdr, 9, 3, 0, 0, strtab_off, len(strtab), 0, 0, 1, 0)
+    data += struct.pack(shdr, 17, 3, 0, 0, shstrtab_off, len(shstrtab), 0, 0, 1, 0)
+    return data
+
+
+def symbol_fields(symbol):
+    return (symbol.name, symbol.relative_addr, symbol.size, symbol.type, symbol.subtype, symbol.binding,
+            symbol.is_hidden, symbol.section, symbol.is_static, symbol.is_common, symbol.is_weak, symbol.is_local,
+            symbol.is_import, symbol.is_export)
+
+
+class TestELFSymbolTable(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _load(self, elfclass, endness):
+        path = os.path.join(self.tmpdir, 'elf%d' % elfclass)
+        with open(path, 'wb') as f:
+            f.write(build_elf(elfclass, endness))
+        return cle.Loader(path, auto_load_libs=False)
+
+    def _check(self, elfclass, endness):
+        ld = self._load(elfclass, endness)
+        obj = ld.main_object
+
+        symtab = [sec for sec in obj.reader.iter_sections() if isinstance(sec, elffile.SymbolTableSection)][0]
+        expected = [symbol_fields(ELFSymbol(obj, sym_re)) for sym_re in symtab.iter_symbols()]
+        self.assertEqual(len(expected), len(SYMBOLS))
+        self.assertEqual(sorted(map(symbol_fields, obj.symbols), key=repr), sorted(expected, key=repr))
+
+        # the decoded symbols are the ones get_symbol returns
+        for sym_re in symtab.iter_symbols():
+            self.assertIn(obj.get_symbol(sym_re), obj.symbols)
+
+        self.assertEqual(obj.get_symbol('ifunc').subtype, ELFSymbolType.STT_GNU_IFUNC)
+        self.assertTrue(obj.get_symbol('weak_func').is_weak)
+        self.assertTrue(obj.get_symbol('hidden_func').is_hidden)
+        self.assertTrue(obj.get_symbol('common').is_common)
+        self.assertTrue(obj.get_symbol('import').is_import)
+        self.assertEqual(obj.get_symbol('os_type').section, 0xff00)
+        ld.close()
+
+    def test_elf64(self):
+        self._check(64, '<')
+
+    def test_elf32_big_endian(self):
+        self._check(32, '>')
+
+
+if __name__ == '__main__':
+    unittest.main()
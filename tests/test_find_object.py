@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+import os
+import unittest
+
+import cle
+from macho_helpers import BASE, MH_DYLIB, MH_EXECUTE, MachOTestCase, build_macho, segment_command
+
+
+def build_text_macho(filetype, base):
+    """Builds an arm64 Mach-O of the given filetype with just a __TEXT segment"""
+    return build_macho([segment_command(b'__TEXT', base, 0x1000, 0, 0x1000)], filetype=filetype)
+
+
+class CountingLoader(cle.Loader):
+    def __init__(self, *args, **kwargs):
+        self.idents_of = []
+        super(CountingLoader, self).__init__(*args, **kwargs)
+
+    def _possible_idents(self, spec, lowercase=False):
+        if not lowercase and isinstance(spec, cle.Backend):
+            self.idents_of.append(spec)
+        return super(CountingLoader, self)._possible_idents(spec, lowercase=lowercase)
+
+
+class TestFindObject(MachOTestCase):
+    def setUp(self):
+        super(TestFindObject, self).setUp()
+        self.paths = [self.write('main', build_text_macho(MH_EXECUTE, BASE))]
+        for name in ('liba.dylib', 'libb.dylib', 'libc.dylib'):
+            self.paths.append(self.write(name, build_text_macho(MH_DYLIB, 0)))
+
+    def test_find_object(self):
+        ld = CountingLoader(self.paths[0], auto_load_libs=False, force_load_libs=self.paths[1:])
+        self.assertEqual(len(ld.all_objects), 4)
+
+        # the idents of each object are generated once for the table used while loading, and once to register it
+        for obj in ld.all_objects:
+            self.assertEqual(ld.idents_of.count(obj), 2)
+
+        libb = ld.find_object('libb.dylib')
+        self.assertEqual(libb.binary, os.path.realpath(self.paths[2]))
+        self.assertIsNone(ld.find_object('libd.dylib'))
+
+        # objects which are not registered yet
+        idents = {}
+        ld._add_idents(idents, libb)
+        self.assertIs(ld._find_object(libb.binary, idents), libb)
+        self.assertIs(ld.find_object(libb.binary, extra_objects=[libb]), libb)
+        ld.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
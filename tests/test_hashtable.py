@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+import io
+import struct
+import unittest
+
+import archinfo
+
+from cle.backends.elf.hashtable import ELFHashTable, GNUHashTable
+
+NAMES = ['malloc', 'free', 'printf', 'puts', 'strlen', 'memcpy', 'exit', 'abort', 'open', 'close', 'read', 'write']
+
+
+class FakeSymbol(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeStringTable(object):
+    def __init__(self, data):
+        self.data = data
+
+    def get_string(self, offset):
+        return self.data[offset:self.data.index(b'\0', offset)].decode()
+
+
+class FakeSymbolTable(object):
+    """Just what the hash tables need of a pyelftools SymbolTableSection, an Elf64_Sym table with only names"""
+
+    def __init__(self, names, offset):
+        strtab = b'\0'
+        self.data = struct.pack('<IBBHQQ', 0, 0, 0, 0, 0, 0)
+        for name in names:
+            self.data += struct.pack('<IBBHQQ', len(strtab), 0x12, 0, 1, 0, 0)
+            strtab += name.encode() + b'\0'
+        self.names = [''] + names
+        self.header = {'sh_offset': offset, 'sh_entsize': 24}
+        self.stringtable = FakeStringTable(strtab)
+        self.stream = None
+        self.fetched = []
+
+    def __getitem__(self, key):
+        return self.header[key]
+
+    def get_symbol(self, n):
+        self.fetched.append(n)
+        return FakeSymbol(self.names[n])
+
+
+def build_sysv(names, nbuckets):
+    buckets = [0] * nbuckets
+    chains = [0] * (len(names) + 1)
+    for n, name in enumerate(names, 1):
+        h = ELFHashTable.elf_hash(name) % nbuckets
+        chains[n] = buckets[h]
+        buckets[h] = n
+    return struct.pack('<II', nbuckets, len(chains)) + struct.pack('<%dI' % (nbuckets + len(chains)), *(buckets + chains))
+
+
+def build_gnu(names, nbuckets):
+    """Orders names the way the table needs them, returns the table and the names in their order"""
+    names = sorted(names, key=lambda name: GNUHashTable.gnu_hash(name) % nbuckets)
+    symndx, maskwords, shift2 = 1, 2, 6
+    bloom = [0] * maskwords
+    buckets = [0] * nbuckets
+    chains = []
+    for n, name in enumerate(names, symndx):
+        h = GNUHashTable.gnu_hash(name)
+        bloom[(h // 64) % maskwords] |= (1 << (h % 64)) | (1 << ((h >> shift2) % 64))
+        if buckets[h % nbuckets] == 0:
+            buckets[h % nbuckets] = n
+        last = n == len(names) or GNUHashTable.gnu_hash(names[n]) % nbuckets != h % nbuckets
+        chains.append((h & ~1) | int(last))
+    table = struct.pack('<IIII', nbuckets, symndx, maskwords, shift2)
+    table += struct.pack('<%dQ' % maskwords, *bloom)
+    table += struct.pack('<%dI' % (nbuckets + len(chains)), *(buckets + chains))
+    return table, names
+
+
+class TestHashTables(unittest.TestCase):
+    def _check(self, table_cls, table, names):
+        symtab = FakeSymbolTable(names, len(table))
+        stream = io.BytesIO(table + symtab.data)
+        symtab.stream = stream
+        hashtable = table_cls(symtab, stream, 0, archinfo.ArchAMD64())
+
+        for name in names:
+            self.assertEqual(hashtable.get(name).name, name)
+        self.assertIsNone(hashtable.get('nonexistent'))
+
+        # only the matching symbols are made into pyelftools symbols
+        del symtab.fetched[:]
+        found = hashtable.get_many(['puts', 'nonexistent', 'exit', 'puts'])
+        self.assertEqual(sorted(found), ['exit', 'puts'])
+        self.assertEqual(found['exit'].name, 'exit')
+        self.assertEqual(len(symtab.fetched), 2)
+
+    def test_sysv(self):
+        self._check(ELFHashTable, build_sysv(NAMES, 5), NAMES)
+
+    def test_gnu(self):
+        table, names = build_gnu(NAMES, 5)
+        self._check(GNUHashTable, table, names)
+        # the number of symbols is found from the chains
+        symtab = FakeSymbolTable(names, len(table))
+        symtab.stream = io.BytesIO(table + symtab.data)
+        hashtable = GNUHashTable(symtab, symtab.stream, 0, archinfo.ArchAMD64())
+        self.assertEqual(len(hashtable.chains), len(names))
+        self.assertEqual(len(hashtable._st_names), len(names) + 1)
+
+    def test_hash(self):
+        self.assertEqual(GNUHashTable.gnu_hash(''), 5381)
+        self.assertEqual(GNUHashTable.gnu_hash('printf'), 0x156b2bb8)
+        self.assertEqual(ELFHashTable.elf_hash('printf'), 0x077905a6)
+
+
+if __name__ == '__main__':
+    unittest.main()
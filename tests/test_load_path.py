@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+import os
+import shutil
+import tempfile
+import unittest
+
+import cle
+from cle.load_path import LoadPathIndex, DirectoryListing, directory_stamps_valid
+from cle.utils import LRUCache
+
+
+class TestLoadPathIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.libdir = os.path.join(self.tmpdir, 'lib')
+        os.mkdir(self.libdir)
+        for name in ('libfoo.so.1', 'LibBar.so', 'main'):
+            with open(os.path.join(self.libdir, name), 'wb') as f:
+                f.write(b'\0' * 0x10)
+        os.symlink(os.path.join(self.tmpdir, 'missing'), os.path.join(self.libdir, 'libdangling.so'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _loader(self, **kwargs):
+        return cle.Loader(os.path.join(self.libdir, 'main'), auto_load_libs=False, use_system_libs=False,
+                          main_opts={'backend': 'blob', 'arch': 'x86_64'}, **kwargs)
+
+    def test_listing(self):
+        listing = DirectoryListing(['libc.so.6', 'LIBC.so', 'libm.so'])
+        self.assertEqual(listing.by_lower['libc.so'], ['LIBC.so'])
+        self.assertEqual(listing.by_stripped['libc.so'], ['libc.so.6'])
+        self.assertEqual(listing.by_lower_stripped['libc.so'], ['libc.so.6', 'LIBC.so'])
+
+    def test_index(self):
+        index = LoadPathIndex()
+        listing = index.listing(self.libdir)
+        self.assertIn('libfoo.so.1', listing.names)
+        self.assertIsNone(index.listing(os.path.join(self.tmpdir, 'missing')))
+
+        # another index shares the listing until the directory changes
+        self.assertIs(LoadPathIndex().listing(self.libdir), listing)
+        open(os.path.join(self.libdir, 'libnew.so'), 'wb').close()
+        os.utime(self.libdir, ns=(0, 0))
+        self.assertIn('libnew.so', LoadPathIndex().listing(self.libdir).names)
+        # but not within one index
+        self.assertIs(index.listing(self.libdir), listing)
+
+        path = os.path.join(self.libdir, 'LibBar.so')
+        calls = []
+        compute = lambda: calls.append(None) or len(calls)
+        self.assertEqual(index.cached(path, 'key', compute), 1)
+        self.assertEqual(LoadPathIndex().cached(path, 'key', compute), 1)
+        self.assertEqual(index.cached(path, 'other', compute), 2)
+
+    def test_directory_stamps(self):
+        index = LoadPathIndex()
+        self.assertEqual(index.lookup(self.libdir, 'names', 'libfoo.so.1'), ('libfoo.so.1',))
+        self.assertEqual(index.lookup(self.libdir, 'by_stripped', 'libbaz.so'), ())
+        self.assertIsNone(index.lookup(os.path.join(self.tmpdir, 'missing'), 'names', 'libfoo.so.1'))
+        stamps = index.directory_stamps()
+        self.assertTrue(directory_stamps_valid(stamps))
+
+        # an entry nothing looked up does not matter
+        open(os.path.join(self.libdir, 'unrelated'), 'wb').close()
+        os.utime(self.libdir, ns=(0, 0))
+        self.assertTrue(directory_stamps_valid(stamps))
+
+        # one which a lookup would find does
+        open(os.path.join(self.libdir, 'libbaz.so.2'), 'wb').close()
+        os.utime(self.libdir, ns=(0, 1))
+        self.assertFalse(directory_stamps_valid(stamps))
+
+        # so does a directory which could not be listed appearing
+        os.mkdir(os.path.join(self.tmpdir, 'missing'))
+        self.assertFalse(directory_stamps_valid(stamps[1:]))
+
+    def test_lru(self):
+        cache = LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache.get('a'), 1)
+        # b is the least recently used one now
+        self.assertEqual(cache.setdefault('c', 3), 3)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.setdefault('a', 4), 1)
+        cache['d'] = 5
+        self.assertNotIn('c', cache)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertEqual(cache.pop('a', None), None)
+
+    def test_possible_paths(self):
+        ld = self._loader(ld_path=[self.libdir])
+        self.assertIn(os.path.realpath(os.path.join(self.libdir, 'libfoo.so.1')), list(ld._possible_paths('libfoo.so')))
+        self.assertNotIn(os.path.realpath(os.path.join(self.libdir, 'LibBar.so')),
+                         list(ld._possible_paths('libbar.so')))
+        ld.close()
+
+        ld = self._loader(ld_path=[self.libdir], ignore_import_version_numbers=False)
+        self.assertEqual(list(ld._possible_paths('libfoo.so')), [])
+        self.assertEqual(list(ld._possible_paths('libdangling.so')), [])
+        ld.close()
+
+        ld = self._loader(ld_path=[self.libdir], case_insensitive=True)
+        self.assertIn(os.path.realpath(os.path.join(self.libdir, 'LibBar.so')), list(ld._possible_paths('libbar.so')))
+        ld.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,6 +19,19 @@ def test_fauxware():
     nose.tools.assert_equal(sorted(list(ld.main_object.exports_by_name))[-1], '_sneaky')
 
 
+def test_symbol_index():
+    machofile = os.path.join(TEST_BASE, 'tests', 'armhf', 'FileProtection-05.arm64.macho')
+    ld = cle.Loader(machofile, auto_load_libs=False)
+    macho = ld.main_object
+    for sym in macho.symbols:
+        nose.tools.assert_in(sym, macho.get_symbol(sym.name, include_stab=True))
+        nose.tools.assert_in(sym, macho.get_symbols_by_name_and_ordinal(sym.name, sym.library_ordinal,
+                                                                       include_stab=True))
+    for name in set(sym.name for sym in macho.symbols):
+        expected = [sym for sym in macho.symbols if sym.name == name and not sym.is_stab]
+        nose.tools.assert_equal(macho.get_symbol(name), expected)
+
+
 # Contributed September 2019 by Fraunhofer SIT (https://www.sit.fraunhofer.de/en/).
 def test_dummy():
     """All-in-one testcase exercising all features in combination for 64 bit binaries"""
@@ -117,4 +130,5 @@ def test_dummy():
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
     test_fauxware()
+    test_symbol_index()
     test_dummy()
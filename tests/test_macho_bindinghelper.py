@@ -3,129 +3,20 @@
 import unittest
 import os
 
-import cle
+import archinfo
 
-from cle.backends.macho.binding import BindingState,read_sleb,read_uleb
+import cle
 
-from cle.backends.macho.binding import n_opcode_done,n_opcode_set_dylib_ordinal_imm,n_opcode_set_dylib_ordinal_uleb
-from cle.backends.macho.binding import n_opcode_set_dylib_special_imm,n_opcode_set_trailing_flags_imm,n_opcode_set_type_imm
-from cle.backends.macho.binding import n_opcode_set_addend_sleb
+from cle.backends.macho.binding import read_sleb, read_uleb, BindingHelper
+from cle.backends.macho.binding import decode_bind_blob, read_uleb_array, read_sleb_array
 
 from cle import CLEInvalidBinaryError
+from macho_helpers import FakeImage, FakeMachO, FakeSegment
 
 TEST_BASE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
                                          os.path.join('..', '..', 'binaries'))
 
 
-class TestBindingState(unittest.TestCase):
-    def setUp(self):
-        self.uut_64 = BindingState(True)
-        self.uut_32 = BindingState(False)
-
-    def test_init_64(self):
-        """Ensure that initialization works properly for 64 bit
-           Assertions taken from ImageLoaderMachOCompressed.cpp, start of eachBind
-        """
-        self.assertEqual(self.uut_64.segment_index, 0)
-        self.assertEqual(self.uut_64.address, 0)
-        self.assertEqual(self.uut_64.sym_flags, 0)
-        self.assertEqual(self.uut_64.sym_name, "")
-        self.assertEqual(self.uut_64.lib_ord, 0)
-        self.assertEqual(self.uut_64.addend, 0)
-        self.assertEqual(self.uut_64.done, False)
-
-    def test_init_32(self):
-        """Ensure that initialization works properly for 32 bit
-           Assertions taken from ImageLoaderMachOCompressed.cpp, start of eachBind
-        """
-        self.assertEqual(self.uut_32.segment_index, 0)
-        self.assertEqual(self.uut_32.address, 0)
-        self.assertEqual(self.uut_32.sym_flags, 0)
-        self.assertEqual(self.uut_32.sym_name, "")
-        self.assertEqual(self.uut_32.lib_ord, 0)
-        self.assertEqual(self.uut_32.addend, 0)
-        self.assertEqual(self.uut_32.done, False)
-
-
-    def test_add_address_ov_32(self):
-        """Ensure proper updating of address and wraparound (32bits)"""
-        self.skipTest("TODO test_add_address_ov_32: add_address_ov does not consider the 64 bit flag and does not change the "
-                      "size of uintptr_t to 2**32 so calculation will fail")
-
-        self.uut_32.add_address_ov(10000, 10000)
-        self.assertEqual(self.uut_32.address, 20000)
-
-        self.uut_32.add_address_ov(699999999, 10000000)
-        self.assertEqual(self.uut_32.address, 709999999)
-
-        self.uut_32.add_address_ov(4294967295, 10000)
-        self.assertEqual(self.uut_32.address, 9999)
-
-        self.uut_32.add_address_ov(3294967295, 1000100000)
-        self.assertEqual(self.uut_32.address, 99999)
-
-        #TODO test_add_address_ov_32: we do probably do not expect negative numbers as second argument, but then the address will be negative... and it does not wrap around. Test is commented out.
-        self.uut_32.add_address_ov(10000, -10000)
-        self.assertEqual(self.uut_32.address, 0)
-
-        self.uut_32.add_address_ov(10000, -100000)
-        self.assertEqual(self.uut_32.address, 4294877296)
-
-
-    def test_add_address_ov_64(self):
-        """Ensure proper updating of address and wraparound (64bits)"""
-        self.uut_64.add_address_ov(10000, 10000)
-        self.assertEqual(self.uut_64.address, 20000)
-
-        self.uut_64.add_address_ov(0, 0)
-        self.assertEqual(self.uut_64.address, 0)
-
-        self.uut_64.add_address_ov(699999999999, 10000000000)
-        self.assertEqual(self.uut_64.address, 709999999999)
-
-        self.uut_64.add_address_ov(1844674407370955160, 10000000000)
-        self.assertEqual(self.uut_64.address, 1844674417370955160)
-
-        self.uut_64.add_address_ov(17000000000000000000, 1900000000000000000)
-        self.assertEqual(self.uut_64.address, 453255926290448384)
-
-
-        #TODO test_add_address_ov_64: we do probably do not expect negative numbers as second argument, but then the address will be negative... and it does not wrap around. Test is commented out.
-        #self.uut_64.add_address_ov(123456, -10000000000)
-        #self.assertEqual(self.uut_64.address, 18446744063709551616)
-
-        self.uut_64.add_address_ov(1000, -1000)
-        self.assertEqual(self.uut_64.address, 0)
-
-
-
-    def test_check_address_bounds(self):
-        """Ensure that exception gets thrown under the right circumstances"""
-        self.uut_64 = BindingState(True)
-
-        #TODO test_check_address_bounds: Why does this raise an exception?
-        # address and seg_end address are not 0 when entering the function
-        #self.uut_64.address = 0
-        #self.uut_64.seg_end_address = 0
-        #self.uut_64.check_address_bounds()
-
-        self.uut_64 = BindingState(True)
-        self.uut_64.address = 0
-        self.uut_64.seg_end_address = 1
-        self.uut_64.check_address_bounds()
-
-        self.uut_64 = BindingState(True)
-        self.uut_64.address = 10000
-        self.uut_64.seg_end_address = 10
-        with self.assertRaises(CLEInvalidBinaryError):
-            self.uut_64.check_address_bounds()
-
-        self.uut_64 = BindingState(True)
-        self.uut_64.address = -10000
-        self.uut_64.seg_end_address = -100000
-        with self.assertRaises(CLEInvalidBinaryError):
-            self.uut_64.check_address_bounds()
-
 class TestLEB(unittest.TestCase):
     def test_read_uleb(self):
         # Test vector from wikipedia https://en.wikipedia.org/wiki/LEB128
@@ -146,153 +37,150 @@ class TestLEB(unittest.TestCase):
         expected = (-624485,3)
         self.assertEqual(result,expected)
 
+    def test_read_uleb_array(self):
+        buffer = b'\x00\xE5\x8E\x26\x7f\x80\x01\xff\xff\xff\xff\xff\xff\xff\xff\xff\x01\x80'
+        result = read_uleb_array(buffer)
+        self.assertEqual(list(result), [0, 624485, 127, 128, 2 ** 64 - 1])
 
-class TestBindingHelper(unittest.TestCase):
-
-    # Note: These tests will require mocking MachOBinary objects
+        result = read_uleb_array(buffer, 1, 5)
+        self.assertEqual(list(result), [624485, 127])
 
-    def setUp(self):
-        pass
+    def test_read_sleb_array(self):
+        buffer = b'\xE5\x8E\x26\x9b\xf1\x59\x7f\x3f\x40\x80\x7f'
+        result = read_sleb_array(buffer)
+        self.assertEqual(list(result), [624485, -624485, -1, 63, -64, -128])
 
-    def tearDown(self):
-        pass
 
-    def test_do_normal_bind(self):
-        self.skipTest("TODO")  # implement this after all submethods are tested for a complete run
-        # the test data should exercise each case at least once and ensure that submethods interact
-        # well i.e. that the aggregation produces correct results
-
-    def test_do_lazy_bind(self):
-        self.skipTest("TODO")  # implement this after all submethods are tested for a complete run
-        # the test data should exercise each case at least once and ensure that submethods interact
-        # well i.e. that the aggregation produces correct results
-
-    # the format is def X(state,binary,immediate,blob) => state
-    def test_n_opcode_done(self):
-        s = BindingState(is_64=True)
-        s.done = False
-        n_opcode_done(s, None, None, None)
-        self.assertTrue(s.done)
-
-        s = BindingState(is_64=True)
-        s.done = True
-        n_opcode_done(s, None, None, None)
-        self.assertTrue(s.done)
-
-    def test_n_opcode_set_dylib_ordinal_imm(self):
-        s = BindingState(is_64=True)
-
-        const = 0x123456789
-        n_opcode_set_dylib_ordinal_imm(s, None, const, None)
-        self.assertEqual(s.lib_ord, const)
-
-        const = -10000
-        n_opcode_set_dylib_ordinal_imm(s, None, const, None)
-        self.assertEqual(s.lib_ord, const)
-
-        const = 0
-        n_opcode_set_dylib_ordinal_imm(s, None, const, None)
-        self.assertEqual(s.lib_ord, const)
-
-        const = 0x123456789123456789123456789
-        n_opcode_set_dylib_ordinal_imm(s, None, const, None)
-        self.assertEqual(s.lib_ord, const)
-
-    def n_opcode_set_dylib_ordinal_uleb_helper(self, blob, expected):
-        s = BindingState(is_64=True)
-
-        s.index = 0
-        n_opcode_set_dylib_ordinal_uleb(s, None, None, blob)
-        self.assertEqual(s.lib_ord, expected)
-
-    def test_n_opcode_set_dylib_ordinal_uleb(self):
-        self.n_opcode_set_dylib_ordinal_uleb_helper(b"\xE5\x8E\x26", 624485)
-        self.n_opcode_set_dylib_ordinal_uleb_helper(b"\x00\x00", 0)
-        self.n_opcode_set_dylib_ordinal_uleb_helper(b"\x11\x00", 17)
-
-    def test_n_opcode_set_dylib_special_imm(self):
-        s = BindingState(is_64=True)
-
-        n_opcode_set_dylib_special_imm(s, None, 0, None)
-        self.assertEqual(s.lib_ord, 0)
-
-        n_opcode_set_dylib_special_imm(s, None, 100, None)
-        self.assertEqual(s.lib_ord, -12)
-
-        n_opcode_set_dylib_special_imm(s, None, 156, None)
-        self.assertEqual(s.lib_ord, -4)
-
-        n_opcode_set_dylib_special_imm(s, None, 1, None)
-        self.assertEqual(s.lib_ord, -15)
-
-        n_opcode_set_dylib_special_imm(s, None, 88, None)
-        self.assertEqual(s.lib_ord, -8)
-
-        n_opcode_set_dylib_special_imm(s, None, 255, None)
-        self.assertEqual(s.lib_ord, -1)
-
-    def test_n_opcode_set_symbol_trailing_flags_imm(self):
-        self.n_opcode_set_symbol_trailing_flags_imm_helper(b"THISISATESTSYMBOL", 100)
-        self.n_opcode_set_symbol_trailing_flags_imm_helper(b"", -100)
-        self.n_opcode_set_symbol_trailing_flags_imm_helper(b"ASDF", 300)
-
-    def n_opcode_set_symbol_trailing_flags_imm_helper(self, teststr, immediate):
-        s = BindingState(is_64=True)
-
-        s.index = 0
-        blob = teststr + b"\x00"
-
-        n_opcode_set_trailing_flags_imm(s, None, immediate, blob)
-        self.assertEqual(s.sym_name, teststr.decode('ascii'))
-        # plus one because there is the 0 byte at the end
-        self.assertEqual(s.index, len(teststr) + 1)
-        self.assertEqual(s.sym_flags, immediate)
-
-    def test_n_opcode_set_type_imm(self):
-        s = BindingState(is_64=True)
-        immediate = 1000
-        n_opcode_set_type_imm(s, None, immediate, None)
-        self.assertEqual(s.binding_type, immediate)
-
-        immediate = 0
-        n_opcode_set_type_imm(s, None, immediate, None)
-        self.assertEqual(s.binding_type, immediate)
-
-        immediate = -250
-        n_opcode_set_type_imm(s, None, immediate, None)
-        self.assertEqual(s.binding_type, immediate)
-
-    def n_opcode_set_addend_sleb_helper(self, blob, expected):
-        s = BindingState(is_64=True)
-        s.index = 0
-        n_opcode_set_addend_sleb(s, None, None, blob)
-        self.assertEqual(s.addend, expected)
-
-    def test_n_opcode_set_addend_sleb(self):
-        self.n_opcode_set_addend_sleb_helper(b"\x00\x00\x00", 0)
-        self.n_opcode_set_addend_sleb_helper(b"\x15\x15\x15", 21)
-        self.n_opcode_set_addend_sleb_helper(b"\xFF\x1F\xEE", 4095)
-
-    def test_n_opcode_set_segment_and_offset_uleb(self):
-        # pylint: disable=unused-variable
-        s = BindingState(is_64=True)
-        self.skipTest("TODO: The function needs a binary with segments to test")
-
-    def test_n_opcode_add_addr_uleb(self):
-        self.skipTest("TODO")
-
-    def test_n_opcode_do_bind(self):
-        self.skipTest("TODO")
-
-    def test_n_opcode_do_bind_add_addr_uleb(self):
-        self.skipTest("TODO")
-
-    def test_n_opcode_do_bind_add_addr_imm_scaled(self):
-        self.skipTest("TODO")
+class TestDecodeBindBlob(unittest.TestCase):
+    def setUp(self):
+        self.segments = [FakeSegment(0x1000, 0x1000), FakeSegment(0x2000, 0x1000)]
+
+    def test_normal(self):
+        blob = (b"\x51"  # SET_TYPE_IMM pointer
+                b"\x12"  # SET_DYLIB_ORDINAL_IMM 2
+                b"\x40_foo\x00"  # SET_SYMBOL_TRAILING_FLAGS_IMM
+                b"\x71\x10"  # SET_SEGMENT_AND_OFFSET_ULEB 1, 0x10
+                b"\x90"  # DO_BIND
+                b"\xa0\x08"  # DO_BIND_ADD_ADDR_ULEB 8
+                b"\x60\x7f"  # SET_ADDEND_SLEB -1
+                b"\x40_bar\x00"  # SET_SYMBOL_TRAILING_FLAGS_IMM
+                b"\xb1"  # DO_BIND_ADD_ADDR_IMM_SCALED 1
+                b"\x3e"  # SET_DYLIB_SPECIAL_IMM -2
+                b"\xc0\x03\x08"  # DO_BIND_ULEB_TIMES_SKIPPING_ULEB 3, 8
+                b"\x00"  # DONE
+                b"\x90")  # never reached
+        table = decode_bind_blob(blob, self.segments, True)
+        self.assertEqual(list(table), [
+            (0x2010, 2, "_foo", 1, 0),
+            (0x2018, 2, "_foo", 1, 0),
+            (0x2028, 2, "_bar", 1, -1),
+            (0x2038, -2, "_bar", 1, -1),
+            (0x2048, -2, "_bar", 1, -1),
+            (0x2058, -2, "_bar", 1, -1),
+        ])
+        self.assertEqual(table.names, ["_foo", "_bar"])
+
+    def test_lazy(self):
+        blob = (b"\x70\x20\x11\x40_foo\x00\x90\x00"
+                b"\x71\x08\x12\x40_bar\x00\x90\x00"
+                b"\x70\x28\x40_foo\x00\x90\x00")
+        table = decode_bind_blob(blob, self.segments, False, lazy=True)
+        self.assertEqual(list(table), [
+            (0x1020, 1, "_foo", 1, 0),
+            (0x2008, 2, "_bar", 1, 0),
+            (0x1028, 0, "_foo", 1, 0),
+        ])
+
+    def test_out_of_bounds(self):
+        blob = b"\x51\x40_foo\x00\x71\xf8\x1f\xc0\x02\x00\x00"
+        with self.assertRaises(CLEInvalidBinaryError):
+            decode_bind_blob(blob, self.segments, True)
+
+    def _bind_one(self, opcodes, is_64=True, name=b"\x40_sym\x00"):
+        """Decodes opcodes followed by a bind of name at the start of segment 0, returns the only record"""
+        blob = opcodes + name
+        blob += b"\x70\x00\x90\x00"
+        table = decode_bind_blob(blob, self.segments, is_64)
+        self.assertEqual(len(table), 1)
+        return next(iter(table))
+
+    def test_set_dylib_ordinal_imm(self):
+        self.assertEqual(self._bind_one(b"\x10")[1], 0)
+        self.assertEqual(self._bind_one(b"\x1f")[1], 15)
+
+    def test_set_dylib_ordinal_uleb(self):
+        self.assertEqual(self._bind_one(b"\x20\xE5\x8E\x26")[1], 624485)
+        self.assertEqual(self._bind_one(b"\x20\x00")[1], 0)
+        self.assertEqual(self._bind_one(b"\x20\x11")[1], 17)
+
+    def test_set_dylib_special_imm(self):
+        self.assertEqual(self._bind_one(b"\x30")[1], 0)
+        self.assertEqual(self._bind_one(b"\x3f")[1], -1)
+        self.assertEqual(self._bind_one(b"\x3e")[1], -2)
+        self.assertEqual(self._bind_one(b"\x3d")[1], -3)
+        self.assertEqual(self._bind_one(b"\x31")[1], -15)
+
+    def test_set_symbol_trailing_flags_imm(self):
+        for name in (b"THISISATESTSYMBOL", b"", b"ASDF"):
+            # the flags do not matter for binding
+            self.assertEqual(self._bind_one(b"", name=b"\x48" + name + b"\x00")[2], name.decode())
+
+    def test_set_symbol_not_utf8(self):
+        # a name which does not decode does not fail the whole table
+        self.assertEqual(self._bind_one(b"", name=b"\x40_f\xffoo\x00")[2], "_f\ufffdoo")
+
+    def test_set_type_imm(self):
+        for binding_type in (1, 2, 3):
+            self.assertEqual(self._bind_one(bytes([0x50 | binding_type]))[3], binding_type)
+
+    def test_set_addend_sleb(self):
+        self.assertEqual(self._bind_one(b"\x60\x00")[4], 0)
+        self.assertEqual(self._bind_one(b"\x60\x15")[4], 21)
+        self.assertEqual(self._bind_one(b"\x60\xFF\x1F")[4], 4095)
+        self.assertEqual(self._bind_one(b"\x60\x9b\xf1\x59")[4], -624485)
+
+    def test_set_segment_and_add_addr(self):
+        blob = (b"\x40_sym\x00"
+                b"\x71\x10"  # SET_SEGMENT_AND_OFFSET_ULEB 1, 0x10
+                b"\x90"  # DO_BIND
+                b"\x70\x20"  # SET_SEGMENT_AND_OFFSET_ULEB 0, 0x20
+                b"\x80\x10"  # ADD_ADDR_ULEB 0x10
+                b"\x90"  # DO_BIND
+                # ADD_ADDR_ULEB 2**64 - 0x20, i.e. -0x20 through overflow
+                b"\x80\xe0\xff\xff\xff\xff\xff\xff\xff\xff\x01"
+                b"\x90\x00")
+        table = decode_bind_blob(blob, self.segments, True)
+        self.assertEqual(list(table.addresses), [0x2010, 0x1030, 0x1018])
 
-    def test_n_opcode_do_bind_uleb_times_skipping_uleb(self):
-        self.skipTest("TODO")
 
+class TestBindingHelper(unittest.TestCase):
+    def test_apply_bind_table(self):
+        # linked at 0x1000 and mapped at 0x10000
+        binary = FakeMachO(archinfo.ArchAMD64(), linked_base=0x1000, mapped_base=0x10000, size=0x2000, fill=b"\xcc",
+                           library=FakeImage({"_foo": 0x50000, "_bar": 0x60000}))
+        segments = [FakeSegment(0x1000, 0x1000), FakeSegment(0x2000, 0x1000)]
+        blob = (b"\x51\x11\x40_foo\x00"
+                b"\x71\x00"  # SET_SEGMENT_AND_OFFSET_ULEB 1, 0
+                b"\xc0\x02\x00"  # DO_BIND_ULEB_TIMES_SKIPPING_ULEB 2, 0
+                b"\x60\x10\x40_bar\x00\x90"  # addend 0x10
+                b"\x12\x40_baz\x00\x90"  # from a library which is not loaded
+                b"\x11\x60\x00\x52\x40_foo\x00\x90"  # ABSOLUTE32
+                b"\x53\x90"  # PCREL32
+                b"\x00")
+        BindingHelper(binary).apply_bind_table(decode_bind_blob(blob, segments, True))
+
+        self.assertEqual(binary.memory.unpack(0x1000, "<QQQQ"), (0x50000, 0x50000, 0x60010, 0))
+        pcrel = (0x50000 - (0x2028 - 0x1000 + 0x10000 + 4)) % 2 ** 32
+        self.assertEqual(binary.memory.unpack(0x1020, "<IIII"), (0x50000, 0xcccccccc, pcrel, 0xcccccccc))
+
+        foo, = binary.get_symbols_by_name_and_ordinal("_foo", 1)
+        self.assertEqual(foo.bind_xrefs, [0x2000, 0x2008, 0x2020, 0x2028])
+        self.assertEqual(binary.get_symbols_by_name_and_ordinal("_bar", 1)[0].bind_xrefs, [0x2010])
+        self.assertEqual(binary.get_symbols_by_name_and_ordinal("_baz", 2)[0].bind_xrefs, [0x2018])
+        self.assertEqual(len(binary._ordered_symbols), 3)
+
+
+class TestBindRealBinaries(unittest.TestCase):
     def test_bind_real_32(self):
         """
         Executes binding against a real binary - not optimal since it does not cover all possible opcodes but it is
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+import struct
+import unittest
+
+from cle.backends.macho.chained_fixups import decode_chained_fixups, apply_chained_fixups, _decode_arm64e, \
+    DYLD_CHAINED_PTR_ARM64E, DYLD_CHAINED_PTR_ARM64E_USERLAND, NO_IMPORT
+
+from cle import CLEInvalidBinaryError, CLECompatibilityError
+from macho_helpers import BASE as LINKED_BASE, FakeMachO
+
+
+def build_blob(pointer_format=2, page_start=0x10):
+    """Builds the fixups of a single page at 0x4000 and the imports _malloc from ordinal 1 and _free (weak, flat)"""
+    blob = bytearray(0x80)
+    struct.pack_into('<7I', blob, 0, 0, 0x20, 0x60, 0x70, 2, 1, 0)
+    struct.pack_into('<4I', blob, 0x20, 3, 0, 0, 0x10)
+    struct.pack_into('<IHHQIHH', blob, 0x30, 24, 0x4000, pointer_format, 0x4000, 0, 1, page_start)
+    struct.pack_into('<2I', blob, 0x60, 1, 0xfe | 1 << 8 | 8 << 9)
+    blob[0x70:0x7e] = b'_malloc\0_free\0'
+    return bytes(blob)
+
+
+def store_chain(binary):
+    """A rebase to 0x100001000, a bind to import 0 and one to import 1 with an addend of 8"""
+    binary.memory.store(0x4010, struct.pack('<Q', 0x100001000 | 2 << 51))
+    binary.memory.store(0x4018, struct.pack('<Q', 1 << 63 | 0 | 4 << 51))
+    binary.memory.store(0x4028, struct.pack('<Q', 1 << 63 | 1 | 8 << 24))
+
+
+class TestChainedFixups(unittest.TestCase):
+    def test_decode(self):
+        binary = FakeMachO()
+        store_chain(binary)
+        table = decode_chained_fixups(build_blob(), binary.memory, LINKED_BASE)
+
+        self.assertEqual(table.imports, [(1, '_malloc', 0, 0), (-2, '_free', 1, 0)])
+        self.assertEqual(list(table), [
+            (0x100004010, NO_IMPORT, 0x100001000),
+            (0x100004018, 0, 0),
+            (0x100004028, 1, 8),
+        ])
+        self.assertEqual(list(table.iter_pages()), [(0, 3)])
+
+    def test_apply(self):
+        binary = FakeMachO(mapped_base=LINKED_BASE + 0x10000)
+        store_chain(binary)
+        table = decode_chained_fixups(build_blob(), binary.memory, LINKED_BASE)
+
+        # the rebases are written when the binary is mapped, the binds are left alone
+        apply_chained_fixups(binary, table, delta=0x10000)
+        self.assertEqual(binary.memory.unpack_word(0x4010), 0x100011000)
+        self.assertEqual(binary.memory.unpack_word(0x4018), 1 << 63 | 0 | 4 << 51)
+
+        # and the other way around once the imports are resolved
+        binary.memory.store(0x4010, bytes(8))
+        apply_chained_fixups(binary, table, import_targets=[0x7000, None])
+        self.assertEqual(binary.memory.unpack_word(0x4010), 0)
+        self.assertEqual(binary.memory.unpack_word(0x4018), 0x7000)
+        self.assertEqual(binary.memory.unpack_word(0x4028), 0)
+
+    def test_arm64e(self):
+        # plain rebase, with the high byte of the pointer
+        self.assertEqual(_decode_arm64e(0x100001000 | 0x12 << 43 | 3 << 51, LINKED_BASE, DYLD_CHAINED_PTR_ARM64E),
+                         (3, NO_IMPORT, 0x1200000100001000))
+        self.assertEqual(_decode_arm64e(0x1000, LINKED_BASE, DYLD_CHAINED_PTR_ARM64E_USERLAND),
+                         (0, NO_IMPORT, 0x100001000))
+        # authenticated rebase, which is always relative to the mach header
+        self.assertEqual(_decode_arm64e(1 << 63 | 0x2000, LINKED_BASE, DYLD_CHAINED_PTR_ARM64E),
+                         (0, NO_IMPORT, 0x100002000))
+        # bind with a negative addend
+        self.assertEqual(_decode_arm64e(1 << 62 | 3 | (-4 & 0x7ffff) << 32, LINKED_BASE, DYLD_CHAINED_PTR_ARM64E),
+                         (0, 3, 2 ** 64 - 4))
+
+    def test_invalid(self):
+        binary = FakeMachO()
+        with self.assertRaises(CLEInvalidBinaryError):
+            # the chain starts at the last byte of the page
+            decode_chained_fixups(build_blob(page_start=0x3fff), binary.memory, LINKED_BASE)
+        with self.assertRaises(CLECompatibilityError):
+            decode_chained_fixups(build_blob(pointer_format=3), binary.memory, LINKED_BASE)
+
+
+if __name__ == '__main__':
+    unittest.main()
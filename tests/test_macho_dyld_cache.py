@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+import struct
+import unittest
+
+from cle.backends.macho import MachO, DyldSharedCache
+from macho_helpers import CPU_TYPE_X86_64, MH_DYLIB, MachOTestCase, build_macho, section, segment_command
+
+CACHE_BASE = 0x7fff20000000
+IMAGE_ADDR = CACHE_BASE + 0x1000
+
+
+def build_cache():
+    """Builds a cache with a single mapping, holding a dylib listed under two paths with one global and one local symbol"""
+    data = bytearray(0x3100)
+
+    # header, mappings, images and their paths
+    struct.pack_into('<16s4I', data, 0, b'dyld_v1  x86_64', 0x60, 1, 0x80, 2)
+    struct.pack_into('<2Q', data, 0x48, 0x3000, 0x100)  # local symbols
+    struct.pack_into('<3Q2I', data, 0x60, CACHE_BASE, 0x2000, 0, 5, 5)
+    struct.pack_into('<3Q2I', data, 0x80, IMAGE_ADDR, 0, 0, 0x100, 0)
+    struct.pack_into('<3Q2I', data, 0xa0, IMAGE_ADDR, 0, 0, 0x120, 0)
+    data[0x100:0x116] = b'/usr/lib/libfoo.dylib\0'
+    data[0x120:0x138] = b'/usr/lib/libfoo.1.dylib\0'
+
+    # the dylib: __TEXT with a __text section, LC_ID_DYLIB and LC_SYMTAB
+    commands = [
+        segment_command(b'__TEXT', IMAGE_ADDR, 0x1000, 0x1000, 0x1000, nsects=1) +
+        section(b'__text', b'__TEXT', IMAGE_ADDR + 0x800, 0x10, 0x1800),
+        struct.pack('<6I', 0xd, 48, 24, 0, 0, 0) + b'/usr/lib/libfoo.dylib\0'.ljust(24, b'\0'),
+        struct.pack('<6I', 0x2, 24, 0x1c00, 1, 0x1d00, 0x10),
+    ]
+    data[0x1000:0x2000] = build_macho(commands, filetype=MH_DYLIB, cputype=CPU_TYPE_X86_64, cpusubtype=3)
+    data[0x1800:0x1810] = b'\x90' * 0x10
+    struct.pack_into('<IBBHQ', data, 0x1c00, 1, 0xf, 1, 0, IMAGE_ADDR + 0x800)
+    data[0x1d00:0x1d06] = b'\0_foo\0'
+
+    # the local symbols
+    struct.pack_into('<6I', data, 0x3000, 0x18, 1, 0x28, 0x10, 0x40, 1)
+    struct.pack_into('<IBBHQ', data, 0x3018, 1, 0xe, 1, 0, IMAGE_ADDR + 0x808)
+    data[0x3028:0x3030] = b'\0_local\0'
+    struct.pack_into('<3I', data, 0x3040, 0x1000, 0, 1)
+
+    return bytes(data)
+
+
+class TestDyldSharedCache(MachOTestCase):
+    def setUp(self):
+        super(TestDyldSharedCache, self).setUp()
+        self.path = self.write('dyld_shared_cache_x86_64', build_cache())
+        self.ld = self.load(self.path)
+        self.cache = self.ld.main_object
+
+    def test_cache(self):
+        self.assertIsInstance(self.cache, DyldSharedCache)
+        self.assertEqual(self.cache.arch.name, 'AMD64')
+        self.assertEqual(self.cache.min_addr, CACHE_BASE)
+        self.assertEqual(list(self.cache.images), ['/usr/lib/libfoo.dylib', '/usr/lib/libfoo.1.dylib'])
+        self.assertEqual(self.ld.memory.load(IMAGE_ADDR + 0x800, 4), b'\x90' * 4)
+        self.assertEqual(self.cache.vaddr_to_offset(IMAGE_ADDR + 0x800), 0x1800)
+        self.assertIsNone(self.cache.vaddr_to_offset(CACHE_BASE + 0x2000))
+
+    def test_image(self):
+        self.assertEqual(self.cache._images_by_address, {})
+        image = self.cache.get_image('/usr/lib/libfoo.dylib')
+        self.assertIs(image, self.cache.get_image('/usr/lib/libfoo.1.dylib'))
+        self.assertIsInstance(image, MachO)
+
+        self.assertEqual(image.provides, '/usr/lib/libfoo.dylib')
+        self.assertEqual(image.mapped_base, IMAGE_ADDR)
+        self.assertEqual(image.memory.load(0x800, 4), b'\x90' * 4)
+        self.assertEqual(image.segments[0].sections[0].sectname, '__text')
+
+        self.assertEqual(image.get_symbol('_foo')[0].rebased_addr, IMAGE_ADDR + 0x800)
+        self.assertEqual(image.get_symbol('_local')[0].rebased_addr, IMAGE_ADDR + 0x808)
+
+        with self.assertRaises(KeyError):
+            self.cache.get_image('/usr/lib/libbar.dylib')
+
+
+if __name__ == '__main__':
+    unittest.main()
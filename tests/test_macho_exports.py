@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+import unittest
+
+from cle.backends.macho.export_trie import ExportTrie, ExportIndex
+
+from cle import CLEInvalidBinaryError
+from macho_helpers import FakeImage
+
+
+def build_trie(exports):
+    """Builds an exports trie with one edge per character, exports maps names to (flags, uleb encoded info)"""
+    def node(prefix):
+        names = sorted(name for name in exports if name.startswith(prefix) and name != prefix)
+        labels = sorted(set(name[len(prefix)] for name in names))
+        terminal = b''
+        if prefix in exports:
+            terminal = bytes([exports[prefix][0]]) + exports[prefix][1]
+        return terminal, [(label, node(prefix + label)) for label in labels]
+
+    blob = bytearray()
+
+    def emit(n):
+        terminal, children = n
+        start = len(blob)
+        blob.extend(bytes([len(terminal)]) + terminal + bytes([len(children)]))
+        fixups = []
+        for label, _ in children:
+            blob.extend(label.encode() + b'\0')
+            fixups.append(len(blob))
+            blob.extend(b'\0\0')  # two byte uleb child offset, patched below
+        for fixup, (_, child) in zip(fixups, children):
+            offset = emit(child)
+            blob[fixup:fixup + 2] = bytes([0x80 | (offset & 0x7f), offset >> 7])
+        return start
+
+    emit(node(''))
+    return bytes(blob)
+
+
+class TestExportTrie(unittest.TestCase):
+    def setUp(self):
+        self.exports = {
+            '_main': (0, b'\x10'),
+            '_malloc': (0, b'\x20'),
+            '_mallocx': (0x10, b'\x01\x02'),
+            '_free': (0x8, b'\x01_other_free\0'),
+            '_abs': (0x2, b'\x30'),
+        }
+        self.trie = ExportTrie(build_trie(self.exports), 0x100000000)
+
+    def test_lookup(self):
+        self.assertEqual(self.trie.lookup('_main'), (0, 0x100000010))
+        self.assertEqual(self.trie['_malloc'], (0, 0x100000020))
+        self.assertEqual(self.trie[b'_mallocx'], (0x10, 1, 2))
+        self.assertEqual(self.trie.get('_free'), (0x8, 1, '_other_free'))
+        self.assertEqual(self.trie['_abs'], (0x2, 0x30))
+        self.assertIsNone(self.trie.lookup('_mal'))
+        self.assertIsNone(self.trie.lookup('_mallocxy'))
+        self.assertNotIn('_foo', self.trie)
+        self.assertIsNone(self.trie._all_exports)
+
+    def test_prefix(self):
+        self.assertEqual(sorted(name for name, _ in self.trie.iter_prefix('_mal')), ['_malloc', '_mallocx'])
+        self.assertEqual(sorted(name for name, _ in self.trie.iter_prefix('_malloc')), ['_malloc', '_mallocx'])
+        self.assertEqual(list(self.trie.iter_prefix('_x')), [])
+        self.assertIsNone(self.trie._all_exports)
+
+    def test_materialize(self):
+        self.assertEqual(sorted(self.trie), sorted(self.exports))
+        self.assertEqual(len(self.trie), 5)
+        self.assertIsNotNone(self.trie._all_exports)
+        self.assertEqual(self.trie['_main'], (0, 0x100000010))
+
+    def test_empty(self):
+        trie = ExportTrie(None, 0)
+        self.assertNotIn('_main', trie)
+        self.assertEqual(len(trie), 0)
+
+    def test_malformed(self):
+        trie = ExportTrie(b'\x00\x01_main', 0)
+        with self.assertRaises(CLEInvalidBinaryError):
+            trie.lookup('_main')
+
+    def test_loop(self):
+        # the only child of the node at 5 is the root again
+        trie = ExportTrie(b'\x00\x01_\x00\x05\x00\x01m\x00\x00', 0)
+        with self.assertRaises(CLEInvalidBinaryError):
+            trie.lookup('_m_m_main')
+        with self.assertRaises(CLEInvalidBinaryError):
+            list(trie.iter_prefix(''))
+
+    def test_empty_label(self):
+        trie = ExportTrie(b'\x00\x01\x00\x00', 0)
+        with self.assertRaises(CLEInvalidBinaryError):
+            trie.lookup('_main')
+        with self.assertRaises(CLEInvalidBinaryError):
+            len(trie)
+
+
+class TestExportIndex(unittest.TestCase):
+    def test_first_image_wins(self):
+        first = FakeImage({'_main': 0x1000, '_free': None})
+        second = FakeImage({'_main': 0x2000, '_free': 0x2010, '_malloc': 0x2020})
+        index = ExportIndex()
+        index.add([first])
+        index.add([second])
+        self.assertEqual(index.images, [first, second])
+        # nothing is looked up before it is asked for
+        self.assertEqual(first.lookups, [])
+
+        self.assertEqual(index.lookup('_main'), (first, 0x1000))
+        # the first image does not resolve it, e.g. because it is re-exported from a library that is not loaded
+        self.assertEqual(index.lookup('_free'), (second, 0x2010))
+        self.assertEqual(index.lookup('_malloc'), (second, 0x2020))
+        self.assertIsNone(index.lookup('_calloc'))
+
+        # hits and misses are remembered
+        index.lookup('_main')
+        index.lookup('_calloc')
+        self.assertEqual(first.lookups, ['_main', '_free', '_malloc', '_calloc'])
+
+        # until an image is added, which may export what was missing
+        third = FakeImage({'_calloc': 0x3000})
+        index.add([third])
+        self.assertEqual(index.lookup('_calloc'), (third, 0x3000))
+        self.assertEqual(index.lookup('_main'), (first, 0x1000))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+import io
+import os
+import struct
+import unittest
+
+from cle.backends.macho import MachO
+from cle.backends.macho.fat import probe_slices, _slices_cache
+from macho_helpers import BASE, CPU_TYPE_ARM64, CPU_TYPE_X86_64, MachOTestCase, build_macho, segment_command
+
+
+def build_slice(cputype, cpusubtype, text_size):
+    """Builds an executable with just a __TEXT segment of the given size"""
+    return bytes(build_macho([segment_command(b'__TEXT', BASE, text_size, 0, 0x1000)], cputype=cputype,
+                             cpusubtype=cpusubtype))
+
+
+def build_fat():
+    """Builds a universal binary with an x86_64 slice at 0x1000 and an arm64 slice at 0x2000"""
+    data = bytearray(0x3000)
+    struct.pack_into('>2I', data, 0, 0xcafebabe, 2)
+    struct.pack_into('>5I', data, 8, 0x1000007, 3, 0x1000, 0x1000, 12)
+    struct.pack_into('>5I', data, 28, 0x100000c, 0, 0x2000, 0x1000, 12)
+    data[0x1000:0x2000] = build_slice(CPU_TYPE_X86_64, 3, 0x1000)
+    data[0x2000:0x3000] = build_slice(CPU_TYPE_ARM64, 0, 0x2000)
+    return bytes(data)
+
+
+class TestFat(MachOTestCase):
+    def setUp(self):
+        super(TestFat, self).setUp()
+        self.path = self.write('fat', build_fat())
+
+    def tearDown(self):
+        _slices_cache.pop(self.path, None)
+        super(TestFat, self).tearDown()
+
+    def test_probe(self):
+        slices = probe_slices(self.path)
+        self.assertEqual(slices, [(0x1000007, 3, 2, 0x1000, 0x1000), (0x100000c, 0, 2, 0x2000, 0x1000)])
+        # the result is cached until the file changes
+        self.assertIs(probe_slices(self.path), slices)
+        with open(self.path, 'wb') as f:
+            f.write(build_slice(CPU_TYPE_ARM64, 0, 0x1000))
+        os.utime(self.path, ns=(0, 0))
+        self.assertEqual(probe_slices(self.path), [(0x100000c, 0, 2, 0, 0x1000)])
+
+        # streams are probed every time
+        self.assertEqual(probe_slices(io.BytesIO(build_fat())), slices)
+
+    def test_load_slice(self):
+        ld = self.load(self.path, main_opts={'target_arch': 'aarch64'})
+        macho = ld.main_object
+        self.assertIsInstance(macho, MachO)
+        self.assertEqual(macho.arch.name, 'AARCH64')
+        self.assertEqual(macho._header.offset, 0x2000)
+        self.assertEqual(macho.segments[0].memsize, 0x2000)
+
+
+if __name__ == '__main__':
+    unittest.main()
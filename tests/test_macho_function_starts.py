@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+import struct
+import unittest
+from array import array
+
+from macho_helpers import BASE, MH_PIE, MachOTestCase, build_macho, segment_command
+
+
+def build_function_starts_macho():
+    """Builds an arm64 executable with a single __TEXT segment, function starts and data in code"""
+    commands = [
+        segment_command(b'__TEXT', BASE, 0x1000, 0, 0x1000),
+        struct.pack('<4I', 0x26, 16, 0x800, 8),
+        struct.pack('<4I', 0x29, 16, 0x810, 16),
+    ]
+    data = build_macho(commands, flags=MH_PIE)
+
+    # functions at 0x400, 0x420 and 0x460
+    data[0x800:0x805] = b'\x80\x08\x20\x40\x00'
+    # the entries are deliberately out of order
+    data[0x810:0x820] = struct.pack('<IHHIHH', 0x450, 4, 1, 0x430, 8, 1)
+    return bytes(data)
+
+
+class TestFunctionStarts(MachOTestCase):
+    def setUp(self):
+        super(TestFunctionStarts, self).setUp()
+        self.macho = self.load(self.write('function_starts', build_function_starts_macho())).main_object
+
+    def test_function_starts(self):
+        self.assertEqual(self.macho.lc_function_starts, array('Q', [BASE + 0x400, BASE + 0x420, BASE + 0x460]))
+        self.assertEqual(self.macho.function_containing(BASE + 0x400), BASE + 0x400)
+        self.assertEqual(self.macho.function_containing(BASE + 0x43c), BASE + 0x420)
+        self.assertEqual(self.macho.function_containing(BASE + 0xfff), BASE + 0x460)
+        self.assertIsNone(self.macho.function_containing(BASE + 0x3ff))
+        self.assertIsNone(self.macho.function_containing(BASE + 0x1000))
+
+    def test_data_in_code(self):
+        self.assertEqual(self.macho.data_in_code_addresses, array('Q', [BASE + 0x430, BASE + 0x450]))
+        self.assertEqual(self.macho.data_in_code_lengths, array('H', [8, 4]))
+        self.assertTrue(self.macho.is_data_in_code(BASE + 0x430))
+        self.assertTrue(self.macho.is_data_in_code(BASE + 0x437))
+        self.assertTrue(self.macho.is_data_in_code(BASE + 0x453))
+        self.assertFalse(self.macho.is_data_in_code(BASE + 0x438))
+        self.assertFalse(self.macho.is_data_in_code(BASE + 0x42f))
+        self.assertFalse(self.macho.is_data_in_code(BASE + 0x454))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+import struct
+import unittest
+
+from cle.backends.macho.rebase import decode_rebase_blob, apply_rebase_table
+
+from cle import CLEInvalidBinaryError
+from macho_helpers import FakeMachO, FakeSegment
+
+
+class TestRebase(unittest.TestCase):
+    def setUp(self):
+        self.segments = [FakeSegment(0x1000, 0x1000), FakeSegment(0x2000, 0x1000)]
+
+    def test_decode(self):
+        blob = (b"\x11"  # SET_TYPE_IMM pointer
+                b"\x21\x10"  # SET_SEGMENT_AND_OFFSET_ULEB 1, 0x10
+                b"\x52"  # DO_REBASE_IMM_TIMES 2
+                b"\x30\x08"  # ADD_ADDR_ULEB 8
+                b"\x61\x02"  # DO_REBASE_ULEB_TIMES 2
+                b"\x41"  # ADD_ADDR_IMM_SCALED 1
+                b"\x70\x10"  # DO_REBASE_ADD_ADDR_ULEB 0x10
+                b"\x12"  # SET_TYPE_IMM absolute32
+                b"\x80\x02\x08"  # DO_REBASE_ULEB_TIMES_SKIPPING_ULEB 2, 8
+                b"\x00"  # DONE
+                b"\x51")  # never reached
+        table = decode_rebase_blob(blob, self.segments, True)
+        self.assertEqual(list(table), [
+            (0x2010, 1), (0x2018, 1),
+            (0x2028, 1), (0x2030, 1),
+            (0x2040, 1),
+            (0x2058, 2), (0x2068, 2),
+        ])
+
+    def test_invalid(self):
+        with self.assertRaises(CLEInvalidBinaryError):
+            decode_rebase_blob(b"\xf0", self.segments, True)
+
+    def test_apply(self):
+        binary = FakeMachO(linked_base=0x1000, size=0x2000)
+        binary.memory.store(0x1010, struct.pack('<Q', 0x1234))
+        binary.memory.store(0x1058, struct.pack('<I', 0x1000))
+        table = decode_rebase_blob(b"\x11\x21\x10\x51\x12\x21\x58\x51\x00", self.segments, True)
+        apply_rebase_table(binary, table, 0x10000)
+        self.assertEqual(binary.memory.unpack_word(0x1010, 8), 0x11234)
+        self.assertEqual(binary.memory.unpack_word(0x1058, 4), 0x11000)
+
+        table = decode_rebase_blob(b"\x11\x21\xf0\x3f\x51\x00", self.segments, True)
+        with self.assertRaises(CLEInvalidBinaryError):
+            apply_rebase_table(binary, table, 0x10000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+import struct
+import unittest
+
+import cle
+from macho_helpers import BASE, MH_PIE, MachOTestCase, build_macho, section, segment_command
+
+
+def build_symtab_macho():
+    """
+    Builds an arm64 executable with a local, an exported and an undefined symbol, listed by LC_DYSYMTAB, and a stub
+    and a pointer for the undefined one, which the pointer is bound to
+    """
+    commands = [
+        segment_command(b'__TEXT', BASE, 0x1000, 0, 0x1000, nsects=2) +
+        section(b'__stubs', b'__TEXT', BASE + 0x600, 0xc, 0x600, align=2, flags=0x80000408, reserved2=12) +
+        section(b'__got', b'__TEXT', BASE + 0x700, 0x10, 0x700, align=3, flags=0x6, reserved1=1),
+        struct.pack('<6I', 0x2, 24, 0x800, 3, 0x900, 0x20),
+        # the locals come first in the file, the externally defined symbols second and the undefined ones last
+        struct.pack('<20I', 0xb, 80, 0, 1, 1, 1, 2, 1, 0, 0, 0, 0, 0, 0, 0xa00, 3, 0, 0, 0, 0),
+        struct.pack('<12I', 0x80000022, 48, 0, 0, 0xb00, 0x10, 0, 0, 0, 0, 0, 0),
+    ]
+    data = build_macho(commands, flags=MH_PIE)
+
+    struct.pack_into('<IBBHQ', data, 0x800, 1, 0xe, 0, 0, BASE + 0x400)
+    struct.pack_into('<IBBHQ', data, 0x810, 8, 0xf, 0, 0, BASE + 0x420)
+    struct.pack_into('<IBBHQ', data, 0x820, 14, 0x1, 0, 1 << 8, 0)
+    data[0x900:0x914] = b'\0_local\0_main\0_puts\0'
+    # the second pointer is INDIRECT_SYMBOL_LOCAL
+    struct.pack_into('<3I', data, 0xa00, 2, 2, 0x80000000)
+    # bind _puts from ordinal 1 to the first pointer
+    data[0xb00:0xb0e] = b'\x11\x40_puts\x00\x51\x70\x80\x0e\x90\x00'
+    data[0x700:0x708] = b'\xff' * 8
+    return bytes(data)
+
+
+class TestSymbolTable(MachOTestCase):
+    def setUp(self):
+        super(TestSymbolTable, self).setUp()
+        self.ld = self.load(self.write('symtab', build_symtab_macho()))
+        self.macho = self.ld.main_object
+
+    def test_symbols(self):
+        names = [sym.name for sym in self.macho.symbols]
+        self.assertEqual(sorted(names), ['_local', '_main', '_puts'])
+
+        local = self.macho.get_symbol('_local')[0]
+        self.assertEqual(local.relative_addr, 0x400)
+        self.assertFalse(local.is_external)
+
+        main = self.macho.get_symbol('_main')[0]
+        self.assertEqual(main.relative_addr, 0x420)
+        self.assertTrue(main.is_external)
+
+        puts = self.macho.get_symbol('_puts')[0]
+        self.assertEqual(puts.library_ordinal, 1)
+        self.assertEqual(puts.n_desc, 1 << 8)
+        self.assertEqual(self.macho._symbols_by_name_and_ordinal[('_puts', 1)], [puts])
+
+    def test_indirect_symbols(self):
+        puts = self.macho.get_symbol('_puts')[0]
+        self.assertEqual(self.macho.indirect_symbols, {BASE + 0x600: puts, BASE + 0x700: puts})
+        self.assertEqual(puts.symbol_stubs, [BASE + 0x600])
+        self.assertIs(self.macho.get_symbol_by_address_fuzzy(BASE + 0x700), puts)
+
+    def test_binding(self):
+        # _puts comes from a library which is not loaded
+        puts = self.macho.get_symbol('_puts')[0]
+        self.assertEqual(puts.bind_xrefs, [BASE + 0x700])
+        self.assertEqual(self.macho.memory.unpack_word(0x700), 0)
+
+        # binding is part of loading, not of relocating
+        ld = self.load(self.ld.main_object.binary, perform_relocations=False)
+        self.assertEqual(ld.main_object.get_symbol('_puts')[0].bind_xrefs, [BASE + 0x700])
+        self.assertEqual(ld.memory.unpack_word(BASE + 0x700), 0)
+
+        # as is without a loader
+        macho = cle.MachO(self.ld.main_object.binary, is_main_bin=True)
+        self.assertTrue(macho.binding_done)
+        self.assertEqual(macho.get_symbol('_puts')[0].bind_xrefs, [BASE + 0x700])
+
+    def test_fuzzy(self):
+        main = self.macho.get_symbol('_main')[0]
+        puts = self.macho.get_symbol('_puts')[0]
+        self.assertIs(self.macho.get_symbol_by_address_fuzzy(0x420), main)
+        self.assertIsNone(self.macho.get_symbol_by_address_fuzzy(BASE + 0x800))
+        self.macho._add_bind_xrefs(puts, [BASE + 0x800])
+        self.assertEqual(puts.bind_xrefs, [BASE + 0x700, BASE + 0x800])
+        self.assertIs(self.macho.get_symbol_by_address_fuzzy(BASE + 0x800), puts)
+
+    def test_sorted(self):
+        addrs = [sym.relative_addr for sym in self.macho.symbols]
+        self.assertEqual(addrs, sorted(addrs))
+
+
+if __name__ == '__main__':
+    unittest.main()
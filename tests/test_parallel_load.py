@@ -0,0 +1,73 @@
+import io
+import mmap
+import os
+
+import nose
+
+import cle
+from cle.loader import _ObjectPickler, _ObjectUnpickler
+
+TEST_BASE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                         os.path.join('..', '..', 'binaries'))
+
+
+def _loaded_state(ld):
+    return ([(obj.binary, obj.mapped_base) for obj in ld.all_objects],
+            [(sym.name, sym.rebased_addr) for sym in ld.symbols])
+
+
+def test_parallel_load():
+    for arch in ('x86_64', 'i386', 'armel'):
+        binary = os.path.join(TEST_BASE, 'tests', arch, 'fauxware')
+        ld_path = os.path.join(TEST_BASE, 'tests', arch)
+        serial = cle.Loader(binary, ld_path=[ld_path], use_system_libs=False)
+        parallel = cle.Loader(binary, ld_path=[ld_path], use_system_libs=False, parallel_load=4)
+        nose.tools.assert_equal(_loaded_state(serial), _loaded_state(parallel))
+
+
+def test_parallel_load_missing_libs():
+    binary = os.path.join(TEST_BASE, 'tests', 'x86_64', 'fauxware')
+    ld = cle.Loader(binary, ld_path=[], use_system_libs=False, parallel_load=4)
+    nose.tools.assert_equal(ld.requested_names, {'libc.so.6'})
+    nose.tools.assert_equal(len(ld.all_elf_objects), 1)
+    nose.tools.assert_raises(cle.CLEFileNotFoundError, cle.Loader, binary, ld_path=[], use_system_libs=False,
+                             except_missing_libs=True, parallel_load=4)
+
+
+def test_parallel_load_lib_opts():
+    # the options of a library are not used up by loading it
+    arch = 'x86_64'
+    binary = os.path.join(TEST_BASE, 'tests', arch, 'fauxware')
+    lib_opts = {'libc.so.6': {'backend': 'elf'}}
+    ld = cle.Loader(binary, ld_path=[os.path.join(TEST_BASE, 'tests', arch)], use_system_libs=False,
+                    lib_opts=lib_opts, parallel_load=4)
+    nose.tools.assert_is(ld.shared_objects['libc.so.6'].loader, ld)
+    nose.tools.assert_equal(lib_opts, {'libc.so.6': {'backend': 'elf'}})
+
+
+def test_parallel_load_remaps_segments():
+    # the segments of an object sent back from a worker are mapped from its file again, with the changes made to them
+    binary = os.path.join(TEST_BASE, 'tests', 'x86_64', 'libc.so.6')
+    ld = cle.Loader(binary, auto_load_libs=False)
+    obj = ld._load_object_isolated(binary)
+    obj.close()
+    start, _ = next(obj.memory.backers())
+    obj.memory.store(start, b'\x01\x02\x03\x04')
+
+    stream = io.BytesIO()
+    _ObjectPickler(stream, ld).dump(obj)
+    nose.tools.assert_less(len(stream.getvalue()), sum(len(backer) for _, backer in obj.memory.backers()))
+    copy = _ObjectUnpickler(io.BytesIO(stream.getvalue()), ld).load()
+
+    for (addr, backer), (copy_addr, copy_backer) in zip(obj.memory.backers(), copy.memory.backers()):
+        nose.tools.assert_equal(addr, copy_addr)
+        nose.tools.assert_is_instance(copy_backer, (mmap.mmap, memoryview))
+        nose.tools.assert_equal(bytes(backer), bytes(copy_backer))
+    nose.tools.assert_equal(copy.memory.load(start, 4), b'\x01\x02\x03\x04')
+
+
+if __name__ == '__main__':
+    test_parallel_load()
+    test_parallel_load_missing_libs()
+    test_parallel_load_lib_opts()
+    test_parallel_load_remaps_segments()
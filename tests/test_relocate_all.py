@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+import unittest
+
+import archinfo
+
+import cle
+from cle.backends.relocation import Relocation, relocate_all, is_batchable
+from cle.backends.elf.relocation import get_relocation
+
+
+class FakeOwner(object):
+    def __init__(self):
+        self.arch = archinfo.ArchAMD64()
+        self.imports = {}
+        self.memory = cle.Clemory(self.arch, root=True)
+        self.memory.add_backer(0, b'\0' * 0x40)
+
+
+class WordReloc(Relocation):
+    batchable = True
+
+    def __init__(self, owner, relative_addr, word):
+        super(WordReloc, self).__init__(owner, None, relative_addr)
+        self.word = word
+
+    def resolve_symbol(self, solist, bypass_compatibility=False, thumb=False):
+        self.resolve(None)
+        return True
+
+    @property
+    def value(self):
+        return self.word
+
+
+class ReadingReloc(WordReloc):
+    """Copies the word at another address, so it has to see what was written before it"""
+    batchable = False
+
+    @property
+    def value(self):
+        return self.owner.memory.unpack_word(self.word) + 1
+
+
+class TestRelocateAll(unittest.TestCase):
+    def test_batchable(self):
+        self.assertTrue(is_batchable(get_relocation('AMD64', 8)))  # R_X86_64_RELATIVE
+        self.assertTrue(is_batchable(get_relocation('AMD64', 1)))  # R_X86_64_64
+        self.assertFalse(is_batchable(get_relocation('AMD64', 10)))  # R_X86_64_32 checks for truncation
+        self.assertFalse(is_batchable(get_relocation('AMD64', 5)))  # R_X86_64_COPY copies memory
+        self.assertFalse(is_batchable(ReadingReloc))
+
+    def test_relocate_all(self):
+        owner = FakeOwner()
+        done = WordReloc(owner, 0x18, 9)
+        done.resolve(None)
+        relocs = [WordReloc(owner, 0x8, 1), WordReloc(owner, 0x0, 2), ReadingReloc(owner, 0x10, 0x8), done,
+                  WordReloc(owner, 0x8, 3)]
+        relocate_all(relocs, [])
+        self.assertEqual(owner.memory.unpack(0, '<4Q'), (2, 3, 2, 0))
+        self.assertTrue(all(reloc.resolved for reloc in relocs))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+import pickle
+import unittest
+
+import archinfo
+
+import cle
+from cle.backends.relocation import RelocationTable, relocate_all
+from cle.backends.elf.relocation import get_relocation
+from cle.backends.elf.symbol import ELFSymbol
+
+
+class FakeOwner(object):
+    def __init__(self):
+        self.arch = archinfo.ArchAMD64()
+        self.os = 'UNIX - System V'
+        self.is_relocatable = False
+        self.provides = 'fake'
+        self.imports = {}
+        self.resolved_imports = []
+        self.mapped_base = 0x400000
+        self.linked_base = 0
+        self.memory = cle.Clemory(self.arch, root=True)
+        self.memory.add_backer(0, b'\0' * 0x40)
+
+
+class TestRelocationTable(unittest.TestCase):
+    def setUp(self):
+        self.owner = FakeOwner()
+        self.null = ELFSymbol.from_fields(self.owner, '', 0, 0, 'STB_LOCAL', 0, 'STV_DEFAULT', 'SHN_UNDEF')
+        self.relative = get_relocation('AMD64', 8)  # R_X86_64_RELATIVE
+        self.absolute = get_relocation('AMD64', 1)  # R_X86_64_64
+        self.table = RelocationTable(self.owner)
+        self.table.append_row(self.relative, self.null, 0x0, 0x10, True)
+        self.table.append_row(self.relative, self.null, 0x8, 0x20, True)
+        self.reloc = self.absolute(self.owner, self.null, 0x10, 0x30)
+        self.table.append(self.reloc)
+        self.table.append_row(self.relative, self.null, 0x18, 0x40, True)
+
+    def test_rows(self):
+        table = self.table
+        self.assertEqual(len(table), 4)
+        self.assertEqual(list(table.objects()), [self.reloc])
+        self.assertEqual(table.row(1), (self.null, 0x8, 0x20))
+
+        # a row becomes a new Relocation whenever it is looked up, which is not kept
+        reloc = table[1]
+        self.assertIsInstance(reloc, self.relative)
+        self.assertEqual((reloc.relative_addr, reloc.addend, reloc.is_rela), (0x8, 0x20, True))
+        self.assertIsNot(table[1], reloc)
+        self.assertIs(table[-2], self.reloc)
+        self.assertEqual([r.relative_addr for r in table[1:3]], [0x8, 0x10])
+        self.assertEqual([r.relative_addr for r in table], [0x0, 0x8, 0x10, 0x18])
+        self.assertEqual(list(table.objects()), [self.reloc])
+
+        # rows are found by class and address
+        self.assertIn(reloc, table)
+        self.assertIn(self.reloc, table)
+        self.assertNotIn(self.absolute(self.owner, self.null, 0x8, 0x20), table)
+        self.assertNotIn(self.relative(self.owner, self.null, 0x20, 0x20), table)
+        self.assertRaises(IndexError, lambda: table[4])
+
+    def test_runs(self):
+        self.table[1]  # pylint: disable=pointless-statement
+        runs = [(reloc, cls, run) for reloc, cls, run in self.table.runs()]
+        self.assertEqual(runs, [(None, self.relative, [0, 1]), (self.reloc, None, None), (None, self.relative, [3])])
+        self.table.set_resolved(0)
+        self.assertEqual(next(self.table.runs())[2], [1])
+        # a resolved row is looked up as a resolved Relocation
+        self.assertTrue(self.table[0].resolved)
+        self.assertFalse(self.table[1].resolved)
+
+    def test_relocate_all(self):
+        relocate_all(self.table, [self.owner])
+        self.assertEqual(self.owner.memory.unpack(0, '<4Q'), (0x400010, 0x400020, 0x400030, 0x400040))
+        self.assertTrue(all(reloc.resolved for reloc in self.table))
+        # resolving a row is seen by its symbol as if it was a Relocation
+        self.assertTrue(self.null.resolved)
+        self.assertEqual(self.owner.resolved_imports.count(self.null), 4)
+
+        # nothing is applied twice
+        self.owner.memory.pack_word(0, 0)
+        relocate_all(self.table, [self.owner])
+        self.assertEqual(self.owner.memory.unpack_word(0), 0)
+
+    def test_pickle(self):
+        relocate_all(self.table, [self.owner])
+        table = pickle.loads(pickle.dumps(self.table, -1))
+        self.assertEqual(len(table), 4)
+        self.assertEqual([reloc.relative_addr for reloc in table], [0x0, 0x8, 0x10, 0x18])
+        self.assertTrue(all(reloc.resolved for reloc in table))
+        symbol = table.row(0)[0]
+        table.append_row(self.relative, symbol, 0x20)
+        self.assertEqual(len(table._symbol_list), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
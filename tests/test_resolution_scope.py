@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+import unittest
+
+from cle.resolution_scope import ResolutionScope, ExportLookups, find_export
+
+
+class FakeSymbol(object):
+    def __init__(self, name, is_export=True, is_import=False, is_weak=False):
+        self.name = name
+        self.is_export = is_export
+        self.is_import = is_import
+        self.is_weak = is_weak
+
+
+class FakeObject(object):
+    def __init__(self, *symbols):
+        self.symbols = dict((symbol.name, symbol) for symbol in symbols)
+        self.asked = []
+
+    def get_symbol(self, name):
+        self.asked.append(name)
+        return self.symbols.get(name)
+
+
+class TestResolutionScope(unittest.TestCase):
+    def setUp(self):
+        self.weak = FakeSymbol('foo', is_weak=True)
+        self.strong = FakeSymbol('foo')
+        self.imp = FakeSymbol('foo', is_export=False, is_import=True)
+        self.local = FakeSymbol('bar', is_export=False)
+        self.main = FakeObject(self.imp)
+        self.lib_a = FakeObject(self.weak)
+        self.lib_b = FakeObject(self.strong, FakeSymbol('bar'))
+        self.owner = FakeObject(self.local)
+
+    def test_find_export(self):
+        objects = [self.main, self.lib_a, self.lib_b, self.owner]
+        self.assertEqual(find_export(objects, 'foo', self.owner), (self.strong, self.weak))
+        self.assertEqual(find_export(objects[:2], 'foo', self.owner), (None, self.weak))
+        self.assertEqual(find_export(objects, 'baz', self.owner), (None, None))
+        # a symbol which is not exported only counts in its own object
+        self.assertIs(find_export([self.owner, self.lib_b], 'bar', self.owner)[0], self.local)
+        self.assertIsNot(find_export([self.owner, self.lib_b], 'bar', self.lib_b)[0], self.local)
+
+    def test_scope(self):
+        exports = ExportLookups()
+        scope = ResolutionScope([self.main, self.lib_a, self.lib_b, self.owner], self.owner, exports)
+        self.assertEqual(list(scope), [self.main, self.lib_a, self.lib_b, self.owner])
+        self.assertEqual(scope.lookup('foo', self.owner), (self.strong, self.weak))
+        self.assertEqual(scope.lookup('foo', self.owner), (self.strong, self.weak))
+        self.assertEqual(self.lib_b.asked, ['foo'])
+
+        # another scope shares what the objects answered
+        other = ResolutionScope([self.lib_a, self.lib_b], self.lib_a, exports)
+        self.assertEqual(other.lookup('foo', self.lib_a), (self.strong, self.weak))
+        self.assertEqual(self.lib_a.asked, ['foo'])
+        self.assertEqual(self.lib_b.asked, ['foo'])
+
+        # for other owners, the scope is searched again
+        scope = ResolutionScope([self.owner, self.lib_b], self.owner, exports)
+        self.assertIs(scope.lookup('bar', self.owner)[0], self.local)
+        self.assertIsNot(scope.lookup('bar', self.lib_b)[0], self.local)
+        self.assertIs(scope.lookup('bar', self.owner)[0], self.local)
+
+
+if __name__ == '__main__':
+    unittest.main()
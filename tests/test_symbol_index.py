@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+import os
+import shutil
+import tempfile
+import unittest
+
+import cle
+from cle.backends import _SymbolList
+from cle.symbol_index import SymbolIndex
+
+
+class FakeSymbol(object):
+    def __init__(self, owner, name, relative_addr, is_import=False):
+        self.owner = owner
+        self.name = name
+        self.relative_addr = relative_addr
+        self.is_import = is_import
+
+    @property
+    def rebased_addr(self):
+        return self.owner.mapped_base + self.relative_addr
+
+
+class FakeObject(object):
+    def __init__(self, mapped_base, symbols):
+        self.mapped_base = self.min_addr = mapped_base
+        self.symbols = _SymbolList(key=lambda sym: sym.relative_addr)
+        self.symbols.update(FakeSymbol(self, name, addr, is_import) for name, addr, is_import in symbols)
+
+
+class TestSymbolIndex(unittest.TestCase):
+    def test_index(self):
+        a = FakeObject(0x1000, [('a1', 0x10, False), ('a2', 0x20, False), ('a3', 0x20, False), ('imp', 0x30, True)])
+        b = FakeObject(0x1000, [('b1', 0x30, False), ('b2', 0x10, True)])
+
+        index = SymbolIndex()
+        index.object_mapped(a)
+        index.update([a])
+        self.assertEqual(index.find(0x1010).name, 'a1')
+        # the last one of an object wins
+        self.assertEqual(index.find(0x1020).name, 'a3')
+        self.assertIsNone(index.find(0x1030))
+        self.assertIsNone(index.find(0x1015))
+
+        # merged in without a rebuild
+        b.min_addr = 0x1001
+        index.object_mapped(b)
+        index.update([a, b])
+        self.assertEqual(index.find(0x1030).name, 'b1')
+        # the object with the lower address wins, imports never do
+        self.assertEqual(index.find(0x1010).name, 'a1')
+        self.assertEqual([entry[-1].name for entry in index._entries], ['a1', 'b2', 'a2', 'a3', 'imp', 'b1'])
+
+        # changes to symbol lists are picked up, only the object which changed is indexed again
+        b_entries = index._indexed[id(b)][3]
+        a.symbols.add(FakeSymbol(a, 'a4', 0x40))
+        index.update([a, b])
+        self.assertEqual(index.find(0x1040).name, 'a4')
+        self.assertIs(index._indexed[id(b)][3], b_entries)
+        self.assertEqual(index.find(0x1010).name, 'a1')
+        a.symbols.remove(index.find(0x1040))
+        index.update([a, b])
+        self.assertIsNone(index.find(0x1040))
+
+        # symbols of objects which went away are dropped
+        index.update([b])
+        self.assertIsNone(index.find(0x1020))
+        self.assertEqual(index.find(0x1030).name, 'b1')
+
+        # as are the old addresses of an object mapped again
+        b.mapped_base = 0x2000
+        index.object_mapped(b)
+        index.update([b])
+        self.assertIsNone(index.find(0x1030))
+        self.assertEqual(index.find(0x2030).name, 'b1')
+
+
+class TestLoaderSymbols(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'main')
+        with open(self.path, 'wb') as f:
+            f.write(b'\0' * 0x100)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_find_symbol(self):
+        ld = cle.Loader(self.path, auto_load_libs=False, main_opts={'backend': 'blob', 'arch': 'x86_64'})
+        foo = ld.extern_object.make_extern('foo')
+        self.assertIs(ld.find_symbol(foo.rebased_addr), foo)
+        bar = ld.extern_object.make_extern('bar')
+        self.assertIs(ld.find_symbol(bar.rebased_addr), bar)
+        self.assertIs(ld.find_symbol(foo.rebased_addr), foo)
+        self.assertIsNone(ld.find_symbol(bar.rebased_addr + 1))
+        self.assertIs(ld.find_symbol(bar.rebased_addr + 1, fuzzy=True), bar)
+
+        addrs = [sym.rebased_addr for sym in ld.symbols]
+        self.assertEqual(addrs, sorted(addrs))
+        self.assertEqual(set(ld.symbols), {foo, bar})
+        ld.close()
+
+
+if __name__ == '__main__':
+    unittest.main()